@@ -8,6 +8,7 @@ from typing import List
 import jwt
 import requests
 from datetime import datetime, timedelta
+from .gateway_auth import get_gateway_token_cache
 from .models import GatewayIOT, Organization, OrganizationMembership
 from .schemas import AddOrganizationMemberSchema, CreateGatewayIOTSchema, CreateOrganizationSchema, CreateUserSchema, GatewayIOTSchema, OrganizationSchema
 from rest_framework_simplejwt.tokens import RefreshToken
@@ -189,7 +190,7 @@ def list_gateways(request):
     return gateways
 
 
-def get_gateway_auth_headers(request, gateway_id: int):
+def get_gateway_auth_headers(request, gateway_id: int, force_refresh: bool = False):
     gateway_qs = GatewayIOT.objects.all()
     user = getattr(request, "user", None)
     if request is not None and not getattr(user, "is_superuser", False):
@@ -198,7 +199,11 @@ def get_gateway_auth_headers(request, gateway_id: int):
         else:
             gateway_qs = gateway_qs.filter(organization__memberships__user=user).distinct()
     gateway = get_object_or_404(gateway_qs, id=gateway_id)
+    return gateway_auth_headers(gateway, force_refresh=force_refresh)
 
+
+def gateway_auth_headers(gateway, force_refresh: bool = False):
+    """Auth headers for an already loaded GatewayIOT (no permission check, no query)."""
     if gateway.auth_method == GatewayIOT.AUTH_METHOD_API_KEY:
         if not gateway.api_key:
             return {"error": "Gateway API key is not configured."}, 400
@@ -213,23 +218,10 @@ def get_gateway_auth_headers(request, gateway_id: int):
     if not gateway.username or not gateway.password:
         return {"error": "Gateway username/password are not configured."}, 400
 
-    url = f"{gateway.url}/api/auth/login"
-    payload = {
-        "username": gateway.username,
-        "password": gateway.password
-    }
-    headers = {
-        "Content-Type": "application/json"
-    }
-    response = requests.post(url, headers=headers, data=json.dumps(payload))
-    if response.status_code != 200:
-        return {
-            "error": f"Error obtaining JWT token: {response.status_code}, {response.text}"
-        }, 400
-
-    token = response.json().get("token")
+    # JWTs are shared per gateway and refreshed shortly before their `exp`
+    token, error = get_gateway_token_cache().get_token(gateway, force_refresh=force_refresh)
     if not token:
-        return {"error": "ThingsBoard login response has no token."}, 400
+        return {"error": error}, 400
 
     return {
         "headers": {
@@ -240,6 +232,24 @@ def get_gateway_auth_headers(request, gateway_id: int):
         "token_type": "bearer",
     }, 200
 
+
+def send_with_gateway_auth(request, gateway_id: int, send):
+    """Call `send(headers)` with the gateway auth headers.
+
+    When the gateway rejects a cached JWT with 401 the token is refreshed once
+    and the request is retried. Returns `(response, auth_response, status_code)`;
+    `response` is None when no auth headers could be obtained.
+    """
+    auth_response, status_code = get_gateway_auth_headers(request, gateway_id)
+    if status_code != 200:
+        return None, auth_response, status_code
+    response = send(auth_response["headers"])
+    if response is not None and response.status_code == 401 and auth_response.get("token_type") == "bearer":
+        auth_response, status_code = get_gateway_auth_headers(request, gateway_id, force_refresh=True)
+        if status_code == 200:
+            response = send(auth_response["headers"])
+    return response, auth_response, status_code
+
 @router.get("/gatewayiot/{gateway_id}/jwt/", response={200: dict, 400: dict}, tags=['Core'])
 def get_jwt_token_gateway(request, gateway_id: int):
     auth_response, status_code = get_gateway_auth_headers(request, gateway_id)
@@ -264,11 +274,12 @@ def check_gateway_access(request, gateway_id: int):
         else:
             queryset = queryset.filter(organization__memberships__user=user).distinct()
     gateway = get_object_or_404(queryset, id=gateway_id)
-    auth_response, status_code = get_gateway_auth_headers(request, gateway_id)
-    if status_code != 200:
+    response, auth_response, status_code = send_with_gateway_auth(
+        request, gateway_id, lambda headers: requests.get(f"{gateway.url}/api/auth/user", headers=headers)
+    )
+    if response is None:
         return auth_response, status_code
 
-    response = requests.get(f"{gateway.url}/api/auth/user", headers=auth_response["headers"])
     if response.status_code == 200:
         return {
             "ok": True,
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from django.conf import settings
+        from core.structured_logging import configure_hotpath_logging
+        configure_hotpath_logging(
+            level=getattr(settings, 'HOTPATH_LOG_LEVEL', 'INFO'),
+            fmt=getattr(settings, 'HOTPATH_LOG_FORMAT', 'text'),
+            timing=getattr(settings, 'HOTPATH_LOG_TIMING', False),
+        )
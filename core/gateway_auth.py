@@ -0,0 +1,170 @@
+import json
+import logging
+import threading
+import time
+
+import jwt
+import requests
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _token_expiry(token):
+    """Return the JWT `exp` claim (epoch seconds) without verifying the signature."""
+    try:
+        claims = jwt.decode(token, options={"verify_signature": False, "verify_exp": False})
+    except Exception:
+        return None
+    exp = claims.get("exp")
+    try:
+        return float(exp) if exp is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class GatewayTokenCache:
+    """Process-wide cache of ThingsBoard JWTs, one entry per gateway.
+
+    Tokens are reused until `refresh_margin` seconds before their `exp` claim
+    (or `default_ttl` when the token carries no expiry). Logins are serialized
+    per gateway so concurrent callers wait for a single refresh instead of
+    stampeding the gateway's /api/auth/login.
+    """
+
+    def __init__(self, refresh_margin=60.0, default_ttl=900.0, login_timeout=5.0):
+        self.refresh_margin = float(refresh_margin)
+        self.default_ttl = float(default_ttl)
+        self.login_timeout = float(login_timeout)
+        self._entries = {}  # gateway_id -> {'token', 'expires_at', 'refresh_at', 'fingerprint'}
+        self._gateway_locks = {}
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "refresh_failures": 0,
+            "invalidations": 0,
+            "forced_refreshes": 0,
+        }
+
+    @staticmethod
+    def _fingerprint(gateway):
+        # A credential or URL change on the gateway must not reuse the old token
+        return (gateway.url, gateway.username, gateway.password)
+
+    def _incr(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _gateway_lock(self, gateway_id):
+        with self._lock:
+            lock = self._gateway_locks.get(gateway_id)
+            if lock is None:
+                lock = self._gateway_locks[gateway_id] = threading.Lock()
+            return lock
+
+    def _valid_entry(self, gateway):
+        entry = self._entries.get(gateway.id)
+        if not entry or entry["fingerprint"] != self._fingerprint(gateway):
+            return None
+        if time.time() >= entry["refresh_at"]:
+            return None
+        return entry
+
+    def get_token(self, gateway, force_refresh=False):
+        """Return `(token, error)` for a username/password gateway.
+
+        `force_refresh` discards the currently cached token (use it after the
+        gateway answered 401 with that token).
+        """
+        current = self._entries.get(gateway.id)
+        rejected = current["token"] if (force_refresh and current) else None
+        if force_refresh:
+            self._incr("forced_refreshes")
+        else:
+            entry = self._valid_entry(gateway)
+            if entry:
+                self._incr("hits")
+                return entry["token"], None
+
+        with self._gateway_lock(gateway.id):
+            # Another caller may have refreshed while we waited for the lock
+            entry = self._valid_entry(gateway)
+            if entry and entry["token"] != rejected:
+                self._incr("hits")
+                return entry["token"], None
+            self._incr("misses")
+            return self._login(gateway)
+
+    def _login(self, gateway):
+        url = f"{gateway.url}/api/auth/login"
+        payload = {"username": gateway.username, "password": gateway.password}
+        try:
+            response = requests.post(
+                url,
+                headers={"Content-Type": "application/json"},
+                data=json.dumps(payload),
+                timeout=self.login_timeout,
+            )
+        except Exception as e:
+            self._incr("refresh_failures")
+            return None, f"Error obtaining JWT token: {e}"
+        if response.status_code != 200:
+            self._incr("refresh_failures")
+            return None, f"Error obtaining JWT token: {response.status_code}, {response.text}"
+        try:
+            token = response.json().get("token")
+        except Exception:
+            token = None
+        if not token:
+            self._incr("refresh_failures")
+            return None, "ThingsBoard login response has no token."
+
+        now = time.time()
+        expires_at = _token_expiry(token) or (now + self.default_ttl)
+        # Refresh `refresh_margin` seconds early, but never before half of the token lifetime
+        margin = min(self.refresh_margin, max(0.0, expires_at - now) / 2)
+        self._entries[gateway.id] = {
+            "token": token,
+            "expires_at": expires_at,
+            "refresh_at": expires_at - margin,
+            "fingerprint": self._fingerprint(gateway),
+        }
+        self._incr("refreshes")
+        logger.info(f"Refreshed JWT for gateway {gateway.id}; expires in {expires_at - now:.0f}s")
+        return token, None
+
+    def invalidate(self, gateway_id):
+        """Drop the cached token so the next lookup logs in again."""
+        if self._entries.pop(gateway_id, None) is not None:
+            self._incr("invalidations")
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._counters)
+        lookups = data["hits"] + data["misses"]
+        data["hit_rate"] = round(data["hits"] / lookups, 4) if lookups else None
+        now = time.time()
+        data["gateways"] = {
+            str(gateway_id): {"expires_in": round(entry["expires_at"] - now, 1)}
+            for gateway_id, entry in list(self._entries.items())
+        }
+        return data
+
+
+_token_cache = None
+_token_cache_lock = threading.Lock()
+
+
+def get_gateway_token_cache():
+    global _token_cache
+    if _token_cache is None:
+        with _token_cache_lock:
+            if _token_cache is None:
+                _token_cache = GatewayTokenCache(
+                    refresh_margin=getattr(settings, "GATEWAY_TOKEN_REFRESH_MARGIN", 60),
+                    default_ttl=getattr(settings, "GATEWAY_TOKEN_DEFAULT_TTL", 900),
+                    login_timeout=getattr(settings, "GATEWAY_LOGIN_TIMEOUT", 5),
+                )
+    return _token_cache
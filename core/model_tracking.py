@@ -0,0 +1,71 @@
+# --- Change tracking for models saved on the telemetry/command hot path ---
+import copy
+
+
+class DirtyFieldsMixin:
+    """Remembers the field values an instance was loaded with.
+
+    `loaded_value(name)` gives the value as read from the database without a
+    query, and `save()` on a loaded instance only writes the fields that
+    changed (no statement at all when nothing did). Callers that pass
+    `update_fields` themselves, force an insert or create new rows get the
+    regular Django behaviour.
+    """
+
+    _loaded_values = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_loaded_values()
+        return instance
+
+    def _snapshot_loaded_values(self, fields=None):
+        data = self.__dict__
+        snapshot = self._loaded_values if fields is not None and self._loaded_values is not None else {}
+        for field in self._meta.concrete_fields:
+            if fields is not None and field.name not in fields and field.attname not in fields:
+                continue
+            if field.attname in data:
+                value = data[field.attname]
+                # JSON/list values can be changed in place; keep an independent copy
+                snapshot[field.attname] = copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+        self._loaded_values = snapshot
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        # The refreshed values are the new "loaded" ones (also for deferred fields loaded on access)
+        self._snapshot_loaded_values(fields)
+
+    def loaded_value(self, name, default=None):
+        """Value of field `name` when the instance was loaded (or last saved)."""
+        if self._loaded_values is None:
+            return default
+        return self._loaded_values.get(self._meta.get_field(name).attname, default)
+
+    def get_dirty_fields(self):
+        """Names of the concrete fields whose value differs from the loaded one."""
+        if self._loaded_values is None:
+            return [f.name for f in self._meta.concrete_fields if not f.primary_key]
+        data = self.__dict__
+        dirty = []
+        for field in self._meta.concrete_fields:
+            if field.primary_key or field.attname not in data:
+                continue  # deferred and never touched
+            if field.attname not in self._loaded_values or data[field.attname] != self._loaded_values[field.attname]:
+                dirty.append(field.name)
+        return dirty
+
+    def save(self, *args, **kwargs):
+        if (
+            not args
+            and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+            and not self._state.adding
+            and self._loaded_values is not None
+            and self.pk == self._loaded_values.get(self._meta.pk.attname)
+        ):
+            # An empty list makes Django skip the UPDATE (and the save signals) entirely
+            kwargs['update_fields'] = self.get_dirty_fields()
+        super().save(*args, **kwargs)
+        self._snapshot_loaded_values(kwargs.get('update_fields'))
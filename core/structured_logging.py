@@ -0,0 +1,127 @@
+# --- Hot-path logging: lazy records, formatted and written on a background thread ---
+import atexit
+import json
+import logging
+import queue
+import sys
+import threading
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+# Modules on the M2S command path. Their records go through the queue handler;
+# "<name>.timing" children carry the per-step timing lines (off by default).
+HOTPATH_LOGGERS = (
+    "facade.models",
+    "facade.rpc",
+    "orchestrator.models",
+    "orchestrator.management.commands.update_causal_property",
+)
+
+_listener = None
+_handler = None
+_lock = threading.Lock()
+
+
+class _KeyValues:
+    """Renders `k=v k=v` only when the record is actually formatted."""
+
+    __slots__ = ("fields",)
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def __str__(self):
+        return " ".join(f"{k}={v}" for k, v in self.fields.items())
+
+
+def log_event(logger, event, fields, level=logging.INFO, tag=None):
+    """Log a parser-facing event such as RPC_RESULT or M2S-RPC.
+
+    In text mode the line reads `<tag or event> k=v k=v ...` exactly like the
+    former print() output; in JSON mode `event`, `tag` and every field become
+    top-level keys.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, "%s %s", tag or event, _KeyValues(fields),
+                   extra={"event": event, "event_tag": tag, "fields": fields})
+
+
+class TextFormatter(logging.Formatter):
+    """`[<iso timestamp>] <message>`, the layout of the previous print() lines."""
+
+    def format(self, record):
+        line = f"[{datetime.fromtimestamp(record.created).isoformat()}] {record.getMessage()}"
+        if record.exc_info:
+            line = f"{line}\n{self.formatException(record.exc_info)}"
+        return line
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per record; event fields are flattened into the object."""
+
+    def format(self, record):
+        data = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+        }
+        event = getattr(record, "event", None)
+        if event:
+            data["event"] = event
+            if getattr(record, "event_tag", None):
+                data["tag"] = record.event_tag
+            for key, value in (getattr(record, "fields", None) or {}).items():
+                data.setdefault(key, value)
+        data["msg"] = record.getMessage()
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    # QueueHandler.prepare() formats the record on the caller's thread; keep the
+    # record as-is so message formatting also happens on the listener thread.
+    def prepare(self, record):
+        return record
+
+
+def configure_hotpath_logging(level="INFO", fmt="text", timing=False, stream=None, force=False):
+    """Route HOTPATH_LOGGERS through a QueueHandler drained by a background QueueListener.
+
+    Safe to call more than once; `force=True` replaces the current setup
+    (used by bench_property_save to compare configurations).
+    """
+    global _listener, _handler
+    with _lock:
+        if _listener is not None and not force:
+            return _handler
+        if _listener is not None:
+            _listener.stop()
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JsonLinesFormatter() if str(fmt).lower() == "json" else TextFormatter())
+        records = queue.SimpleQueue()
+        _handler = _DeferredQueueHandler(records)
+        _listener = QueueListener(records, output)
+        _listener.start()
+
+        level = logging.getLevelName(str(level).upper()) if isinstance(level, str) else level
+        for name in HOTPATH_LOGGERS:
+            logger = logging.getLogger(name)
+            logger.handlers = [_handler]
+            logger.setLevel(level)
+            logger.propagate = False
+            logging.getLogger(f"{name}.timing").setLevel(logging.INFO if timing else logging.WARNING)
+    return _handler
+
+
+def stop_hotpath_logging():
+    """Flush and stop the background listener."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+atexit.register(stop_hotpath_logging)
@@ -295,7 +295,38 @@ echo "[entrypoint] Starting listen_gateway in background (logs -> $LISTENER_LOG)
 nohup python manage.py listen_gateway >> "$LISTENER_LOG" 2>&1 &
 LISTENER_PID=$!
 
-# Ensure the listener is killed when the container exits
-trap 'echo "[entrypoint] Stopping background listener (pid $LISTENER_PID)"; kill ${LISTENER_PID} 2>/dev/null || true' EXIT INT TERM
+# Device status (DigitalTwinInstance.active) has a single writer:
+#   LIVENESS_ENABLED=True (default) -> listen_gateway, from telemetry arrival (liveness)
+#   LIVENESS_ENABLED=False          -> check_device_status, polling the ThingsBoard 'active' attribute
+STATUS_CHECKER_PID=""
+case "$(echo "${LIVENESS_ENABLED:-True}" | tr '[:upper:]' '[:lower:]')" in
+	1|true|yes|on)
+		echo "[entrypoint] Device status from telemetry liveness (listen_gateway)"
+		;;
+	*)
+		STATUS_LOG="/middleware-dt/logs/check_device_status.log"
+		echo "[entrypoint] LIVENESS_ENABLED=False -> starting check_device_status in background (logs -> $STATUS_LOG)"
+		nohup python manage.py check_device_status >> "$STATUS_LOG" 2>&1 &
+		STATUS_CHECKER_PID=$!
+		;;
+esac
+
+# Neo4j (only when the integration is enabled): constraints/indexes first, then
+# the drainer that applies the twin-graph changes queued in the outbox by the
+# signal handlers
+DRAINER_PID=""
+case "$(echo "${USE_NEO4J:-False}" | tr '[:upper:]' '[:lower:]')" in
+	1|true|yes|on)
+		echo "[entrypoint] Ensuring Neo4j constraints/indexes (ensure_neo4j_schema)"
+		python manage.py ensure_neo4j_schema --no-wait || echo "[entrypoint] [WARN] ensure_neo4j_schema failed, continuing"
+		DRAINER_LOG="/middleware-dt/logs/drain_neo4j_outbox.log"
+		echo "[entrypoint] Starting drain_neo4j_outbox in background (logs -> $DRAINER_LOG)"
+		nohup python manage.py drain_neo4j_outbox >> "$DRAINER_LOG" 2>&1 &
+		DRAINER_PID=$!
+		;;
+esac
+
+# Ensure the background processes are killed when the container exits
+trap 'echo "[entrypoint] Stopping background listener (pid $LISTENER_PID)"; kill ${LISTENER_PID} ${STATUS_CHECKER_PID} ${DRAINER_PID} 2>/dev/null || true' EXIT INT TERM
 
 exec gunicorn --bind 0.0.0.0:8000 --workers 3 middleware_dt.wsgi:application
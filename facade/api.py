@@ -1,7 +1,7 @@
 # facade/views.py
 import json
 
-from core.api import get_gateway_auth_headers
+from core.api import get_gateway_auth_headers, send_with_gateway_auth
 from ninja import Query
 from core.models import GatewayIOT
 from .models import Device, DeviceType, Property
@@ -98,20 +98,20 @@ def call_device_rpc(request, device_id: int, payload: DeviceRPCView):
     qs = _scope_to_organization(Device.objects.all(), request)
     device = get_object_or_404(qs, id=device_id)
     gateway = device.gateway
-    auth_response, status_code = get_gateway_auth_headers(request, gateway.id)
-    if status_code != 200:
-        return api.create_response(request, auth_response, status=status_code)
     url = f"{gateway.url}/api/plugins/rpc/oneway/{device.identifier}"
-    headers = auth_response["headers"]
     # Gerar request_id único
     request_id = str(uuid.uuid4())
     # Incluir request_id no payload.params
     params = dict(payload.params) if payload.params else {}
     params["request_id"] = request_id
     # Chamar o RPC com request_id propagado
-    response = requests.post(
-        url, json={"method": payload.method, "params": params}, headers=headers
+    response, auth_response, status_code = send_with_gateway_auth(
+        request,
+        gateway.id,
+        lambda headers: requests.post(url, json={"method": payload.method, "params": params}, headers=headers),
     )
+    if response is None:
+        return api.create_response(request, auth_response, status=status_code)
     # Atribuir request_id ao device para uso posterior (ex: gravação sent_timestamp)
     setattr(device, 'request_id', request_id)
     if response.status_code == 200:
@@ -237,6 +237,13 @@ def discover_devices(request, gateway_id: int, params: DeviceDiscoveryParams = Q
             pass
 
     response = requests.get(url, headers=headers, params=params.dict())
+    if response.status_code == 401 and auth_response.get("token_type") == "bearer":
+        # Cached gateway JWT was rejected: refresh it once and retry
+        auth_response, status_code = get_gateway_auth_headers(request, gateway_id, force_refresh=True)
+        if status_code != 200:
+            return api.create_response(request, auth_response, status=status_code)
+        headers = auth_response["headers"]
+        response = requests.get(url, headers=headers, params=params.dict())
     if response.status_code == 200:
         devices_data = response.json()['data']
         created_objs = []
@@ -355,3 +362,19 @@ def list_device_rpc_methods(request, device_id: int):
     rpc_methods = device.property_set.filter(rpc_read_method__isnull=False).values_list('name', 'rpc_read_method', 'rpc_write_method')
     return list(rpc_methods)
 
+
+@router.get(
+    "/metrics/",
+    response={200: dict},
+    tags=['Facade'],
+    summary="Runtime metrics of this worker's write/RPC hot paths",
+)
+def runtime_metrics(request):
+    from core.gateway_auth import get_gateway_token_cache
+    from facade.influx import get_influx_writer
+    from facade.rpc import get_rpc_client
+    return {
+        "influx_writer": get_influx_writer().stats(),
+        "gateway_tokens": get_gateway_token_cache().stats(),
+        "rpc": get_rpc_client().stats(),
+    }
@@ -0,0 +1,293 @@
+# --- Process-wide batched InfluxDB writer shared by telemetry and latency paths ---
+import atexit
+import collections
+import logging
+import queue
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class InfluxBatchWriter:
+    """Non-blocking InfluxDB line-protocol writer.
+
+    Callers enqueue lines produced by `format_influx_line`; a background thread
+    flushes them in a single POST either when `batch_size` lines are pending or
+    when the oldest pending line is `flush_interval` seconds old. The queue is
+    bounded: when it is full new points are dropped (and counted) instead of
+    blocking the hot path.
+
+    A batch whose write fails with a transient error (connection error, timeout,
+    429 or 5xx) is retried `max_retries` times with exponential backoff. If it
+    still fails it is parked for one more round after the next flush, at most
+    `max_requeue` batches at a time; only then are its points dropped and
+    counted in `dropped_write_failed` (and `dropped`).
+    """
+
+    def __init__(self, url, token, batch_size=500, flush_interval=0.2, max_queue=50000, timeout=2.0,
+                 max_retries=3, retry_backoff=0.5, max_requeue=20):
+        self.url = url
+        self.token = token
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.001, float(flush_interval))
+        self.timeout = float(timeout)
+        self.max_retries = max(0, int(max_retries))
+        self.retry_backoff = max(0.0, float(retry_backoff))
+        self.max_requeue = max(0, int(max_requeue))
+        # Batches that exhausted their retries, waiting for a last attempt
+        self._requeued = collections.deque()
+        self._requeue_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._session = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._counters = {
+            "enqueued": 0,
+            "written": 0,
+            "dropped": 0,
+            "failed": 0,
+            "batches": 0,
+            "retries": 0,
+            "requeued": 0,
+            "dropped_write_failed": 0,
+        }
+        self._last_error = None
+        self._last_flush_at = None
+
+    # -- public API -----------------------------------------------------
+    def write(self, line):
+        """Enqueue one line. Returns False when the point was dropped."""
+        if not line:
+            return False
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            self._incr("dropped")
+            return False
+        self._incr("enqueued")
+        return True
+
+    def write_many(self, lines):
+        """Enqueue several lines. Returns how many were accepted."""
+        accepted = 0
+        for line in lines:
+            if self.write(line):
+                accepted += 1
+        return accepted
+
+    def flush(self):
+        """Synchronously drain everything currently queued (used on shutdown).
+
+        Requeued batches get their last attempt here; nothing is parked again.
+        """
+        while True:
+            retry = self._pop_requeued()
+            if retry is None:
+                break
+            self._write_batch(retry, final=True)
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                return
+            self._write_batch(batch, final=True)
+
+    def close(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout=self.timeout + self.flush_interval)
+        self.flush()
+        if self._session is not None:
+            self._session.close()
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._stats_lock:
+            data = dict(self._counters)
+            data["last_error"] = self._last_error
+            data["last_flush_at"] = self._last_flush_at
+        data["queue_depth"] = self.queue_depth
+        data["queue_maxsize"] = self._queue.maxsize
+        data["requeued_pending"] = len(self._requeued)
+        data["batch_size"] = self.batch_size
+        data["flush_interval"] = self.flush_interval
+        return data
+
+    # -- internals ------------------------------------------------------
+    def _incr(self, counter, amount=1):
+        with self._stats_lock:
+            self._counters[counter] += amount
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="influx-batch-writer", daemon=True)
+            self._thread.start()
+
+    def _get_session(self):
+        if self._session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update({
+                "Authorization": f"Token {self.token}",
+                "Content-Type": "text/plain; charset=utf-8",
+                "Connection": "keep-alive",
+            })
+            self._session = session
+        return self._session
+
+    def _drain(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+            # A parked batch gets its last attempt after a fresh batch went through
+            retry = self._pop_requeued()
+            if retry is not None:
+                self._write_batch(retry, final=True)
+
+    def _pop_requeued(self):
+        with self._requeue_lock:
+            return self._requeued.popleft() if self._requeued else None
+
+    def _write_batch(self, batch, final=False):
+        """Post `batch`, retrying transient failures with exponential backoff.
+
+        When the retries are exhausted the batch is requeued once (bounded by
+        `max_requeue`) unless `final` is set; otherwise its points are dropped.
+        """
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._incr("retries")
+                # Stop pressionado (close): sem espera, a última tentativa é a do flush
+                if self._stop.wait(self.retry_backoff * (2 ** (attempt - 1))):
+                    break
+            ok, retryable = self._post(batch)
+            if ok:
+                return True
+            if not retryable:
+                break
+        else:
+            if not final and self._requeue(batch):
+                return False
+        self._drop_failed(batch)
+        return False
+
+    def _requeue(self, batch):
+        evicted = None
+        with self._requeue_lock:
+            if self.max_requeue <= 0:
+                return False
+            if len(self._requeued) >= self.max_requeue:
+                evicted = self._requeued.popleft()
+            self._requeued.append(batch)
+        self._incr("requeued", len(batch))
+        if evicted is not None:
+            self._drop_failed(evicted)
+        return True
+
+    def _drop_failed(self, batch):
+        with self._stats_lock:
+            self._counters["dropped"] += len(batch)
+            self._counters["dropped_write_failed"] += len(batch)
+        logger.error(f"InfluxDB batch dropped after failed writes ({len(batch)} points): {self._last_error}")
+
+    def _post(self, batch):
+        """One POST of `batch`. Returns (ok, retryable)."""
+        try:
+            response = self._get_session().post(self.url, data="\n".join(batch).encode("utf-8"), timeout=self.timeout)
+            ok = response.status_code in (200, 204)
+            # 4xx (other than 429) means a bad payload/credentials: retrying won't help
+            retryable = response.status_code == 429 or response.status_code >= 500
+            error = None if ok else f"HTTP {response.status_code}: {response.text[:200]}"
+        except Exception as e:
+            ok = False
+            retryable = True
+            error = str(e)[:200]
+        with self._stats_lock:
+            self._counters["batches"] += 1
+            if ok:
+                self._counters["written"] += len(batch)
+            else:
+                self._counters["failed"] += len(batch)
+                self._last_error = error
+            self._last_flush_at = time.time()
+        if not ok:
+            logger.warning(f"InfluxDB batch write failed ({len(batch)} points): {error}")
+        return ok, retryable
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_influx_write_url():
+    from django.conf import settings
+    return (
+        f"http://{settings.INFLUXDB_HOST}:{settings.INFLUXDB_PORT}/api/v2/write"
+        f"?org={settings.INFLUXDB_ORGANIZATION}&bucket={settings.INFLUXDB_BUCKET}&precision=ms"
+    )
+
+
+def get_influx_writer():
+    """Return the process-wide InfluxBatchWriter, creating it from settings on first use."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                from django.conf import settings
+                _writer = InfluxBatchWriter(
+                    url=get_influx_write_url(),
+                    token=settings.INFLUXDB_TOKEN,
+                    batch_size=getattr(settings, "INFLUX_BATCH_SIZE", 500),
+                    flush_interval=getattr(settings, "INFLUX_FLUSH_INTERVAL", 0.2),
+                    max_queue=getattr(settings, "INFLUX_QUEUE_MAXSIZE", 50000),
+                    timeout=getattr(settings, "INFLUX_WRITE_TIMEOUT", 2.0),
+                    max_retries=getattr(settings, "INFLUX_WRITE_RETRIES", 3),
+                    retry_backoff=getattr(settings, "INFLUX_RETRY_BACKOFF", 0.5),
+                    max_requeue=getattr(settings, "INFLUX_MAX_REQUEUE", 20),
+                )
+                atexit.register(_writer.close)
+    return _writer
+
+
+def write_influx_line(line):
+    """Shortcut used by call sites: enqueue one line on the shared writer."""
+    return get_influx_writer().write(line)
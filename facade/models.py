@@ -3,6 +3,7 @@
 # gateway/models.py
 import time
 import os
+import logging
 from decimal import Decimal
 import requests
 from django.conf import settings
@@ -10,9 +11,16 @@ from django.db import models
 from django.contrib.auth.models import User
 from enum import Enum
 from facade.utils import format_influx_line, get_session_for_gateway
+from facade.influx import write_influx_line
 import traceback
 
 from core.models import GatewayIOT, Organization
+from core.model_tracking import DirtyFieldsMixin
+from core.structured_logging import log_event
+
+logger = logging.getLogger(__name__)
+# Per-step timing of Property.save (enabled with HOTPATH_LOG_TIMING)
+timing_logger = logging.getLogger(f"{__name__}.timing")
 # INFLUX configuration
 INFLUXDB_HOST = settings.INFLUXDB_HOST
 INFLUXDB_PORT = settings.INFLUXDB_PORT
@@ -232,7 +240,7 @@ class InactivityType(Enum):
     CONNECTION_ERROR = "connection_error"  # Erro de conexão com ThingsBoard
     TIMEOUT = "timeout"  # Tempo limite excedido sem resposta
 
-class Property(models.Model):
+class Property(DirtyFieldsMixin, models.Model):
     TYPE_CHOICES = (("Boolean", "Boolean"), ("Integer", "Integer", ),("Double", "Double",))
     device = models.ForeignKey(Device, null=False, on_delete=models.CASCADE)
     name = models.CharField(max_length=255)
@@ -252,10 +260,6 @@ class Property(models.Model):
     
     def write_influx(self, request_id=None, measurement="device_data", extra_fields=None):
         timestamp = int(time.time() * 1000)
-        headers = {
-            "Authorization": f"Token {INFLUXDB_TOKEN}",
-            "Content-Type": "text/plain"
-        }
         key = self.name
         valor = self.get_value()
         if self.type == 'Boolean' or self.type == 'Integer':
@@ -317,8 +321,10 @@ class Property(models.Model):
         if extra_fields:
             fields.update(extra_fields)
         data = format_influx_line(measurement, tags, fields, timestamp=timestamp)
-        response = requests.post(INFLUXDB_URL, headers=headers, data=data)
-        print(f"Response Code: {response.status_code}, Response Text: {response.text} - Data Sent: {data}")
+        if write_influx_line(data):
+            logger.debug("InfluxDB queued - Data: %s", data)
+        else:
+            logger.warning("InfluxDB DROPPED (queue full) - Data: %s", data)
 
     def write_latency_received(self, request_id=None, correlation_id=None):
         """Registra received_timestamp em latency_measurement (M2S) para pareamento de latência."""
@@ -356,66 +362,76 @@ class Property(models.Model):
         
         fields = {self.name: value, "received_timestamp": timestamp}
         data = format_influx_line("latency_measurement", tags, fields, timestamp=timestamp)
-        response = requests.post(INFLUXDB_URL, headers={"Authorization": f"Token {INFLUXDB_TOKEN}", "Content-Type": "text/plain"}, data=data)
-        print(f"[M2S-RECEIVED] Logged received_timestamp for {sensor_id} (correlation_id={correlation_id}): {response.status_code}")
+        if write_influx_line(data):
+            logger.debug("[M2S-RECEIVED] Logged received_timestamp for %s (correlation_id=%s): queued", sensor_id, correlation_id)
+        else:
+            logger.warning("[M2S-RECEIVED] received_timestamp for %s (correlation_id=%s): dropped (queue full)", sensor_id, correlation_id)
     
     def save(self, *args, **kwargs):
-        import time
-        from datetime import datetime
-        
-        save_start = time.time()
+        save_start = time.perf_counter()
         property_name = getattr(self, 'name', f'property_{getattr(self, "id", "new")}')
-        device_name = getattr(self.device, 'name', 'unknown') if hasattr(self, 'device') and self.device else 'no_device'
-        print(f"[{datetime.now().isoformat()}] 🏭 DEVICE PROPERTY SAVE START: '{property_name}' on device '{device_name}'")
+        if logger.isEnabledFor(logging.DEBUG):
+            device_name = getattr(self.device, 'name', 'unknown') if hasattr(self, 'device') and self.device else 'no_device'
+            logger.debug("🏭 DEVICE PROPERTY SAVE START: '%s' on device '%s'", property_name, device_name)
         
         # Extract correlation_id from kwargs for end-to-end tracing
         correlation_id = kwargs.pop('correlation_id', None)
         # If True, sent_timestamp was already logged upstream (avoid duplicate write)
         self.m2s_sent_logged = bool(kwargs.pop('m2s_sent_logged', False))
+        # Response of an RPC the caller already sent for this value (skips call_rpc)
+        rpc_response = kwargs.pop('rpc_response', None)
         if correlation_id:
-            print(f"[DEBUG] Setting self.correlation_id = {correlation_id} (type: {type(correlation_id)})")
+            logger.debug("Setting self.correlation_id = %s", correlation_id)
             self.correlation_id = correlation_id  # Store for RPC layer
         
         old_value = ''
+        old_value_time = 0
         if self.id:
-            old_value_start = time.time()
-            old_value = Property.objects.get(id=self.id).value
-            old_value_time = time.time() - old_value_start
-            print(f"[{datetime.now().isoformat()}] 📊 Property '{property_name}' value change: '{old_value}' → '{self.value}' (fetch_time: {old_value_time:.3f}s)")
+            old_value_start = time.perf_counter()
+            # Value captured when the instance was loaded; query only for instances built by hand
+            old_value = self.loaded_value('value')
+            if old_value is None:
+                old_value = Property.objects.get(id=self.id).value
+            old_value_time = time.perf_counter() - old_value_start
+            logger.debug("📊 Property '%s' value change: '%s' → '%s'", property_name, old_value, self.value)
         
         success = False
         rpc_time = 0
         response = None
         if self.rpc_write_method:
-            rpc_start = time.time()
-            print(f"[{datetime.now().isoformat()}] 📡 Starting RPC call for '{property_name}' using method '{self.rpc_write_method}'")
-            response = self.call_rpc(RPCCallTypes.WRITE)
-            rpc_time = time.time() - rpc_start
+            rpc_start = time.perf_counter()
+            if rpc_response is not None:
+                response = rpc_response
+            else:
+                logger.debug("📡 Starting RPC call for '%s' using method '%s'", property_name, self.rpc_write_method)
+                response = self.call_rpc(RPCCallTypes.WRITE)
+            rpc_time = time.perf_counter() - rpc_start
             success = response.status_code == 200
-            print(f"[{datetime.now().isoformat()}] 📡 RPC call completed for '{property_name}' in {rpc_time:.3f}s (status: {response.status_code}, success: {success})")
+            logger.debug("📡 RPC call completed for '%s' (status: %s, success: %s)", property_name, response.status_code, success)
         else:
-            print(f"[{datetime.now().isoformat()}] ⏭️ No RPC write method for '{property_name}' - skipping RPC call")
+            logger.debug("⏭️ No RPC write method for '%s' - skipping RPC call", property_name)
         
-        value_processing_start = time.time()
+        value_processing_start = time.perf_counter()
         if success:
             response_json = response.json()
             new_value = str(response_json.get(self.name))
-            print(f"[{datetime.now().isoformat()}] ✅ RPC response for '{property_name}': {new_value}")
+            logger.debug("✅ RPC response for '%s': %s", property_name, new_value)
             self.value = new_value
+        elif self.rpc_write_method:
+            logger.warning("❌ RPC failed for '%s' (status: %s), keeping old value: %s",
+                           property_name, response.status_code, old_value)
+            self.value = old_value
         else:
-            print(f"[{datetime.now().isoformat()}] ❌ RPC failed for '{property_name}', keeping old value: {old_value}")
             self.value = old_value
-        value_processing_time = time.time() - value_processing_start
+        value_processing_time = time.perf_counter() - value_processing_start
         
-        db_save_start = time.time()
+        db_save_start = time.perf_counter()
         super().save(*args, **kwargs)
-        db_save_time = time.time() - db_save_start
-        print(f"[{datetime.now().isoformat()}] 🗃️ Database save for device property '{property_name}' completed in {db_save_time:.3f}s")
+        db_save_time = time.perf_counter() - db_save_start
         
         influx_time = 0
         if success and USE_INFLUX_TO_EVALUATE and INFLUXDB_TOKEN:
-            influx_start = time.time()
-            print(f"[{datetime.now().isoformat()}] 📈 Writing to InfluxDB for '{property_name}'")
+            influx_start = time.perf_counter()
             # Extrai o request_id do contexto, se disponível
             request_id = None
             if hasattr(self, 'last_payload') and isinstance(self.last_payload, dict):
@@ -426,53 +442,57 @@ class Property(models.Model):
             # Também registra received_timestamp em latency_measurement (M2S) para pareamento
             # Use correlation_id for end-to-end tracing if available
             self.write_latency_received(request_id=request_id, correlation_id=correlation_id)
-            influx_time = time.time() - influx_start
-            print(f"[{datetime.now().isoformat()}] 📈 InfluxDB write para '{property_name}' e latency_measurement completed in {influx_time:.3f}s")
+            influx_time = time.perf_counter() - influx_start
         
-        total_save_time = time.time() - save_start
-        print(f"[{datetime.now().isoformat()}] 🏭 DEVICE PROPERTY SAVE COMPLETE: '{property_name}' total time: {total_save_time:.3f}s (rpc: {rpc_time:.3f}s, value_proc: {value_processing_time:.3f}s, db_save: {db_save_time:.3f}s, influx: {influx_time:.3f}s)")
+        total_save_time = time.perf_counter() - save_start
+        if timing_logger.isEnabledFor(logging.INFO):
+            log_event(timing_logger, "PROPERTY_SAVE_TIMING", {
+                "property": property_name,
+                "total": f"{total_save_time:.6f}s",
+                "old_value_fetch": f"{old_value_time:.6f}s",
+                "rpc": f"{rpc_time:.6f}s",
+                "value_proc": f"{value_processing_time:.6f}s",
+                "db_save": f"{db_save_time:.6f}s",
+                "influx": f"{influx_time:.6f}s",
+            })
         
         # Log performance warnings
         if total_save_time > 2.0:
-            print(f"[{datetime.now().isoformat()}] 🐌 SLOW DEVICE SAVE WARNING: Property '{property_name}' took {total_save_time:.3f}s (threshold: 2.0s)")
+            logger.warning("🐌 SLOW DEVICE SAVE WARNING: Property '%s' took %.3fs (threshold: 2.0s)", property_name, total_save_time)
         if rpc_time > 1.0:
-            print(f"[{datetime.now().isoformat()}] 🐌 SLOW RPC WARNING: Property '{property_name}' RPC took {rpc_time:.3f}s (threshold: 1.0s)")
+            logger.warning("🐌 SLOW RPC WARNING: Property '%s' RPC took %.3fs (threshold: 1.0s)", property_name, rpc_time)
 
         return response
 
     #Para leitura, seria necessário criar um mecanismos no middleware para chamar de forma assincrona esse método de todas as instâncias
-    def call_rpc(self,rpc_type:RPCCallTypes):
-        """Ultra-fast RPC with 200ms timeout and immediate fallback"""
-        import time
-        from datetime import datetime
-        
-        print(f"[{datetime.now().isoformat()}] ⚡ ULTRA-FAST RPC: {rpc_type.name} for {self.device.identifier}")
-        
+    def _build_rpc_request(self, rpc_type:RPCCallTypes):
+        """Resolve gateway/auth/payload for a twoway RPC (sync, touches the ORM).
+
+        Returns None when the call cannot be sent (auth failure or no RPC method
+        for `rpc_type`); callers fall back to a mock response.
+        """
+        from facade.rpc import RPCPolicy, RPCRequest
+
         device = self.device
         gateway = device.gateway
-        start_time = time.time()
+        logger.debug("⚡ ULTRA-FAST RPC: %s for %s", rpc_type.name, device.identifier)
         correlation_id = getattr(self, 'correlation_id', None)
         property_name = getattr(self, 'name', 'unknown')
-        
+
         # Resolve auth headers for the gateway (Bearer JWT or ApiKey)
         try:
-            from core.api import get_gateway_auth_headers
-            response, status_code = get_gateway_auth_headers(None, gateway.id)
+            from core.api import gateway_auth_headers
+            response_auth, status_code = gateway_auth_headers(gateway)
             if status_code != 200:
                 raise Exception(f"Gateway auth failed: {status_code}")
-            headers = response['headers']
-            print(f"[{datetime.now().isoformat()}] 🔑 Gateway auth: OK")
+            headers = response_auth['headers']
         except Exception as e:
-            print(f"[{datetime.now().isoformat()}] ❌ Gateway auth failed: {e}")
-            return self._create_mock_response()
-        
-        # Setup RPC call - use TWOWAY with fast TB timeout
-        urltwoway = f"{gateway.url}/api/rpc/twoway/{device.identifier}"
-        
+            logger.warning("❌ Gateway auth failed for gateway %s: %s", gateway.id, e)
+            return None
+
         # Helper function to serialize Decimal and other non-JSON types
         def json_serialize_value(value):
             """Convert Decimal and other non-JSON types to JSON-serializable format"""
-            from decimal import Decimal
             if isinstance(value, Decimal):
                 return float(value)
             elif isinstance(value, dict):
@@ -480,149 +500,74 @@ class Property(models.Model):
             elif isinstance(value, (list, tuple)):
                 return [json_serialize_value(item) for item in value]
             return value
-        
-        # Adaptive RPC timeout based on network profile
-        import time
-        import os
-        
-        # Read network profile from environment (set by topology script)
-        network_profile = os.getenv('NETWORK_PROFILE', 'urllc').lower()
-        m2s_perf_mode = os.getenv('M2S_PERF_MODE', '0').lower() in ('1', 'true', 'yes')
-        m2s_perf_timestamps_only = os.getenv('M2S_PERF_TIMESTAMPS_ONLY', '0').lower() in ('1', 'true', 'yes')
-        m2s_perf_full = os.getenv('M2S_PERF_FULL', '0').lower() in ('1', 'true', 'yes')
-        disable_hotpath_influx = os.getenv('M2S_DISABLE_RPC_INFLUX_HOTPATH', '0').lower() in ('1', 'true', 'yes') or m2s_perf_full
-        
-        # Adaptive timeout configuration per profile
-        # Values consider: network RTT (2 × delay) + ThingsBoard processing overhead (~100ms) + safety margin
-        TIMEOUT_CONFIG = {
-            'urllc': 0.30,       # 300ms - keep high throughput; eventual delivery is measured separately
-            'embb': 0.50,        # 500ms - RTT ~50ms + TB processing + margin
-            'best_effort': 1.00  # 1000ms - RTT ~100ms + TB processing + generous margin
-        }
-        RETRY_CONFIG = {
-            'urllc': 1,          # 1 retry - avoid throughput collapse under contention
-            'embb': 3,           # 3 retries - standard
-            'best_effort': 2,    # 2 retries - less aggressive, accepts loss
-        }
-
-        if m2s_perf_mode:
-            # Benchmark mode: prioritize low M2S latency over eventual delivery rate
-            TIMEOUT_CONFIG['urllc'] = float(os.getenv('M2S_URLLC_TIMEOUT_S', '0.22'))
-            RETRY_CONFIG['urllc'] = int(os.getenv('M2S_URLLC_RETRIES', '0'))
-        
-        retry_count = 0
-        max_retries = RETRY_CONFIG.get(network_profile, 2)
-        base_timeout = TIMEOUT_CONFIG.get(network_profile, 0.18)
-        
-        while retry_count <= max_retries:
-            try:
-                from facade.utils import get_session_for_gateway
-                session = get_session_for_gateway(gateway.id)
-                
-                # Progressive timeout per retry to absorb transient backend slowness
-                current_timeout = min(base_timeout * (1 + 0.35 * retry_count), base_timeout + 0.60)
-                
-                if rpc_type.name == 'WRITE' and self.rpc_write_method:
-                    print(f"[{datetime.now().isoformat()}] ⚡ ULTRA-WRITE (try {retry_count+1}): {self.rpc_write_method}={self.get_value()}")
-                    
-                    # M2S TIMESTAMP: Register when middleware SENDS to simulator
-                    if retry_count == 0 and not disable_hotpath_influx:  # Only on first try
-                        if not getattr(self, 'm2s_sent_logged', False):
-                            try:
-                                self._write_m2s_sent_timestamp()
-                            except Exception as e:
-                                print(f"[{datetime.now().isoformat()}] ⚠️ M2S InfluxDB: {e}")
-                        else:
-                            print(f"[{datetime.now().isoformat()}] ℹ️ M2S sent_timestamp already logged upstream; skipping duplicate write")
-
-                        if not m2s_perf_timestamps_only:
-                            try:
-                                self._write_influx_fast()
-                            except Exception as e:
-                                print(f"[{datetime.now().isoformat()}] ⚠️ InfluxDB: {e}")
-                    
-                    # Serialize value to JSON-compatible format (convert Decimal, etc)
-                    serialized_params = json_serialize_value(self.get_value())
-                    print(
-                        f"[{datetime.now().isoformat()}] [M2S-RPC] OUTBOUND "
-                        f"device={self.device.identifier} property={property_name} method={self.rpc_write_method} "
-                        f"params={serialized_params} timeout={current_timeout:.3f}s retry={retry_count} "
-                        f"corr={correlation_id}"
-                    )
-                    
-                    response = session.post(
-                        urltwoway,
-                        json={"method": self.rpc_write_method, "params": serialized_params},
-                        headers=headers,
-                        timeout=current_timeout
-                    )
-                elif rpc_type.name == 'READ' and self.rpc_read_method:
-                    if retry_count == 0:
-                        print(f"[{datetime.now().isoformat()}] ⚡ ULTRA-READ: {self.rpc_read_method}")
-                    response = session.post(
-                        urltwoway,
-                        json={"method": self.rpc_read_method},
-                        headers=headers,
-                        timeout=current_timeout
-                    )
-                else:
-                    return self._create_mock_response()
-                
-                elapsed = time.time() - start_time
-                try:
-                    response_text = (response.text or '')[:180]
-                except Exception:
-                    response_text = '<unavailable>'
-                print(
-                    f"[{datetime.now().isoformat()}] [M2S-RPC] INBOUND "
-                    f"device={self.device.identifier} property={property_name} method={self.rpc_write_method or self.rpc_read_method} "
-                    f"status={response.status_code} elapsed={elapsed:.3f}s retry={retry_count} corr={correlation_id} "
-                    f"body={response_text}"
-                )
-                if response.status_code == 200:
-                    if retry_count > 0:
-                        print(f"[{datetime.now().isoformat()}] ✅ ULTRA-RPC SUCCESS in {elapsed:.3f}s after {retry_count} retry(ies)")
-                    elif elapsed > base_timeout * 0.8:
-                        # Log successful but slow requests (>80% of timeout) for monitoring
-                        print(f"[{datetime.now().isoformat()}] ⚡ ULTRA-RPC SUCCESS in {elapsed:.3f}s (close to timeout={base_timeout:.2f}s)")
-                    return response
-
-                retryable_status = {408, 429, 500, 502, 503, 504}
-                if response.status_code in retryable_status and retry_count < max_retries:
-                    retry_count += 1
-                    print(
-                        f"[{datetime.now().isoformat()}] 🔄 ULTRA-RPC RETRY {retry_count}/{max_retries} "
-                        f"after HTTP {response.status_code} in {elapsed:.3f}s"
-                    )
-                    backoff = 0.02 * (2 ** (retry_count - 1))
-                    time.sleep(min(0.12, backoff))
-                    continue
 
-                print(
-                    f"[{datetime.now().isoformat()}] ❌ ULTRA-RPC NON-RETRYABLE/FINAL HTTP "
-                    f"{response.status_code} after {elapsed:.3f}s"
-                )
-                return response
-                
-            except Exception as e:
-                retry_count += 1
-                elapsed = time.time() - start_time
-                print(
-                    f"[{datetime.now().isoformat()}] [M2S-RPC] EXCEPTION "
-                    f"device={self.device.identifier} property={property_name} method={self.rpc_write_method or self.rpc_read_method} "
-                    f"elapsed={elapsed:.3f}s retry={retry_count-1} corr={correlation_id} err={str(e)[:180]}"
-                )
-                
-                if retry_count <= max_retries:
-                    print(f"[{datetime.now().isoformat()}] 🔄 ULTRA-RPC RETRY {retry_count}/{max_retries} after {elapsed:.3f}s (timeout={base_timeout:.2f}s): {str(e)[:100]}")
-                    # Exponential backoff: 20ms, 40ms, 80ms for retries 1, 2, 3
-                    backoff = 0.02 * (2 ** (retry_count - 1))
-                    time.sleep(min(0.10, backoff))
-                    print(f"[{datetime.now().isoformat()}] 💤 Retry backoff: {backoff*1000:.0f}ms")
+        policy = RPCPolicy()
+        if rpc_type.name == 'WRITE' and self.rpc_write_method:
+            # M2S TIMESTAMP: Register when middleware SENDS to simulator (once, not per retry)
+            if not policy.disable_hotpath_influx:
+                if not getattr(self, 'm2s_sent_logged', False):
+                    try:
+                        self._write_m2s_sent_timestamp()
+                    except Exception as e:
+                        logger.warning("⚠️ M2S InfluxDB: %s", e)
                 else:
-                    print(f"[{datetime.now().isoformat()}] ❌ ULTRA-RPC FAILED after {max_retries} retries in {elapsed:.3f}s: {str(e)[:100]}")
-                    print(f"[{datetime.now().isoformat()}] 🔻 FALLBACK: Returning mock 504 response")
-                    return self._create_mock_response(status_code=504)
+                    logger.debug("ℹ️ M2S sent_timestamp already logged upstream; skipping duplicate write")
+
+                if not policy.timestamps_only:
+                    try:
+                        self._write_influx_fast()
+                    except Exception as e:
+                        logger.warning("⚠️ InfluxDB: %s", e)
+            method = self.rpc_write_method
+            # Serialize value to JSON-compatible format (convert Decimal, etc)
+            payload = {"method": method, "params": json_serialize_value(self.get_value())}
+        elif rpc_type.name == 'READ' and self.rpc_read_method:
+            method = self.rpc_read_method
+            payload = {"method": method}
+        else:
+            return None
+
+        # Setup RPC call - use TWOWAY with fast TB timeout
+        return RPCRequest(
+            gateway_id=gateway.id,
+            url=f"{gateway.url}/api/rpc/twoway/{device.identifier}",
+            payload=payload,
+            headers=headers,
+            token_type=response_auth.get('token_type'),
+            policy=policy,
+            device_identifier=device.identifier,
+            property_name=property_name,
+            method=method,
+            is_write=rpc_type.name == 'WRITE',
+            correlation_id=correlation_id,
+        )
+
+    def call_rpc(self,rpc_type:RPCCallTypes):
+        """Ultra-fast RPC: blocking wrapper around the async engine in facade.rpc"""
+        from facade.rpc import send_twoway_sync
+
+        request = self._build_rpc_request(rpc_type)
+        if request is None:
+            return self._create_mock_response()
+        response = send_twoway_sync(request)
+        if response is None:
+            logger.warning("🔻 FALLBACK: Returning mock 504 response for %s.%s", self.device.identifier, self.name)
+            return self._create_mock_response(status_code=504)
+        return response
+
+    async def acall_rpc(self, rpc_type:RPCCallTypes):
+        """Async variant of call_rpc; many calls can be in flight on the caller's loop."""
+        from asgiref.sync import sync_to_async
+        from facade.rpc import send_twoway, with_fresh_db_connection
+
+        request = await sync_to_async(with_fresh_db_connection(self._build_rpc_request), thread_sensitive=False)(rpc_type)
+        if request is None:
+            return self._create_mock_response()
+        response = await send_twoway(request)
+        if response is None:
+            logger.warning("🔻 FALLBACK: Returning mock 504 response for %s.%s", self.device.identifier, self.name)
+            return self._create_mock_response(status_code=504)
+        return response
 
     def _create_mock_response(self, status_code=504):
         """Create a mock response for fallback/oneway scenarios"""
@@ -640,11 +585,8 @@ class Property(models.Model):
     def _write_m2s_sent_timestamp(self):
         """Write M2S sent timestamp to InfluxDB for latency measurement"""
         try:
-            import time
-            from datetime import datetime
-            
             if not (USE_INFLUX_TO_EVALUATE and INFLUXDB_TOKEN):
-                print(f"[{datetime.now().isoformat()}] ⚠️ M2S: InfluxDB not configured")
+                logger.debug("⚠️ M2S: InfluxDB not configured")
                 return
             
             sent_ts = int(time.time() * 1000)
@@ -668,24 +610,16 @@ class Property(models.Model):
             from facade.utils import format_influx_line
             data = format_influx_line("latency_measurement", tags, fields, timestamp=sent_ts)
             
-            import requests
-            requests.post(
-                INFLUXDB_URL,
-                headers={"Authorization": f"Token {INFLUXDB_TOKEN}", "Content-Type": "text/plain"},
-                data=data,
-                timeout=0.5
-            )
-            print(f"[{datetime.now().isoformat()}] 📈 M2S sent_timestamp logged for {sensor_id}")
+            if write_influx_line(data):
+                logger.debug("📈 M2S sent_timestamp logged for %s", sensor_id)
+            else:
+                logger.warning("⚠️ M2S sent_timestamp dropped (Influx queue full) for %s", sensor_id)
         except Exception as e:
-            from datetime import datetime
-            print(f"[{datetime.now().isoformat()}] ❌ M2S timestamp failed: {e}")
+            logger.warning("❌ M2S timestamp failed: %s", e)
 
     def _write_influx_fast(self):
         """Fast InfluxDB write with minimal blocking - focusing on property data only"""
         try:
-            import time
-            from datetime import datetime
-            
             if not (USE_INFLUX_TO_EVALUATE and INFLUXDB_TOKEN):
                 return
             
@@ -707,23 +641,16 @@ class Property(models.Model):
             from facade.utils import format_influx_line
             data = format_influx_line("device_data", tags, fields, timestamp=send_ts)
             
-            import requests
-            requests.post(
-                INFLUXDB_URL,
-                headers={"Authorization": f"Token {INFLUXDB_TOKEN}", "Content-Type": "text/plain"},
-                data=data,
-                timeout=0.5  # Very fast timeout
-            )
-            print(f"[{datetime.now().isoformat()}] 📈 InfluxDB: OK")
+            if write_influx_line(data):
+                logger.debug("📈 InfluxDB: queued")
+            else:
+                logger.warning("📈 InfluxDB: dropped (queue full)")
         except Exception as e:
-            from datetime import datetime
-            print(f"[{datetime.now().isoformat()}] 📈 InfluxDB failed: {e}")
+            logger.warning("📈 InfluxDB failed: %s", e)
     
     def _write_influx_m2s_sent_with_correlation(self):
         """Write M2S sent timestamp when middleware sends RPC to device"""
         try:
-            import time
-            from datetime import datetime
             if not (USE_INFLUX_TO_EVALUATE and INFLUXDB_TOKEN):
                 return
             sent_timestamp = int(time.time() * 1000)
@@ -744,17 +671,10 @@ class Property(models.Model):
             fields = {"sent_timestamp": sent_timestamp}
             from facade.utils import format_influx_line
             data = format_influx_line("latency_measurement", tags, fields, timestamp=sent_timestamp)
-            import requests
-            requests.post(
-                INFLUXDB_URL,
-                headers={"Authorization": f"Token {INFLUXDB_TOKEN}", "Content-Type": "text/plain"},
-                data=data,
-                timeout=0.5
-            )
-            print(f"[{datetime.now().isoformat()}] 📡 M2S sent_timestamp: {sent_timestamp} for {sensor_id} request_id={request_id}")
+            write_influx_line(data)
+            logger.debug("📡 M2S sent_timestamp: %s for %s request_id=%s", sent_timestamp, sensor_id, request_id)
         except Exception as e:
-            from datetime import datetime
-            print(f"[{datetime.now().isoformat()}] 📡 M2S timestamp failed: {e}")
+            logger.warning("📡 M2S timestamp failed: %s", e)
     
     
     def get_value(self):
@@ -775,10 +695,6 @@ def write_inactivity_event(device, inactivity_type: InactivityType, error_messag
         return
         
     timestamp = int(time.time() * 1000)
-    headers = {
-        "Authorization": f"Token {INFLUXDB_TOKEN}",
-        "Content-Type": "text/plain"
-    }
     
     # Get timeout value, default to 0 if None
     timeout = device.get_inactivity_timeout() or 0
@@ -807,9 +723,7 @@ def write_inactivity_event(device, inactivity_type: InactivityType, error_messag
         fields_dict["error_message"] = error_message
     measurement = format_influx_line("device_inactivity", tags_dict, fields_dict, timestamp=timestamp)
     try:
-        response = requests.post(INFLUXDB_URL, headers=headers, data=measurement)
-        if response.status_code != 204:
-            print(f"Failed to write inactivity event: {response.text}")
-            print(f"Attempted measurement: {measurement}")
+        if not write_influx_line(measurement):
+            print(f"Failed to queue inactivity event (Influx queue full): {measurement}")
     except Exception as e:
         print(f"Error writing to InfluxDB: {str(e)}")
@@ -1,5 +1,7 @@
 # --- HTTP session helper for gateway requests (moved out of models for reuse) ---
 import os
+import queue
+import threading
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
@@ -56,20 +58,27 @@ def format_influx_line(measurement, tags: dict, fields: dict, timestamp=None):
 
 # URLLC Redis-based Session Manager - Global singleton across all processes
 class URLLCRedisSessionManager:
-    """Redis-backed HTTP Session Manager for true global singleton across processes"""
+    """Redis-backed HTTP Session Manager for true global singleton across processes
+
+    Sessions are kept in a per-gateway registry: looking up a gateway that
+    already has a session is a plain dict read, without any lock. The lock is
+    only taken to create a session, and the Redis connection accounting
+    (INCR/EXPIRE/SETEX on create, DECR on close) runs on a background thread,
+    off the request path.
+    """
     
     def __init__(self):
         self._redis_client = None
         self._local_sessions = {}  # In-memory cache for sessions
-        self._lock = None
+        self._lock = threading.Lock()
+        self._coordination_queue = queue.Queue()
+        self._coordination_thread = None
         self._setup_redis()
     
     def _setup_redis(self):
         """Setup Redis connection with optimized local Redis"""
         try:
             import redis
-            import threading
-            self._lock = threading.Lock()
             
             # Use local Redis (installed in same container) for optimal performance
             redis_host = os.getenv('REDIS_HOST', '127.0.0.1')
@@ -91,8 +100,6 @@ class URLLCRedisSessionManager:
         except Exception as e:
             print(f"[URLLC-RedisSessionManager] ⚠️ Redis unavailable ({e}), using local singleton fallback")
             self._redis_client = None
-            import threading
-            self._lock = threading.Lock()
     
     def _get_session_key(self, gateway_id: int):
         """Generate Redis key for gateway session tracking"""
@@ -100,32 +107,16 @@ class URLLCRedisSessionManager:
     
     def get_session(self, gateway_id: int):
         """Get or create a true global singleton session for the gateway using Redis coordination"""
+        # Fast path: session already registered (dict reads are atomic, no lock needed)
+        session = self._local_sessions.get(gateway_id)
+        if session is not None:
+            return session
         
         with self._lock:
-            # Check if we already have this session locally
-            if gateway_id in self._local_sessions:
-                return self._local_sessions[gateway_id]
-            
-            # Use Redis for global coordination
-            session_key = self._get_session_key(gateway_id)
-            connection_count_key = f"urllc:session:{gateway_id}:connections"
-            
-            if self._redis_client:
-                try:
-                    # Atomic increment of connection count
-                    connection_count = self._redis_client.incr(connection_count_key)
-                    self._redis_client.expire(connection_count_key, 3600)  # 1 hour TTL
-                    
-                    if connection_count == 1:
-                        # We're the first process to use this gateway
-                        self._redis_client.setex(session_key, 3600, "primary")
-                        print(f"[URLLC-RedisSessionManager] 🎯 PRIMARY session for gateway {gateway_id} (connections: {connection_count})")
-                    else:
-                        # Other processes are already using this gateway
-                        print(f"[URLLC-RedisSessionManager] 🔗 SHARED session for gateway {gateway_id} (connections: {connection_count})")
-                    
-                except Exception as e:
-                    print(f"[URLLC-RedisSessionManager] Redis coordination error: {e}, proceeding with local session")
+            # Another thread may have created it while we waited for the lock
+            session = self._local_sessions.get(gateway_id)
+            if session is not None:
+                return session
             
             # Create ultra-optimized session with extreme connection limiting
             session = requests.Session()
@@ -163,56 +154,114 @@ class URLLCRedisSessionManager:
             
             self._local_sessions[gateway_id] = session
             print(f"[URLLC-RedisSessionManager] ⚡ Created local session for gateway {gateway_id}")
-            
-            return session
+        
+        # Use Redis for global coordination (asynchronously)
+        self._coordinate('register', gateway_id)
+        return session
     
     def close_session(self, gateway_id: int):
         """Close session and clean up Redis coordination state"""
         with self._lock:
-            # Close local session
-            if gateway_id in self._local_sessions:
-                try:
-                    self._local_sessions[gateway_id].close()
-                    del self._local_sessions[gateway_id]
-                    print(f"[URLLC-RedisSessionManager] ✅ Closed local session for gateway {gateway_id}")
-                except Exception as e:
-                    print(f"[URLLC-RedisSessionManager] ⚠️ Error closing session: {e}")
-            
-            # Decrement Redis connection count
-            if self._redis_client:
-                try:
-                    connection_count_key = f"urllc:session:{gateway_id}:connections"
-                    remaining = self._redis_client.decr(connection_count_key)
-                    
-                    if remaining <= 0:
-                        # Last process using this gateway, cleanup completely
-                        session_key = self._get_session_key(gateway_id)
-                        self._redis_client.delete(session_key, connection_count_key)
-                        print(f"[URLLC-RedisSessionManager] 🧹 Last connection - cleaned all Redis state for gateway {gateway_id}")
-                    else:
-                        print(f"[URLLC-RedisSessionManager] 📉 Decremented connections for gateway {gateway_id}, remaining: {remaining}")
-                        
-                except Exception as e:
-                    print(f"[URLLC-RedisSessionManager] Redis cleanup error: {e}")
+            session = self._local_sessions.pop(gateway_id, None)
+        if session is None:
+            return
+        
+        # Close local session
+        try:
+            session.close()
+            print(f"[URLLC-RedisSessionManager] ✅ Closed local session for gateway {gateway_id}")
+        except Exception as e:
+            print(f"[URLLC-RedisSessionManager] ⚠️ Error closing session: {e}")
+        
+        # Decrement Redis connection count
+        self._coordinate('unregister', gateway_id)
     
-    def close_all_sessions(self):
+    def close_all_sessions(self, timeout=2.0):
         """Close all sessions and clean up Redis state"""
         with self._lock:
-            # Close all local sessions
-            for gateway_id in list(self._local_sessions.keys()):
-                self.close_session(gateway_id)
-            
-            # Clean up all Redis session keys
-            if self._redis_client:
-                try:
-                    keys = self._redis_client.keys("urllc:session:*:active")
-                    if keys:
-                        self._redis_client.delete(*keys)
-                        print(f"[URLLC-RedisSessionManager] Cleaned {len(keys)} Redis session keys")
-                except Exception as e:
-                    print(f"[URLLC-RedisSessionManager] Redis cleanup error: {e}")
-            
-            print(f"[URLLC-RedisSessionManager] Closed all sessions")
+            gateway_ids = list(self._local_sessions.keys())
+        
+        # close_session takes the lock itself, so it must not be held here
+        for gateway_id in gateway_ids:
+            self.close_session(gateway_id)
+        
+        # Clean up all Redis session keys, waiting for pending coordination
+        self._coordinate('cleanup', None)
+        self.wait_coordination(timeout)
+        
+        print(f"[URLLC-RedisSessionManager] Closed all sessions")
+    
+    # -- Redis coordination (background thread) ------------------------------
+    def _coordinate(self, action, gateway_id):
+        if not self._redis_client:
+            return
+        if self._coordination_thread is None or not self._coordination_thread.is_alive():
+            with self._lock:
+                if self._coordination_thread is None or not self._coordination_thread.is_alive():
+                    self._coordination_thread = threading.Thread(
+                        target=self._coordination_loop, name="urllc-redis-coordination", daemon=True
+                    )
+                    self._coordination_thread.start()
+        self._coordination_queue.put((action, gateway_id))
+    
+    def wait_coordination(self, timeout=2.0):
+        """Block until queued Redis updates are applied (or `timeout` expires)."""
+        if not self._redis_client or self._coordination_thread is None:
+            return True
+        done = threading.Event()
+        self._coordination_queue.put(('barrier', done))
+        return done.wait(timeout)
+    
+    def _coordination_loop(self):
+        while True:
+            action, arg = self._coordination_queue.get()
+            try:
+                if action == 'register':
+                    self._redis_register(arg)
+                elif action == 'unregister':
+                    self._redis_unregister(arg)
+                elif action == 'cleanup':
+                    self._redis_cleanup()
+                elif action == 'barrier':
+                    arg.set()
+            except Exception as e:
+                print(f"[URLLC-RedisSessionManager] Redis coordination error: {e}")
+    
+    def _redis_register(self, gateway_id):
+        session_key = self._get_session_key(gateway_id)
+        connection_count_key = f"urllc:session:{gateway_id}:connections"
+        
+        # Atomic increment of connection count
+        pipe = self._redis_client.pipeline()
+        pipe.incr(connection_count_key)
+        pipe.expire(connection_count_key, 3600)  # 1 hour TTL
+        connection_count = pipe.execute()[0]
+        
+        if connection_count == 1:
+            # We're the first process to use this gateway
+            self._redis_client.setex(session_key, 3600, "primary")
+            print(f"[URLLC-RedisSessionManager] 🎯 PRIMARY session for gateway {gateway_id} (connections: {connection_count})")
+        else:
+            # Other processes are already using this gateway
+            print(f"[URLLC-RedisSessionManager] 🔗 SHARED session for gateway {gateway_id} (connections: {connection_count})")
+    
+    def _redis_unregister(self, gateway_id):
+        connection_count_key = f"urllc:session:{gateway_id}:connections"
+        remaining = self._redis_client.decr(connection_count_key)
+        
+        if remaining <= 0:
+            # Last process using this gateway, cleanup completely
+            session_key = self._get_session_key(gateway_id)
+            self._redis_client.delete(session_key, connection_count_key)
+            print(f"[URLLC-RedisSessionManager] 🧹 Last connection - cleaned all Redis state for gateway {gateway_id}")
+        else:
+            print(f"[URLLC-RedisSessionManager] 📉 Decremented connections for gateway {gateway_id}, remaining: {remaining}")
+    
+    def _redis_cleanup(self):
+        keys = self._redis_client.keys("urllc:session:*:active")
+        if keys:
+            self._redis_client.delete(*keys)
+            print(f"[URLLC-RedisSessionManager] Cleaned {len(keys)} Redis session keys")
 
 # URLLC Singleton Session Manager - Ultra-efficient HTTP connection management
 class URLLCSessionManager:
@@ -220,17 +269,19 @@ class URLLCSessionManager:
     
     _instance = None
     _sessions = {}
-    _lock = None
+    _lock = threading.Lock()
     
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(URLLCSessionManager, cls).__new__(cls)
-            import threading
-            cls._lock = threading.Lock()
         return cls._instance
     
     def get_session(self, gateway_id: int):
         """Get or create a singleton session for the gateway with URLLC optimizations"""
+        # Fast path: lock-free lookup of an existing session
+        session = self._sessions.get(gateway_id)
+        if session is not None:
+            return session
         
         with self._lock:
             if gateway_id not in self._sessions:
@@ -276,59 +327,52 @@ class URLLCSessionManager:
     def close_session(self, gateway_id: int):
         """Close and remove session for specific gateway"""
         with self._lock:
-            if gateway_id in self._sessions:
-                try:
-                    self._sessions[gateway_id].close()
-                    print(f"[URLLC-SessionManager] Closed session for gateway {gateway_id}")
-                except Exception as e:
-                    print(f"[URLLC-SessionManager] Error closing session for gateway {gateway_id}: {e}")
-                finally:
-                    del self._sessions[gateway_id]
+            session = self._sessions.pop(gateway_id, None)
+        if session is not None:
+            try:
+                session.close()
+                print(f"[URLLC-SessionManager] Closed session for gateway {gateway_id}")
+            except Exception as e:
+                print(f"[URLLC-SessionManager] Error closing session for gateway {gateway_id}: {e}")
     
     def close_all_sessions(self):
         """Close all sessions - useful for cleanup"""
         with self._lock:
-            for gateway_id in list(self._sessions.keys()):
-                self.close_session(gateway_id)
-            print(f"[URLLC-SessionManager] Closed all sessions")
+            gateway_ids = list(self._sessions.keys())
+        for gateway_id in gateway_ids:
+            self.close_session(gateway_id)
+        print(f"[URLLC-SessionManager] Closed all sessions")
 
-# Global session manager instances - Serial request processing for true connection control
+# Global session manager instances (per-gateway registries; no global request lock)
 _redis_session_manager = URLLCRedisSessionManager()
 _local_session_manager = URLLCSessionManager()
 
-# Global request lock to serialize all HTTP requests (prevents connection multiplication)
-import threading
-_request_lock = threading.Lock()
-
 def get_session_for_gateway(gateway_id: int):
-    """Get singleton session for gateway - Redis-backed with local fallback and serialized access"""
-    with _request_lock:  # Serialize all session access
-        try:
-            return _redis_session_manager.get_session(gateway_id)
-        except Exception as e:
-            print(f"[SessionManager] Redis fallback to local: {e}")
-            return _local_session_manager.get_session(gateway_id)
+    """Get singleton session for gateway - Redis-backed with local fallback"""
+    try:
+        return _redis_session_manager.get_session(gateway_id)
+    except Exception as e:
+        print(f"[SessionManager] Redis fallback to local: {e}")
+        return _local_session_manager.get_session(gateway_id)
 
 def close_gateway_session(gateway_id: int):
     """Close specific gateway session in both Redis and local managers"""
-    with _request_lock:
-        try:
-            _redis_session_manager.close_session(gateway_id)
-        except Exception:
-            pass
-        try:
-            _local_session_manager.close_session(gateway_id)
-        except Exception:
-            pass
+    try:
+        _redis_session_manager.close_session(gateway_id)
+    except Exception:
+        pass
+    try:
+        _local_session_manager.close_session(gateway_id)
+    except Exception:
+        pass
 
 def close_all_sessions():
     """Close all HTTP sessions - Redis and local cleanup"""
-    with _request_lock:
-        try:
-            _redis_session_manager.close_all_sessions()
-        except Exception as e:
-            print(f"[SessionManager] Redis cleanup error: {e}")
-        try:
-            _local_session_manager.close_all_sessions()
-        except Exception as e:
-            print(f"[SessionManager] Local cleanup error: {e}")
+    try:
+        _redis_session_manager.close_all_sessions()
+    except Exception as e:
+        print(f"[SessionManager] Redis cleanup error: {e}")
+    try:
+        _local_session_manager.close_all_sessions()
+    except Exception as e:
+        print(f"[SessionManager] Local cleanup error: {e}")
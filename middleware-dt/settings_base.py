@@ -212,18 +212,130 @@ def _env_bool(name, default=False):
 
 USE_INFLUX_TO_EVALUATE = _env_bool("USE_INFLUX_TO_EVALUATE", True)
 ENABLE_INFLUX_LATENCY_MEASUREMENTS = _env_bool("ENABLE_INFLUX_LATENCY_MEASUREMENTS", False)
+
+# Batched InfluxDB writer (facade.influx): points are queued and flushed in the
+# background when INFLUX_BATCH_SIZE lines are pending or the oldest one is older
+# than INFLUX_FLUSH_INTERVAL seconds. When INFLUX_QUEUE_MAXSIZE is reached new
+# points are dropped (and counted) instead of blocking the caller. A failed batch
+# is retried INFLUX_WRITE_RETRIES times (backoff INFLUX_RETRY_BACKOFF, doubling),
+# then parked for one more attempt (at most INFLUX_MAX_REQUEUE batches) before
+# its points are dropped.
+INFLUX_BATCH_SIZE = int(os.getenv("INFLUX_BATCH_SIZE", 500))
+INFLUX_FLUSH_INTERVAL = float(os.getenv("INFLUX_FLUSH_INTERVAL", 0.2))
+INFLUX_QUEUE_MAXSIZE = int(os.getenv("INFLUX_QUEUE_MAXSIZE", 50000))
+INFLUX_WRITE_TIMEOUT = float(os.getenv("INFLUX_WRITE_TIMEOUT", 2.0))
+INFLUX_WRITE_RETRIES = int(os.getenv("INFLUX_WRITE_RETRIES", 3))
+INFLUX_RETRY_BACKOFF = float(os.getenv("INFLUX_RETRY_BACKOFF", 0.5))
+INFLUX_MAX_REQUEUE = int(os.getenv("INFLUX_MAX_REQUEUE", 20))
+
+# /systems/{id}/timeseries/query/: points per page (JSON / streamed) and the
+# short-TTL cache of identical queries (orchestrator.temporal; TTL 0 disables).
+TEMPORAL_QUERY_MAX_PAGE_SIZE = int(os.getenv("TEMPORAL_QUERY_MAX_PAGE_SIZE", 5000))
+TEMPORAL_QUERY_MAX_STREAM_PAGE_SIZE = int(os.getenv("TEMPORAL_QUERY_MAX_STREAM_PAGE_SIZE", 100000))
+TEMPORAL_QUERY_CACHE_TTL = float(os.getenv("TEMPORAL_QUERY_CACHE_TTL", 5))
+TEMPORAL_QUERY_CACHE_SIZE = int(os.getenv("TEMPORAL_QUERY_CACHE_SIZE", 256))
+
+# Shared ThingsBoard JWT cache (core.gateway_auth): tokens are refreshed
+# GATEWAY_TOKEN_REFRESH_MARGIN seconds before their `exp` claim; tokens without
+# `exp` are kept for GATEWAY_TOKEN_DEFAULT_TTL seconds.
+GATEWAY_TOKEN_REFRESH_MARGIN = float(os.getenv("GATEWAY_TOKEN_REFRESH_MARGIN", 60))
+GATEWAY_TOKEN_DEFAULT_TTL = float(os.getenv("GATEWAY_TOKEN_DEFAULT_TTL", 900))
+GATEWAY_LOGIN_TIMEOUT = float(os.getenv("GATEWAY_LOGIN_TIMEOUT", 5))
+
+# listen_gateway: share one telemetry WebSocket per gateway for all devices
+# (--multiplex), opening another socket above N subscriptions.
+LISTEN_GATEWAY_MULTIPLEX = _env_bool("LISTEN_GATEWAY_MULTIPLEX", False)
+LISTEN_GATEWAY_MAX_SUBSCRIPTIONS_PER_SOCKET = int(os.getenv("LISTEN_GATEWAY_MAX_SUBSCRIPTIONS_PER_SOCKET", 1000))
+# listen_gateway telemetry values are merged for TELEMETRY_FLUSH_INTERVAL seconds
+# and written with bulk UPDATEs; the (device, key) index is reloaded per device
+# every TELEMETRY_INDEX_REFRESH_INTERVAL seconds (or on an unknown key).
+TELEMETRY_FLUSH_INTERVAL = float(os.getenv("TELEMETRY_FLUSH_INTERVAL", 0.1))
+TELEMETRY_INDEX_REFRESH_INTERVAL = float(os.getenv("TELEMETRY_INDEX_REFRESH_INTERVAL", 300))
+# listen_gateway device liveness (orchestrator.liveness): a device is inactive
+# once it sends no telemetry for its inactivityTimeout; transitions are applied
+# every LIVENESS_CHECK_INTERVAL seconds and devices not known to be alive are
+# polled through the attributes API every LIVENESS_FALLBACK_POLL_INTERVAL (0 disables).
+# It is then the only writer of DigitalTwinInstance.active: check_device_status
+# and monitor refuse to start. With LIVENESS_ENABLED=False listen_gateway leaves
+# the status alone and the entrypoint starts check_device_status instead.
+LIVENESS_ENABLED = _env_bool("LIVENESS_ENABLED", True)
+LIVENESS_CHECK_INTERVAL = float(os.getenv("LIVENESS_CHECK_INTERVAL", 1.0))
+LIVENESS_FALLBACK_POLL_INTERVAL = float(os.getenv("LIVENESS_FALLBACK_POLL_INTERVAL", 300))
+# Async twoway RPC engine (facade.rpc): maximum concurrent RPCs (and keep-alive
+# connections) per gateway; extra callers wait for a free slot.
+RPC_MAX_INFLIGHT_PER_GATEWAY = int(os.getenv("RPC_MAX_INFLIGHT_PER_GATEWAY", 1024))
+RPC_KEEPALIVE_TIMEOUT = float(os.getenv("RPC_KEEPALIVE_TIMEOUT", 30))
+# Adaptive (AIMD) per-gateway RPC concurrency: starts at RPC_AIMD_INITIAL_LIMIT,
+# grows on fast successes and is multiplied by RPC_AIMD_BACKOFF on timeouts,
+# overload statuses or answers slower than 80% of the profile timeout.
+RPC_AIMD_INITIAL_LIMIT = int(os.getenv("RPC_AIMD_INITIAL_LIMIT", 32))
+RPC_AIMD_MIN_LIMIT = int(os.getenv("RPC_AIMD_MIN_LIMIT", 1))
+RPC_AIMD_BACKOFF = float(os.getenv("RPC_AIMD_BACKOFF", 0.7))
+# Per-device circuit breaker: open after N consecutive failed RPCs (0 disables),
+# retry a single probe after RPC_BREAKER_RESET_TIMEOUT seconds.
+RPC_BREAKER_FAILURE_THRESHOLD = int(os.getenv("RPC_BREAKER_FAILURE_THRESHOLD", 5))
+RPC_BREAKER_RESET_TIMEOUT = float(os.getenv("RPC_BREAKER_RESET_TIMEOUT", 10))
+# update_causal_property: commands in flight globally / per gateway, and threads
+# for the DB side of each save.
+CAUSAL_UPDATE_MAX_INFLIGHT = int(os.getenv("CAUSAL_UPDATE_MAX_INFLIGHT", 256))
+CAUSAL_UPDATE_MAX_INFLIGHT_PER_GATEWAY = int(os.getenv("CAUSAL_UPDATE_MAX_INFLIGHT_PER_GATEWAY", 64))
+CAUSAL_UPDATE_DB_WORKERS = int(os.getenv("CAUSAL_UPDATE_DB_WORKERS", 8))
+# Hot-path logging (Property/DT property saves, RPC engine, update_causal_property):
+# records are formatted and written by a background thread (core.structured_logging).
+# HOTPATH_LOG_FORMAT: text keeps the previous "[timestamp] ..." lines, json emits one object per line.
+HOTPATH_LOG_LEVEL = os.getenv("HOTPATH_LOG_LEVEL", "INFO")
+HOTPATH_LOG_FORMAT = os.getenv("HOTPATH_LOG_FORMAT", "text")
+HOTPATH_LOG_TIMING = _env_bool('HOTPATH_LOG_TIMING', False)
 DTDL_PARSER_URL = os.getenv("DTDL_PARSER_URL", "http://parser:8080/api/DTDLModels/parse/")
+# Parser output cached by specification content (orchestrator.DTDLParseCache) and
+# concurrent parser requests for the cache misses of a multi-model upload.
+# DTDL_PARSE_CACHE_VERSION is part of the cache key: change it after upgrading
+# or fixing the parser to re-parse every specification.
+DTDL_PARSE_CACHE = _env_bool('DTDL_PARSE_CACHE', True)
+DTDL_PARSE_CACHE_VERSION = os.getenv("DTDL_PARSE_CACHE_VERSION", "1")
+DTDL_PARSER_MAX_WORKERS = int(os.getenv("DTDL_PARSER_MAX_WORKERS", 4))
 
 # Device type mapping configuration: when True, the orchestrator will
 # attempt to create properties from a static mapping file. For testing we
 # allow disabling this so telemetry-based inference is used alone.
 DEVICE_TYPE_MAPPING_ENABLED = _env_bool('DEVICE_TYPE_MAPPING_ENABLED', True)
 
+# Autobinding: sentence-transformers model, semantic neighbours scored per DT
+# property, how many loaded models are kept (LRU), and the embedding cache
+# (bounded in-memory LRU in front of the orchestrator.SentenceEmbedding table).
+AUTOBINDING_MODEL_NAME = os.getenv("AUTOBINDING_MODEL_NAME", "all-MiniLM-L6-v2")
+AUTOBINDING_TOP_K = int(os.getenv("AUTOBINDING_TOP_K", 32))
+SENTENCE_MODEL_CACHE_SIZE = int(os.getenv("SENTENCE_MODEL_CACHE_SIZE", 2))
+EMBEDDING_MEMORY_CACHE_SIZE = int(os.getenv("EMBEDDING_MEMORY_CACHE_SIZE", 100000))
+EMBEDDING_ENCODE_BATCH_SIZE = int(os.getenv("EMBEDDING_ENCODE_BATCH_SIZE", 256))
+EMBEDDING_DB_CACHE = _env_bool('EMBEDDING_DB_CACHE', True)
+# Only compare DT/device properties whose root identifier ("house 77") matches;
+# properties without one are compared with everything (orchestrator.blocking).
+AUTOBINDING_BLOCKING_ENABLED = _env_bool('AUTOBINDING_BLOCKING_ENABLED', True)
+
+# Autobinding ANN index: per-organization HNSW graph (hnswlib, exact search
+# when it is not installed) over device-property embeddings, used once the
+# candidate set reaches AUTOBINDING_ANN_MIN_CANDIDATES. Neighbours are
+# oversampled to survive the candidate filters (the fetch widens until enough
+# survive; scopes under 1/OVERSAMPLE of the index are scored exactly); the index is rebuilt every
+# AUTOBINDING_ANN_REFRESH_INTERVAL seconds.
+AUTOBINDING_ANN_ENABLED = _env_bool('AUTOBINDING_ANN_ENABLED', True)
+AUTOBINDING_ANN_MIN_CANDIDATES = int(os.getenv("AUTOBINDING_ANN_MIN_CANDIDATES", 20000))
+AUTOBINDING_ANN_OVERSAMPLE = int(os.getenv("AUTOBINDING_ANN_OVERSAMPLE", 4))
+AUTOBINDING_ANN_REFRESH_INTERVAL = int(os.getenv("AUTOBINDING_ANN_REFRESH_INTERVAL", 600))
+AUTOBINDING_ANN_M = int(os.getenv("AUTOBINDING_ANN_M", 32))
+AUTOBINDING_ANN_EF_CONSTRUCTION = int(os.getenv("AUTOBINDING_ANN_EF_CONSTRUCTION", 400))
+AUTOBINDING_ANN_EF_SEARCH = int(os.getenv("AUTOBINDING_ANN_EF_SEARCH", 256))
+
 # Digital Twin Settings
 DEFAULT_INACTIVITY_TIMEOUT = 60
 # Controla integração com Neo4j. Por padrão desabilitado para evitar tentativas
 # de conexão em ambientes que não têm Neo4j disponível.
 USE_NEO4J = _env_bool('USE_NEO4J', False)
+# Outbox drained by `manage.py drain_neo4j_outbox`: entries per UNWIND batch and
+# poll interval (seconds) while the outbox is empty.
+NEO4J_OUTBOX_BATCH_SIZE = int(os.getenv("NEO4J_OUTBOX_BATCH_SIZE", 1000))
+NEO4J_OUTBOX_POLL_INTERVAL = float(os.getenv("NEO4J_OUTBOX_POLL_INTERVAL", 0.5))
 
 # Cypher query execution settings: timeout (seconds) and maximum rows returned
 # These can be overridden via environment variables `CYPHER_QUERY_TIMEOUT` and
@@ -5,7 +5,8 @@ from django.urls import path
 from core.models import Organization
 from orchestrator.forms import DigitalTwinInstanceAdminForm, DigitalTwinInstancePropertyAdminForm, DigitalTwinInstancePropertyInlineForm, DigitalTwinInstanceRelationshipInlineForm
 from core.parser_client import get_dtdl_parser_url
-from .models import DigitalTwinInstanceRelationship, SystemContext, DTDLModel, DigitalTwinInstance, DigitalTwinInstanceProperty, ModelElement, ModelRelationship
+from orchestrator.dtdl_parser import specification_hash
+from .models import DigitalTwinInstanceRelationship, SystemContext, DTDLModel, DTDLParseCache, DigitalTwinInstance, DigitalTwinInstanceProperty, ModelElement, ModelRelationship
 
 
 def _filter_system_queryset(queryset, request, field_name='organization'):
@@ -89,6 +90,11 @@ class DTDLModelAdmin(admin.ModelAdmin):
                 if response.status_code in [200, 201]:
                     obj.parsed_specification = response.json()
                     obj.save()
+                    # Reparse explícito: atualiza também o cache por conteúdo
+                    DTDLParseCache.objects.update_or_create(
+                        specification_hash=specification_hash(specification),
+                        defaults={'parsed_specification': obj.parsed_specification},
+                    )
                     self.message_user(request, f"Specification sent successfully for model {obj.name}.")
                 else:
                     self.message_user(request, f"{response.text}. Status code: {response.status_code}", level='error')
@@ -0,0 +1,286 @@
+# --- Per-organization approximate nearest-neighbour index over device-property embeddings ---
+import logging
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from orchestrator.embeddings import encode_texts, top_k_similar
+
+logger = logging.getLogger(__name__)
+
+try:
+    import hnswlib
+except ImportError:  # optional: exact (brute-force) search is used instead
+    hnswlib = None
+
+
+class _ExactBackend:
+    """Brute-force cosine search over unit vectors (fallback without hnswlib)."""
+
+    def __init__(self, dim):
+        self.dim = dim
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+
+    def upsert(self, ids, vectors):
+        keep = ~np.isin(self._ids, ids)
+        self._ids = np.concatenate([self._ids[keep], np.asarray(ids, dtype=np.int64)])
+        self._vectors = np.vstack([self._vectors[keep], vectors])
+
+    def remove(self, ids):
+        keep = ~np.isin(self._ids, list(ids))
+        self._ids, self._vectors = self._ids[keep], self._vectors[keep]
+
+    def vectors(self, ids):
+        """(ids, vectors) of the given ids that are indexed."""
+        keep = np.isin(self._ids, np.fromiter((int(i) for i in ids), dtype=np.int64))
+        return self._ids[keep], self._vectors[keep]
+
+    def search(self, queries, k):
+        results = []
+        for _, idx, scores in top_k_similar(queries, self._vectors, k):
+            results.append((self._ids[idx], scores))
+        return results
+
+    def __len__(self):
+        return len(self._ids)
+
+
+class _HNSWBackend:
+    """hnswlib graph in inner-product space (== cosine for unit vectors)."""
+
+    def __init__(self, dim, capacity=1024):
+        self.dim = dim
+        self._labels = set()
+        self._index = hnswlib.Index(space="ip", dim=dim)
+        self._index.init_index(
+            max_elements=max(1024, capacity),
+            ef_construction=getattr(settings, 'AUTOBINDING_ANN_EF_CONSTRUCTION', 400),
+            M=getattr(settings, 'AUTOBINDING_ANN_M', 32),
+            allow_replace_deleted=True,
+        )
+
+    def upsert(self, ids, vectors):
+        ids = [int(i) for i in ids]
+        for label in ids:
+            if label in self._labels:
+                # Re-adding a label overwrites its vector; make sure it is searchable again
+                try:
+                    self._index.unmark_deleted(label)
+                except RuntimeError:
+                    pass
+        needed = self._index.get_current_count() + len(ids)
+        if needed > self._index.get_max_elements():
+            self._index.resize_index(max(needed, self._index.get_max_elements() * 2))
+        self._index.add_items(vectors, ids, replace_deleted=True)
+        self._labels.update(ids)
+
+    def remove(self, ids):
+        for label in ids:
+            if label in self._labels:
+                self._index.mark_deleted(int(label))
+                self._labels.discard(label)
+
+    def vectors(self, ids):
+        """(ids, vectors) of the given ids that are indexed."""
+        labels = [int(i) for i in ids if int(i) in self._labels]
+        if not labels:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, self.dim), dtype=np.float32)
+        return np.asarray(labels, dtype=np.int64), np.asarray(self._index.get_items(labels), dtype=np.float32)
+
+    def search(self, queries, k):
+        k = min(k, len(self._labels))
+        if k == 0:
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in range(len(queries))]
+        self._index.set_ef(max(k * 2, getattr(settings, 'AUTOBINDING_ANN_EF_SEARCH', 256)))
+        try:
+            labels, distances = self._index.knn_query(queries, k=k)
+        except RuntimeError:
+            # Fewer than k reachable elements (many deleted ones); go row by row with a smaller k
+            return [self._search_row(query, k) for query in queries]
+        # ip distance is 1 - dot product
+        return [(labels[i].astype(np.int64), 1.0 - distances[i]) for i in range(len(queries))]
+
+    def _search_row(self, query, k):
+        while k > 0:
+            try:
+                labels, distances = self._index.knn_query(query, k=k)
+                return labels[0].astype(np.int64), 1.0 - distances[0]
+            except RuntimeError:
+                k //= 2
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+    def __len__(self):
+        return len(self._labels)
+
+
+class DevicePropertyIndex:
+    """Nearest device properties of one organization for a batch of DT-property embeddings.
+
+    Kept in sync incrementally: signals report created/changed/deleted Property
+    rows of this process, and every search also diffs the organization's
+    property ids so rows written by other processes are picked up. The whole
+    index is rebuilt (from cached embeddings) every AUTOBINDING_ANN_REFRESH_INTERVAL
+    seconds to catch renames made elsewhere.
+    """
+
+    def __init__(self, organization_id):
+        self.organization_id = organization_id
+        self.backend = None
+        self.built_at = 0.0
+        self._ids = set()
+        self._changed = set()
+        self._deleted = set()
+        self._lock = threading.RLock()
+
+    # -- change notifications (cheap, called from signals) --
+    def note_changed(self, property_id):
+        with self._lock:
+            self._changed.add(property_id)
+
+    def note_deleted(self, property_id):
+        with self._lock:
+            self._deleted.add(property_id)
+            self._changed.discard(property_id)
+
+    # -- maintenance --
+    def _properties(self):
+        from facade.models import Property
+
+        return Property.objects.filter(device__organization_id=self.organization_id)
+
+    def _embed(self, property_ids):
+        from orchestrator.helpers import _build_device_property_text
+
+        props = list(self._properties().filter(id__in=property_ids).select_related("device", "device__type"))
+        if not props:
+            return [], None
+        return [p.id for p in props], encode_texts([_build_device_property_text(p) for p in props])
+
+    def _rebuild(self):
+        ids = list(self._properties().values_list("id", flat=True))
+        backend = None
+        for i in range(0, len(ids), 5000):
+            chunk_ids, vectors = self._embed(ids[i:i + 5000])
+            if not chunk_ids:
+                continue
+            if backend is None:
+                backend = _HNSWBackend(vectors.shape[1], len(ids)) if hnswlib is not None else _ExactBackend(vectors.shape[1])
+            backend.upsert(chunk_ids, vectors)
+        self.backend = backend
+        self._ids = set(ids)
+        self._changed.clear()
+        self._deleted.clear()
+        self.built_at = time.monotonic()
+        logger.info(f"ANN index for organization {self.organization_id}: {len(ids)} device properties "
+                    f"({'hnsw' if hnswlib is not None else 'exact'})")
+
+    def _apply_changes(self):
+        current = set(self._properties().values_list("id", flat=True))
+        deleted = (self._ids - current) | (self._deleted & self._ids)
+        changed = (current - self._ids) | (self._changed & current)
+        if deleted and self.backend is not None:
+            self.backend.remove(deleted)
+        if changed:
+            chunk_ids, vectors = self._embed(changed)
+            if chunk_ids:
+                if self.backend is None:
+                    self.backend = _HNSWBackend(vectors.shape[1], len(chunk_ids)) if hnswlib is not None else _ExactBackend(vectors.shape[1])
+                self.backend.upsert(chunk_ids, vectors)
+        self._ids = current
+        self._changed.clear()
+        self._deleted.clear()
+
+    def sync(self):
+        with self._lock:
+            max_age = getattr(settings, 'AUTOBINDING_ANN_REFRESH_INTERVAL', 600)
+            if self.backend is None or time.monotonic() - self.built_at > max_age:
+                self._rebuild()
+            else:
+                self._apply_changes()
+
+    def search(self, queries, k, allowed_ids=None):
+        """Per query row: (property ids, scores) of the nearest neighbours, best first.
+
+        With `allowed_ids` (a subset of the indexed ids): a scope smaller than
+        1/AUTOBINDING_ANN_OVERSAMPLE of the index is scored exactly against its
+        own vectors; a larger one fetches k * AUTOBINDING_ANN_OVERSAMPLE
+        neighbours and widens the fetch until every row has k allowed ones
+        (or the whole index was fetched).
+        """
+        self.sync()
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+        with self._lock:
+            size = len(self.backend) if self.backend is not None else 0
+            if size == 0:
+                return [empty for _ in range(len(queries))]
+            if allowed_ids is None or len(allowed_ids) >= size:
+                results = self.backend.search(queries, min(k, size))
+                if allowed_ids is None:
+                    return results
+                return [self._filter(labels, scores, allowed_ids, k) for labels, scores in results]
+
+            oversample = getattr(settings, 'AUTOBINDING_ANN_OVERSAMPLE', 4)
+            if len(allowed_ids) * oversample < size:
+                ids, vectors = self.backend.vectors(allowed_ids)
+                results = [empty for _ in range(len(queries))]
+                for row, idx, scores in top_k_similar(queries, vectors, k):
+                    results[row] = (ids[idx], scores)
+                return results
+
+            wanted = min(k, len(allowed_ids))
+            fetch = k * oversample
+            while True:
+                fetch = min(fetch, size)
+                filtered = [
+                    self._filter(labels, scores, allowed_ids, k) for labels, scores in self.backend.search(queries, fetch)
+                ]
+                if fetch >= size or all(len(labels) >= wanted for labels, _ in filtered):
+                    return filtered
+                fetch *= 2
+
+    @staticmethod
+    def _filter(labels, scores, allowed_ids, k):
+        keep = np.fromiter((int(label) in allowed_ids for label in labels), dtype=bool, count=len(labels))
+        return labels[keep][:k], scores[keep][:k]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "organization_id": self.organization_id,
+                "size": len(self.backend) if self.backend is not None else 0,
+                "backend": "hnsw" if hnswlib is not None else "exact",
+                "pending_changed": len(self._changed),
+                "pending_deleted": len(self._deleted),
+            }
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_device_property_index(organization_id):
+    index = _indexes.get(organization_id)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(organization_id)
+            if index is None:
+                index = DevicePropertyIndex(organization_id)
+                _indexes[organization_id] = index
+    return index
+
+
+def has_device_property_indexes():
+    return bool(_indexes)
+
+
+def notify_property_changed(property_id):
+    for index in list(_indexes.values()):
+        index.note_changed(property_id)
+
+
+def notify_property_deleted(property_id):
+    for index in list(_indexes.values()):
+        index.note_deleted(property_id)
@@ -27,7 +27,6 @@ from orchestrator.schemas import (
     InfluxTemporalQuerySchema,
     PutDTDLModelSchema,
     SystemContextSchema,
-    TemporalPointSchema,
     CreateSystemContextSchema,
     CreateDTDLModelSchema,
     DTDLModelSchema,
@@ -54,9 +53,9 @@ from sentence_transformers import SentenceTransformer, util
 from orchestrator.utils import normalize_name
 from django.conf import settings
 from django.utils.text import slugify
-import csv
-import io
+import json
 import requests
+from django.http import StreamingHttpResponse
 from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
 
 router = Router()
@@ -80,8 +79,15 @@ from .helpers import (
     _extract_identifier_tokens,
     _compute_hybrid_match_score,
     _suggest_autobinding_candidates,
-    _parse_influx_csv_points,
-    compute_similarity,
+)
+from orchestrator.dtdl_parser import parse_specifications
+from orchestrator.instantiation import RelationshipResolver, instantiate, match_models, resolve_tree, tree_names
+from orchestrator.temporal import (
+    build_flux_query,
+    get_temporal_query_cache,
+    iter_influx_csv_rows,
+    next_cursor,
+    point_from_row,
 )
 
 
@@ -152,19 +158,25 @@ def create_multiple_dtdlmodels(request, system_id: int, payload: List[DTDLSpecif
     if not user or not getattr(user, "is_authenticated", False):
         raise HttpError(403, "Authentication required")
     system = _get_scoped_system_or_404(request, system_id)
+    specifications = [
+        {
+            "@id": spec.id,
+            "@type": spec.type,
+            "@context": spec.context,
+            "contents": spec.contents,
+            "displayName": spec.displayName
+        }
+        for spec in payload
+    ]
+    # Um único lote para o parser (só especificações ainda não vistas); os saves abaixo leem do cache
+    parse_specifications(specifications)
     created_models = []
-    for spec in payload:
+    for spec, specification in zip(payload, specifications):
         payload_data = {
             "system": system,
             "name": spec.displayName,
             "created_by": user,
-            "specification": {
-                "@id": spec.id,
-                "@type": spec.type,
-                "@context": spec.context,
-                "contents": spec.contents,
-                "displayName": spec.displayName
-            }
+            "specification": specification,
         }
         dtdlmodel = DTDLModel.objects.create(**payload_data)
         created_models.append(dtdlmodel)
@@ -305,6 +317,18 @@ def neo4j_test(request, system_id: int):
         raise HttpError(400, str(e))
 
 
+@router.get(
+    "/neo4j/outbox/",
+    response={200: dict},
+    tags=["Orchestrator"],
+    summary="Neo4j outbox backlog and lag",
+    description="Pending twin-graph changes not yet applied by drain_neo4j_outbox, the age of the oldest one (lag_seconds) and this worker's drain counters.",
+)
+def neo4j_outbox_metrics(request):
+    from orchestrator.neo4j_outbox import outbox_stats
+    return outbox_stats()
+
+
 @router.get(
     "/orchestrator/debug-auth/",
     tags=["Orchestrator"],
@@ -356,13 +380,25 @@ def create_instances_batch(request, system_id: int, payload: DTDLModelIDSchema):
         if not user or not getattr(user, "is_authenticated", False):
             raise HttpError(403, "Authentication required")
         _get_scoped_system_or_404(request, system_id)
-        created_instances = []
-        for id_model in payload.dtdl_model_ids:
-            dtdl_model = DTDLModel.objects.get(id=id_model, system_id=system_id)
-            dt_instance = dtdl_model.create_dt_instance()
-            created_instances.append(
-                {"id": dt_instance.id, "model_name": dtdl_model.name, "properties": []}
-            )
+        dtdl_models = DTDLModel.objects.in_bulk(payload.dtdl_model_ids)
+        if any(
+            model_id not in dtdl_models or dtdl_models[model_id].system_id != system_id
+            for model_id in payload.dtdl_model_ids
+        ):
+            raise DTDLModel.DoesNotExist
+        instances = instantiate(
+            [{"model": dtdl_models[model_id], "name": "", "children": []} for model_id in payload.dtdl_model_ids]
+        )
+        # Relacionamentos do modelo (primeira instância -> primeira do alvo), uma vez por modelo
+        linked = set()
+        for dt_instance in instances:
+            if dt_instance.model_id not in linked:
+                linked.add(dt_instance.model_id)
+                dt_instance.link_model_relationships()
+        created_instances = [
+            {"id": dt_instance.id, "model_name": dt_instance.model.name, "properties": []}
+            for dt_instance in instances
+        ]
         return {"created_instances": created_instances}
     except DTDLModel.DoesNotExist:
         raise HttpError(404, f"Model with ID not found in system {system_id}")
@@ -483,8 +519,9 @@ def update_causal_property(
             from facade.utils import format_influx_line
             from django.conf import settings as _dj_settings
 
+            from facade.influx import write_influx_line
+
             INFLUXDB_TOKEN = getattr(_dj_settings, 'INFLUXDB_TOKEN', None)
-            INFLUXDB_URL = getattr(_dj_settings, 'INFLUXDB_URL', None)
             USE_INFLUX_TO_EVALUATE = getattr(_dj_settings, 'USE_INFLUX_TO_EVALUATE', False)
             ENABLE_INFLUX_LATENCY_MEASUREMENTS = getattr(_dj_settings, 'ENABLE_INFLUX_LATENCY_MEASUREMENTS', False)
 
@@ -510,17 +547,10 @@ def update_causal_property(
                 }
                 data = format_influx_line("latency_measurement", tags, fields, timestamp=response_timestamp)
                 
-                import requests
-                resp = requests.post(
-                    INFLUXDB_URL,
-                    headers={"Authorization": f"Token {INFLUXDB_TOKEN}", "Content-Type": "text/plain"},
-                    data=data,
-                    timeout=0.5
-                )
-                if resp.status_code == 204:
+                if write_influx_line(data):
                     print(f"[M2S-RESPONSE] ✅ Logged received_timestamp for {sensor_id} (correlation_id={correlation_id})")
                 else:
-                    print(f"[M2S-RESPONSE] ⚠️ Failed: {resp.status_code} - {resp.text}")
+                    print(f"[M2S-RESPONSE] ⚠️ Failed: Influx queue full")
             else:
                 print(f"[M2S-RESPONSE] SKIP - latency measurements disabled or missing data")
         except Exception as e:
@@ -841,7 +871,9 @@ def apply_autobinding(request, system_id: int, payload: AutoBindingApplyRequestS
     response=InfluxTemporalQueryResponseSchema,
     tags=["Orchestrator"],
     summary="Query temporal data from InfluxDB",
-    description="Queries time series with organization and system scope checks. Requires device_identifier for strict scoping.",
+    description="Queries time series with organization and system scope checks. Requires device_identifier for strict scoping. "
+                "Pages are ordered by time; pass `next_cursor` back as `cursor` for the next page. `window`/`fn` aggregate server-side "
+                "(aggregateWindow) and `stream` returns a chunked JSON body. Identical queries are cached for TEMPORAL_QUERY_CACHE_TTL seconds.",
     openapi_extra={
         "requestBody": {
             "content": {
@@ -865,6 +897,16 @@ def apply_autobinding(request, system_id: int, payload: AutoBindingApplyRequestS
                                 "limit": 200
                             }
                         },
+                        "aggregated_next_page": {
+                            "value": {
+                                "dt_property_id": 42,
+                                "last_minutes": 1440,
+                                "window": "5m",
+                                "fn": "mean",
+                                "limit": 288,
+                                "cursor": "WyIyMDI2LTAxLTAxVDAwOjAwOjAwWiIsIDFd"
+                            }
+                        },
                         "from_dtinstance_and_property": {
                             "value": {
                                 "dtinstance_id": 15,
@@ -936,26 +978,32 @@ def query_temporal_data(request, system_id: int, payload: InfluxTemporalQuerySch
         raise HttpError(400, "InfluxDB is not fully configured")
 
     measurement = payload.measurement or "latency_measurement"
-    limit = max(1, min(int(payload.limit), 5000))
-    if payload.start and payload.stop:
-        range_clause = f'|> range(start: time(v: "{payload.start}"), stop: time(v: "{payload.stop}"))'
-    else:
-        last_minutes = max(1, int(payload.last_minutes))
-        range_clause = f"|> range(start: -{last_minutes}m)"
-
-    field_filter = ""
-    if property_name:
-        field_filter = f'|> filter(fn: (r) => r["_field"] == "{property_name}")'
-
-    flux_query = (
-        f'from(bucket: "{influx_bucket}")\n'
-        f'{range_clause}\n'
-        f'|> filter(fn: (r) => r["_measurement"] == "{measurement}")\n'
-        f'|> filter(fn: (r) => r["sensor"] == "{payload.device_identifier}")\n'
-        f'{field_filter}\n'
-        f'|> sort(columns: ["_time"], desc: false)\n'
-        f'|> limit(n: {limit})'
-    )
+    max_limit = getattr(settings, "TEMPORAL_QUERY_MAX_STREAM_PAGE_SIZE" if payload.stream else "TEMPORAL_QUERY_MAX_PAGE_SIZE", 5000)
+    limit = max(1, min(int(payload.limit), int(max_limit)))
+    try:
+        flux_query = build_flux_query(
+            influx_bucket, measurement, device_identifier, property_name,
+            start=payload.start if payload.start and payload.stop else None,
+            stop=payload.stop if payload.start and payload.stop else None,
+            last_minutes=payload.last_minutes, limit=limit,
+            cursor=payload.cursor, window=payload.window, fn=payload.fn,
+        )
+    except ValueError as e:
+        raise HttpError(400, str(e))
+
+    cache = get_temporal_query_cache()
+    cache_key = cache.key(influx_org, flux_query)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        points, cursor = cached
+        if payload.stream:
+            return _stream_temporal_page(system_context.id, device_identifier, iter(points), lambda: cursor)
+        return InfluxTemporalQueryResponseSchema(
+            system_id=system_context.id,
+            device_identifier=device_identifier,
+            points=points,
+            next_cursor=cursor,
+        )
 
     query_url = f"http://{influx_host}:{influx_port}/api/v2/query?org={influx_org}"
     response = requests.post(
@@ -967,35 +1015,74 @@ def query_temporal_data(request, system_id: int, payload: InfluxTemporalQuerySch
         },
         data=flux_query,
         timeout=10,
+        stream=True,
     )
     if response.status_code != 200:
-        raise HttpError(response.status_code, response.text)
-
-    raw_points = _parse_influx_csv_points(response.text)
-    points = []
-    for row in raw_points:
-        points.append(
-            TemporalPointSchema(
-                time=row.get("_time", ""),
-                measurement=row.get("_measurement", ""),
-                field=row.get("_field", ""),
-                value=row.get("_value"),
-                device_identifier=row.get("sensor"),
-                tags={
-                    "direction": row.get("direction"),
-                    "source": row.get("source"),
-                    "correlation_id": row.get("correlation_id"),
-                },
-            )
-        )
+        try:
+            detail = response.text
+        finally:
+            response.close()  # streamed: give the connection back to the pool
+        raise HttpError(response.status_code, detail)
+
+    # limit + 1 rows were requested: the extra one only tells whether there is a next page
+    rows = []
+    page_state = {"cursor": None}
 
+    def _points():
+        try:
+            for row in iter_influx_csv_rows(response.iter_lines(decode_unicode=True)):
+                rows.append({"_time": row.get("_time")})
+                if len(rows) > limit:
+                    break
+                yield point_from_row(row)
+        finally:
+            response.close()
+        page_state["cursor"] = next_cursor(rows, limit, payload.cursor)
+
+    if payload.stream:
+        def _points_cached():
+            collected = []
+            for point in _points():
+                if len(collected) < getattr(settings, "TEMPORAL_QUERY_MAX_PAGE_SIZE", 5000):
+                    collected.append(point)
+                yield point
+            if len(collected) == len(rows[:limit]):
+                cache.put(cache_key, (collected, page_state["cursor"]))
+
+        return _stream_temporal_page(system_context.id, device_identifier, _points_cached(), lambda: page_state["cursor"])
+
+    points = list(_points())
+    cache.put(cache_key, (points, page_state["cursor"]))
     return InfluxTemporalQueryResponseSchema(
         system_id=system_context.id,
-        device_identifier=payload.device_identifier,
+        device_identifier=device_identifier,
         points=points,
+        next_cursor=page_state["cursor"],
     )
 
 
+def _stream_temporal_page(system_id, device_identifier, points, get_next_cursor, chunk_size=500):
+    """Chunked JSON body with the shape of InfluxTemporalQueryResponseSchema.
+
+    `get_next_cursor` is called once `points` is exhausted.
+    """
+    def _body():
+        yield json.dumps({"system_id": system_id, "device_identifier": device_identifier})[:-1] + ', "points": ['
+        chunk = []
+        first = True
+        for point in points:
+            chunk.append(json.dumps(point))
+            if len(chunk) >= chunk_size:
+                yield ("" if first else ", ") + ", ".join(chunk)
+                first = False
+                chunk = []
+        if chunk:
+            yield ("" if first else ", ") + ", ".join(chunk)
+        yield f'], "next_cursor": {json.dumps(get_next_cursor())}}}'
+
+    return StreamingHttpResponse(_body(), content_type="application/json")
+
+
 @router.post(
     "/systems/{system_id}/instances/query/",
     tags=["Orchestrator"],
@@ -1150,63 +1237,11 @@ def create_hierarchical_instances(
     if similarity_threshold < 0.0 or similarity_threshold > 1.0:
         raise HttpError(400, "similarity_threshold must be between 0.0 and 1.0")
 
+    # Um único cálculo de similaridade para todos os nomes e os nós criados em lote
     dtdl_models = list(DTDLModel.objects.filter(system=system_context))
-    created_instances = []
-
-    def find_best_model(name):
-        if not dtdl_models:
-            return None, 0.0
-        best_idx = None
-        best_score = 0.0
-        for idx, m in enumerate(dtdl_models):
-            score = float(compute_similarity(name, m.name))
-            if score > best_score:
-                best_score = score
-                best_idx = idx
-        if best_idx is not None and best_score >= float(similarity_threshold):
-            return dtdl_models[best_idx], best_score
-        return None, best_score
-
-    def recursive_create(tree, parent_instance=None):
-        if not isinstance(tree, dict):
-            return
-        for twin_name, children in tree.items():
-            best_model, score = find_best_model(twin_name)
-            if not best_model:
-                print(f"[MIDDTS] Nenhum modelo DTDL sugerido para '{twin_name}' (score={score:.2f})")
-                continue
-            dt_instance = DigitalTwinInstance.objects.create(model=best_model, name=twin_name)
-            created_instances.append(dt_instance)
-            if parent_instance:
-                # Buscar relacionamento permitido entre os modelos
-                # Corrigido: target pode ser apenas o prefixo do dtdl_id (ex: target='dtmi:housegen:Room', dtdl_id='dtmi:housegen:Room;1')
-                rel = ModelRelationship.objects.filter(
-                    dtdl_model=parent_instance.model,
-                    target__in=[
-                        best_model.dtdl_id,
-                        best_model.dtdl_id.split(';')[0]
-                    ]
-                ).first()
-                # Se não achou, tenta por prefixo (startswith)
-                if not rel:
-                    rel = ModelRelationship.objects.filter(
-                        dtdl_model=parent_instance.model,
-                        target__startswith=best_model.dtdl_id.split(';')[0]
-                    ).first()
-                if rel:
-                    DigitalTwinInstanceRelationship.objects.create(
-                        source_instance=parent_instance,
-                        target_instance=dt_instance,
-                        relationship=rel
-                    )
-                else:
-                    print(f"[MIDDTS] Aviso: Sem relacionamento entre '{parent_instance.model.name}' e '{best_model.name}' (target esperado: '{best_model.dtdl_id.split(';')[0]}')")
-            # Recursão para filhos
-            if isinstance(children, dict) and children:
-                recursive_create(children, dt_instance)
-            DigitalTwinInstanceProperty.associate_all_for_instance(dt_instance)
-
-    recursive_create(data)
+    matches = match_models(tree_names(data), dtdl_models, similarity_threshold)
+    roots = resolve_tree(data, matches, RelationshipResolver(system_context))
+    created_instances = instantiate(roots)
     # Retorna lista de dicts com id e nome para facilitar debug/consumo
     return [{"id": inst.id, "name": inst.name, "model": inst.model.name} for inst in created_instances]
 
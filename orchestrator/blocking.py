@@ -0,0 +1,48 @@
+# --- Blocking for autobinding: compare only DT/device properties of the same root entity ---
+#
+# The blocking key of a name is its first "<word> <number>" identifier after
+# normalize_name ("House 77 - Room 1 - Light" -> "house 77"); for a DT property
+# it is taken from the root of its hierarchy, for a device property from the
+# device name. Keys present on both sides form blocks. Items with no key, or
+# with a key the other side does not have, go to the fallback bucket: fallback
+# DT properties are compared with every device property and fallback device
+# properties with every DT property, so blocking never hides a pair that has
+# no better-identified counterpart.
+import re
+from collections import defaultdict, namedtuple
+
+from orchestrator.utils import normalize_name
+
+_BLOCKING_KEY_RE = re.compile(r"\b([a-z]+) (\d+)\b")
+
+# rows/cols index the DT-side and device-side lists; key is None for the fallback block
+Block = namedtuple("Block", ["key", "rows", "cols"])
+
+
+def extract_blocking_key(name):
+    match = _BLOCKING_KEY_RE.search(normalize_name(name or ""))
+    return f"{match.group(1)} {match.group(2)}" if match else None
+
+
+def build_blocks(dt_keys, device_keys):
+    """Blocks for DT-side keys `dt_keys` and device-side keys `device_keys` (None = no key)."""
+    dt_by_key = defaultdict(list)
+    device_by_key = defaultdict(list)
+    for row, key in enumerate(dt_keys):
+        dt_by_key[key].append(row)
+    for col, key in enumerate(device_keys):
+        device_by_key[key].append(col)
+
+    shared = [key for key in dt_by_key if key is not None and key in device_by_key]
+    shared_set = set(shared)
+    dt_fallback = [row for key, rows in dt_by_key.items() if key not in shared_set for row in rows]
+    device_fallback = [col for key, cols in device_by_key.items() if key not in shared_set for col in cols]
+
+    blocks = [Block(key, dt_by_key[key], device_by_key[key] + device_fallback) for key in shared]
+    if dt_fallback:
+        blocks.append(Block(None, sorted(dt_fallback), list(range(len(device_keys)))))
+    return blocks
+
+
+def count_comparisons(blocks):
+    return sum(len(block.rows) * len(block.cols) for block in blocks)
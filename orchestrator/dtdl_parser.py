@@ -0,0 +1,116 @@
+# --- DTDL parser calls with a content-addressed cache ---
+#
+# The parser output only depends on the specification (and on the parser
+# itself), so it is stored in orchestrator.DTDLParseCache under the sha256 of
+# DTDL_PARSE_CACHE_VERSION plus the canonical JSON of the specification (sorted
+# keys, no whitespace); bumping the version after a parser upgrade makes every
+# entry a miss again. The same model loaded in another
+# system, re-imported by load_house_scenario or re-saved unchanged costs one
+# indexed lookup instead of a parser round-trip. parse_specifications() serves
+# multi-model uploads: one lookup for all specifications, identical ones parsed
+# once, and the misses sent to the parser concurrently (it has no batch
+# endpoint) before being stored with a single bulk insert. When one of them
+# fails, the ones that succeeded are stored before the error is raised.
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from requests.exceptions import RequestException
+
+from core.parser_client import get_dtdl_parser_url
+
+logger = logging.getLogger(__name__)
+
+_counters = {"cache_hits": 0, "parser_requests": 0}
+_counters_lock = threading.Lock()
+
+
+def specification_hash(specification):
+    canonical = json.dumps(specification, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    version = getattr(settings, 'DTDL_PARSE_CACHE_VERSION', '1')
+    return hashlib.sha256(f"{version}\n{canonical}".encode("utf-8")).hexdigest()
+
+
+def request_parse(specification):
+    """Parser output for one specification (a round-trip to DTDL_PARSER_URL)."""
+    payload = {
+        "id": specification.get('@id'),
+        "specification": specification
+    }
+    parser_url = get_dtdl_parser_url()
+    with _counters_lock:
+        _counters["parser_requests"] += 1
+    try:
+        response = requests.post(parser_url, json=payload)
+        response.raise_for_status()  # Levanta um erro se o status code for 4xx/5xx
+    except RequestException as e:
+        raise ConnectionError(f"Failed to communicate with DTDL parser at {parser_url}: {e}")
+    try:
+        return response.json()
+    except ValueError:
+        # Quando a resposta não é JSON ou está malformada
+        raise ValueError(f"Failed to parse JSON response from DTDL parser at {parser_url}")
+
+
+def parse_specifications(specifications):
+    """Parsed specifications, in the order of `specifications`, going to the parser only for unseen content."""
+    from orchestrator.models import DTDLParseCache
+
+    specifications = list(specifications)
+    for specification in specifications:
+        if not specification.get('@id'):
+            raise ValueError("DTDL specification has no '@id'.")
+    keys = [specification_hash(s) for s in specifications]
+    use_cache = getattr(settings, 'DTDL_PARSE_CACHE', True)
+
+    parsed = {}
+    if use_cache:
+        parsed = dict(
+            DTDLParseCache.objects.filter(specification_hash__in=set(keys)).values_list("specification_hash", "parsed_specification")
+        )
+    missing = {key: spec for key, spec in zip(keys, specifications) if key not in parsed}
+    with _counters_lock:
+        _counters["cache_hits"] += len(specifications) - sum(1 for key in keys if key in missing)
+
+    if missing:
+        workers = max(1, min(len(missing), getattr(settings, 'DTDL_PARSER_MAX_WORKERS', 4)))
+        fresh = {}
+        error = None
+        if workers == 1:
+            for key, spec in missing.items():
+                try:
+                    fresh[key] = request_parse(spec)
+                except Exception as e:
+                    error = e
+                    break
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {key: executor.submit(request_parse, spec) for key, spec in missing.items()}
+                for key, future in futures.items():
+                    try:
+                        fresh[key] = future.result()
+                    except Exception as e:
+                        error = error or e
+        if use_cache and fresh:
+            # Stored even if another specification failed: a retry only re-parses the failed ones
+            DTDLParseCache.objects.bulk_create(
+                [DTDLParseCache(specification_hash=key, parsed_specification=value) for key, value in fresh.items()],
+                ignore_conflicts=True,
+            )
+        if error is not None:
+            raise error
+        parsed.update(fresh)
+    return [parsed[key] for key in keys]
+
+
+def parse_specification(specification):
+    return parse_specifications([specification])[0]
+
+
+def parser_stats():
+    with _counters_lock:
+        return dict(_counters)
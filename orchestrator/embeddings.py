@@ -0,0 +1,245 @@
+# --- Sentence embeddings for autobinding: shared model, cached vectors, vectorized top-k ---
+import collections
+import hashlib
+import logging
+import re
+import threading
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"
+
+_models = collections.OrderedDict()
+_models_lock = threading.Lock()
+
+
+def default_model_name():
+    return getattr(settings, 'AUTOBINDING_MODEL_NAME', DEFAULT_MODEL_NAME) or DEFAULT_MODEL_NAME
+
+
+def get_sentence_model(model_name=None):
+    """Process-wide SentenceTransformer per model name (loading one takes seconds).
+
+    The least recently used models beyond SENTENCE_MODEL_CACHE_SIZE are dropped.
+    """
+    model_name = model_name or default_model_name()
+    with _models_lock:
+        model = _models.get(model_name)
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(model_name)
+            _models[model_name] = model
+            while len(_models) > max(1, int(getattr(settings, 'SENTENCE_MODEL_CACHE_SIZE', 2))):
+                evicted, _ = _models.popitem(last=False)
+                logger.info(f"Sentence model '{evicted}' evicted from the model cache")
+        _models.move_to_end(model_name)
+    return model
+
+
+def normalize_text(text):
+    return " ".join((text or "").lower().split())
+
+
+def text_hash(text, model_name):
+    """Cache key of `text` under `model_name` (texts are compared normalized)."""
+    return hashlib.sha256(f"{model_name}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Unit-normalized float32 embeddings keyed by text hash and model name.
+
+    Lookups go memory (bounded LRU) -> database (orchestrator.SentenceEmbedding,
+    one query per batch) -> model; only texts missing from both are encoded, in
+    a single batch, and then persisted for the next process.
+    """
+
+    def __init__(self, max_entries=None, persist=None, batch_size=None):
+        self.max_entries = int(max_entries if max_entries is not None else getattr(settings, 'EMBEDDING_MEMORY_CACHE_SIZE', 100000))
+        self.persist = bool(persist if persist is not None else getattr(settings, 'EMBEDDING_DB_CACHE', True))
+        self.batch_size = int(batch_size or getattr(settings, 'EMBEDDING_ENCODE_BATCH_SIZE', 256))
+        self._memory = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "db_hits": 0, "encoded": 0}
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _from_memory(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+            self._counters["memory_hits"] += len(found)
+        return found
+
+    def _from_db(self, keys, model_name):
+        from orchestrator.models import SentenceEmbedding
+
+        found = {}
+        keys = list(keys)
+        for i in range(0, len(keys), 5000):
+            rows = SentenceEmbedding.objects.filter(
+                model_name=model_name, text_hash__in=keys[i:i + 5000]
+            ).values_list("text_hash", "vector")
+            for key, blob in rows:
+                found[key] = np.frombuffer(bytes(blob), dtype=np.float32)
+        with self._lock:
+            self._counters["db_hits"] += len(found)
+        return found
+
+    def _save_db(self, vectors, model_name):
+        from orchestrator.models import SentenceEmbedding
+
+        SentenceEmbedding.objects.bulk_create(
+            [
+                SentenceEmbedding(model_name=model_name, text_hash=key, dimensions=len(vector), vector=vector.tobytes())
+                for key, vector in vectors.items()
+            ],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+    def encode(self, texts, model_name=None):
+        """(len(texts), dim) float32 matrix of unit vectors, rows in the order of `texts`."""
+        model_name = model_name or default_model_name()
+        keys = [text_hash(t, model_name) for t in texts]
+        unique = dict.fromkeys(keys)
+        vectors = self._from_memory(unique)
+
+        missing = [k for k in unique if k not in vectors]
+        if missing and self.persist:
+            try:
+                stored = self._from_db(missing, model_name)
+            except Exception as e:
+                logger.warning(f"Embedding cache lookup failed, encoding instead: {e}")
+                stored = {}
+            for key, vector in stored.items():
+                self._remember(key, vector)
+            vectors.update(stored)
+            missing = [k for k in missing if k not in vectors]
+
+        if missing:
+            text_of = {}
+            for key, text in zip(keys, texts):
+                text_of.setdefault(key, normalize_text(text))
+            encoded = get_sentence_model(model_name).encode(
+                [text_of[k] for k in missing],
+                batch_size=self.batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False,
+            )
+            fresh = {k: np.asarray(v, dtype=np.float32) for k, v in zip(missing, encoded)}
+            with self._lock:
+                self._counters["encoded"] += len(fresh)
+            for key, vector in fresh.items():
+                self._remember(key, vector)
+            vectors.update(fresh)
+            if self.persist:
+                try:
+                    self._save_db(fresh, model_name)
+                except Exception as e:
+                    logger.warning(f"Could not persist {len(fresh)} embeddings: {e}")
+
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.vstack([vectors[k] for k in keys])
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._counters)
+            data["memory_entries"] = len(self._memory)
+        return data
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache()
+    return _cache
+
+
+def encode_texts(texts, model_name=None):
+    return get_embedding_cache().encode(list(texts), model_name=model_name)
+
+
+def top_k_similar(queries, corpus, k, min_score=None, chunk_rows=1024):
+    """Cosine top-k of every query row against `corpus` (both unit-normalized).
+
+    One matrix multiply per chunk of `chunk_rows` queries (bounds memory for
+    10k x 10k), argpartition for the top-k. Yields (query_index, corpus_indices,
+    scores) with scores descending and, if given, >= `min_score`.
+    """
+    n_corpus = corpus.shape[0]
+    if n_corpus == 0 or queries.shape[0] == 0:
+        return
+    k = max(1, min(int(k), n_corpus))
+    corpus_t = np.ascontiguousarray(corpus.T)
+    for start in range(0, queries.shape[0], chunk_rows):
+        scores = queries[start:start + chunk_rows] @ corpus_t
+        if k < n_corpus:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(n_corpus), scores.shape)
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        for offset in range(top.shape[0]):
+            idx, row_scores = top[offset], top_scores[offset]
+            if min_score is not None:
+                keep = row_scores >= min_score
+                idx, row_scores = idx[keep], row_scores[keep]
+            yield start + offset, idx, row_scores
+
+
+def _token_set(text):
+    return {t for t in re.split(r"\W+", (text or "").lower()) if t}
+
+
+def lexical_similarity_matrix(texts_a, texts_b):
+    """Token Jaccard for every pair (fallback when no sentence model is available)."""
+    sets_b = [_token_set(t) for t in texts_b]
+    matrix = np.zeros((len(texts_a), len(texts_b)), dtype=np.float32)
+    for i, text in enumerate(texts_a):
+        sa = _token_set(text)
+        if not sa:
+            continue
+        for j, sb in enumerate(sets_b):
+            if sb:
+                matrix[i, j] = len(sa & sb) / len(sa | sb)
+    return matrix
+
+
+def similarity_matrix(texts_a, texts_b, model_name=None):
+    """(len(texts_a), len(texts_b)) cosine similarities between two lists of texts.
+
+    Both sides go through the embedding cache, so each distinct text is encoded
+    once per model and repeated calls cost a lookup plus one matrix multiply.
+    Falls back to lexical Jaccard if the model is unavailable or encoding fails.
+    """
+    texts_a, texts_b = list(texts_a), list(texts_b)
+    if not texts_a or not texts_b:
+        return np.zeros((len(texts_a), len(texts_b)), dtype=np.float32)
+    try:
+        vectors = encode_texts(texts_a + texts_b, model_name=model_name)
+    except Exception as e:
+        logger.warning(f"Sentence similarity unavailable, using lexical similarity: {e}")
+        return lexical_similarity_matrix(texts_a, texts_b)
+    return vectors[:len(texts_a)] @ vectors[len(texts_a):].T
@@ -1,12 +1,16 @@
 from django.shortcuts import get_object_or_404
 from ninja.errors import HttpError
-from sentence_transformers import SentenceTransformer, util
+from django.conf import settings
 from django.utils.text import slugify
+from orchestrator.ann import get_device_property_index
+from orchestrator.blocking import Block, build_blocks, extract_blocking_key
+from orchestrator.embeddings import encode_texts, get_sentence_model, similarity_matrix, top_k_similar
+from orchestrator.hierarchy import prefetch_hierarchies
 from orchestrator.utils import normalize_name
 from typing import List
 from django.db import transaction
-import csv
-import io
+from functools import lru_cache
+import numpy as np
 
 from core.models import Organization
 from facade.models import Property
@@ -75,7 +79,7 @@ def _filter_candidate_device_properties(queryset, payload):
 
 
 def _load_sentence_model():
-    return SentenceTransformer("all-MiniLM-L6-v2")
+    return get_sentence_model()
 
 
 def _build_dt_property_text(dtip: DigitalTwinInstanceProperty):
@@ -125,6 +129,7 @@ def _build_device_property_canonical(prop: Property):
     return _to_canonical_slug(f"{device_name} {prop_name}".strip())
 
 
+@lru_cache(maxsize=65536)
 def _tokenize_for_matching(text: str):
     normalized = normalize_name(text)
     tokens = [t for t in normalized.split() if t]
@@ -146,6 +151,10 @@ def _extract_identifier_tokens(name: str):
     return identifiers
 
 
+# Weight of the embedding similarity in the hybrid score; lexical/numeric/canonical add up to the rest
+HYBRID_SEMANTIC_WEIGHT = 0.68
+
+
 def _compute_hybrid_match_score(
     dt_text: str,
     device_text: str,
@@ -176,7 +185,7 @@ def _compute_hybrid_match_score(
         id_penalty = 0.12
 
     blended = (
-        (0.68 * float(semantic_score))
+        (HYBRID_SEMANTIC_WEIGHT * float(semantic_score))
         + (0.17 * lexical_score)
         + (0.05 * numeric_score)
         + (0.10 * canonical_score)
@@ -200,6 +209,8 @@ def _suggest_autobinding_candidates(system_context: SystemContext, payload):
     dt_props = list(dt_props_qs)
     if payload.causal_only:
         dt_props = [row for row in dt_props if row.property and row.property.isCausal()]
+    # Hierarchy names of every instance in one query instead of one per property
+    prefetch_hierarchies([row.dtinstance for row in dt_props])
 
     scoped_device_props = _filter_candidate_device_properties(
         _scope_system_properties(system_context).select_related("device", "device__type", "device__gateway"),
@@ -212,58 +223,92 @@ def _suggest_autobinding_candidates(system_context: SystemContext, payload):
     if not dt_props or not device_props:
         return []
 
-    sentence_model = _load_sentence_model()
-    device_texts = [_build_device_property_text(p) for p in device_props]
-    device_canonicals = [_build_device_property_canonical(p) for p in device_props]
-    device_embeddings = sentence_model.encode(device_texts, convert_to_tensor=True)
-
-    candidate_pairs = []
+    dt_rows = []
     for dtip in dt_props:
         dt_text = _build_dt_property_text(dtip)
-        if not dt_text:
-            continue
+        if dt_text:
+            dt_rows.append((dtip, dt_text))
+    if not dt_rows:
+        return []
+
+    # Unit vectors from the embedding cache: dot product == cosine
+    dt_embeddings = encode_texts([text for _, text in dt_rows])
+
+    # The hybrid score is at most 0.68 * semantic + 0.32, so lower semantic scores can never reach the threshold
+    min_semantic = (threshold - (1.0 - HYBRID_SEMANTIC_WEIGHT)) / HYBRID_SEMANTIC_WEIGHT
+    top_k = getattr(settings, 'AUTOBINDING_TOP_K', 32)
+
+    # Blocking: only DT/device properties of the same root entity ("house 77") are compared
+    if getattr(settings, 'AUTOBINDING_BLOCKING_ENABLED', True):
+        blocks = build_blocks(
+            [extract_blocking_key(dtip.get_hierarchy()[0]) for dtip, _ in dt_rows],
+            [extract_blocking_key(p.device.name if p.device else "") for p in device_props],
+        )
+    else:
+        blocks = [Block(None, list(range(len(dt_rows))), list(range(len(device_props))))]
+
+    ann_min_candidates = getattr(settings, 'AUTOBINDING_ANN_MIN_CANDIDATES', 20000)
+    use_ann = getattr(settings, 'AUTOBINDING_ANN_ENABLED', True) and any(
+        len(block.cols) >= ann_min_candidates for block in blocks
+    )
+    device_embeddings = None
+    if not use_ann or any(len(block.cols) < ann_min_candidates for block in blocks):
+        device_embeddings = encode_texts([_build_device_property_text(p) for p in device_props])
+
+    def block_neighbours(block):
+        if use_ann and len(block.cols) >= ann_min_candidates:
+            # Nearest neighbours from the organization's index, restricted to the block's candidates
+            position = {device_props[col].id: col for col in block.cols}
+            index = get_device_property_index(system_context.organization_id)
+            for offset, (labels, scores) in enumerate(index.search(dt_embeddings[block.rows], top_k, allowed_ids=position)):
+                keep = scores >= min_semantic
+                yield block.rows[offset], [position[int(label)] for label in labels[keep]], scores[keep]
+            return
+        cols = np.asarray(block.cols)
+        for offset, indices, scores in top_k_similar(
+            dt_embeddings[block.rows], device_embeddings[cols], top_k, min_score=min_semantic
+        ):
+            yield block.rows[offset], cols[indices].tolist(), scores
+
+    neighbours = (item for block in blocks for item in block_neighbours(block))
+
+    # Lexical features only for device properties that are someone's neighbour
+    device_features = {}
+
+    def features_of(idx):
+        features = device_features.get(idx)
+        if features is None:
+            prop = device_props[idx]
+            features = (
+                _build_device_property_text(prop),
+                _build_device_property_canonical(prop),
+                _extract_identifier_tokens(prop.device.name if prop.device else ""),
+            )
+            device_features[idx] = features
+        return features
+
+    candidate_pairs = []
+    for row, indices, semantic_scores in neighbours:
+        dtip, dt_text = dt_rows[row]
         dt_identifiers = _extract_identifier_tokens(dtip.dtinstance.name if dtip.dtinstance else "")
         dt_canonical = _build_dt_property_canonical(dtip)
-        dt_emb = sentence_model.encode(dt_text, convert_to_tensor=True)
-        scores = util.cos_sim(dt_emb, device_embeddings)[0]
-        for idx, raw_score in enumerate(scores):
-            semantic_score = float(raw_score)
-            device_text = device_texts[idx]
-            device_name = device_props[idx].device.name if device_props[idx].device else ""
-            device_identifiers = _extract_identifier_tokens(device_name)
+        for idx, raw_score in zip(list(indices), semantic_scores.tolist()):
+            prop = device_props[idx]
+            if not prop.device:
+                continue
+            device_text, device_canonical, device_identifiers = features_of(idx)
             score = _compute_hybrid_match_score(
                 dt_text,
                 device_text,
-                semantic_score,
+                raw_score,
                 dt_identifiers=dt_identifiers,
                 device_identifiers=device_identifiers,
                 dt_canonical=dt_canonical,
-                device_canonical=device_canonicals[idx],
+                device_canonical=device_canonical,
             )
             if score < threshold:
                 continue
-            prop = device_props[idx]
-            if not prop.device:
-                continue
-            candidate_pairs.append(
-                (
-                    score,
-                    dtip.id,
-                    prop.id,
-                    AutoBindingCandidateSchema(
-                        dt_property_id=dtip.id,
-                        dt_instance_id=dtip.dtinstance_id,
-                        dt_instance_name=dtip.dtinstance.name,
-                        dt_property_name=dtip.property.name,
-                        dt_model_name=dtip.dtinstance.model.name,
-                        device_property_id=prop.id,
-                        device_property_name=prop.name,
-                        device_id=prop.device_id,
-                        device_name=prop.device.name,
-                        score=round(score, 4),
-                    ),
-                )
-            )
+            candidate_pairs.append((score, dtip, prop))
 
     if not candidate_pairs:
         return []
@@ -275,49 +320,37 @@ def _suggest_autobinding_candidates(system_context: SystemContext, payload):
     allow_reuse = bool(payload.allow_device_property_reuse)
     max_results = max(0, int(payload.limit))
 
-    for _, dt_property_id, device_property_id, candidate in candidate_pairs:
-        if dt_property_id in used_dt_property_ids:
+    for score, dtip, prop in candidate_pairs:
+        if dtip.id in used_dt_property_ids:
             continue
-        if not allow_reuse and device_property_id in used_device_property_ids:
+        if not allow_reuse and prop.id in used_device_property_ids:
             continue
-        selected.append(candidate)
-        used_dt_property_ids.add(dt_property_id)
+        selected.append(
+            AutoBindingCandidateSchema(
+                dt_property_id=dtip.id,
+                dt_instance_id=dtip.dtinstance_id,
+                dt_instance_name=dtip.dtinstance.name,
+                dt_property_name=dtip.property.name,
+                dt_model_name=dtip.dtinstance.model.name,
+                device_property_id=prop.id,
+                device_property_name=prop.name,
+                device_id=prop.device_id,
+                device_name=prop.device.name,
+                score=round(score, 4),
+            )
+        )
+        used_dt_property_ids.add(dtip.id)
         if not allow_reuse:
-            used_device_property_ids.add(device_property_id)
+            used_device_property_ids.add(prop.id)
         if len(selected) >= max_results:
             break
 
     return selected
 
 
-def _parse_influx_csv_points(response_text: str):
-    points = []
-    reader = csv.DictReader(io.StringIO("\n".join(
-        line for line in response_text.splitlines() if line and not line.startswith("#")
-    )))
-    for row in reader:
-        if not row:
-            continue
-        points.append(row)
-    return points
-
-
 def compute_similarity(text_a: str, text_b: str, model_name: str = None):
     """Compute semantic similarity between two texts using sentence-transformers.
     Falls back to lexical Jaccard if model is unavailable or encoding fails.
+    Prefer similarity_matrix() when comparing one text against many.
     """
-    try:
-        from sentence_transformers import SentenceTransformer, util
-        model = SentenceTransformer(model_name or "all-MiniLM-L6-v2")
-        emb_a = model.encode(text_a or "", convert_to_tensor=True)
-        emb_b = model.encode(text_b or "", convert_to_tensor=True)
-        return float(util.cos_sim(emb_a, emb_b)[0][0])
-    except Exception:
-        import re
-        sa = set([t for t in re.split(r"\W+", (text_a or "").lower()) if t])
-        sb = set([t for t in re.split(r"\W+", (text_b or "").lower()) if t])
-        if not sa or not sb:
-            return 0.0
-        inter = sa.intersection(sb)
-        union = sa.union(sb)
-        return len(inter) / len(union)
+    return float(similarity_matrix([text_a or ""], [text_b or ""], model_name=model_name)[0, 0])
@@ -0,0 +1,139 @@
+# --- Materialized twin hierarchy (ancestor path) ---
+#
+# DigitalTwinInstance.hierarchy_path holds the ids of the instance's ancestors,
+# root first, each followed by "/" (e.g. "12/45/" for a twin under 45 under 12;
+# "" for a root). hierarchy_depth is the number of ancestors. The parent of a
+# twin is the source of its oldest incoming DigitalTwinInstanceRelationship,
+# the same one the former get_hierarchy() walk followed; a link that would
+# close a cycle is ignored.
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
+
+BULK_UPDATE_BATCH = 1000
+
+
+def path_ids(path):
+    return [int(part) for part in path.split("/") if part]
+
+
+def subtree_prefix(instance):
+    """Path prefix shared by every descendant of `instance`."""
+    return f"{instance.hierarchy_path}{instance.pk}/"
+
+
+def compute_hierarchy_paths(instance_ids, parent_links):
+    """Paths for every id in `instance_ids` given `parent_links` (target id, source id) ordered by relationship pk.
+
+    Returns {instance_id: path}. Cycles are cut at the link that closes them.
+    """
+    parent = {}
+    for target_id, source_id in parent_links:
+        if target_id != source_id:
+            parent.setdefault(target_id, source_id)
+
+    paths = {}
+    for start in instance_ids:
+        if start in paths:
+            continue
+        chain = []
+        on_chain = set()
+        node = start
+        while node is not None and node not in paths and node not in on_chain:
+            chain.append(node)
+            on_chain.add(node)
+            node = parent.get(node)
+        if node is not None and node in on_chain:
+            # `node` closes a cycle: drop its own parent link and make it the root
+            idx = chain.index(node)
+            paths[node] = ""
+            base = f"{node}/"
+            for member in reversed(chain[idx + 1:]):
+                paths[member] = base
+                base = f"{base}{member}/"
+            chain = chain[:idx]
+            base = f"{node}/"
+        else:
+            base = f"{paths[node]}{node}/" if node is not None else ""
+        for member in reversed(chain):
+            paths[member] = base
+            base = f"{base}{member}/"
+    return paths
+
+
+def rebuild_hierarchy_paths(instance_model, relationship_model, batch_size=BULK_UPDATE_BATCH):
+    """Recompute hierarchy_path/hierarchy_depth for all instances; returns the number of rows changed.
+
+    Takes the model classes so data migrations can pass their historical models.
+    """
+    current = dict(instance_model.objects.values_list("id", "hierarchy_path"))
+    links = relationship_model.objects.order_by("pk").values_list("target_instance_id", "source_instance_id")
+    paths = compute_hierarchy_paths(sorted(current), links.iterator())
+
+    changed = [
+        instance_model(id=pk, hierarchy_path=path, hierarchy_depth=len(path_ids(path)))
+        for pk, path in paths.items()
+        if current.get(pk) != path
+    ]
+    for i in range(0, len(changed), batch_size):
+        instance_model.objects.bulk_update(changed[i:i + batch_size], ["hierarchy_path", "hierarchy_depth"])
+    return len(changed)
+
+
+def prefetch_hierarchies(instances):
+    """Resolve get_hierarchy() for many instances with one query (ancestor names for all of them)."""
+    from orchestrator.models import DigitalTwinInstance
+
+    instances = [i for i in instances if i is not None]
+    ancestor_ids = {pk for i in instances for pk in path_ids(i.hierarchy_path)}
+    names = dict(DigitalTwinInstance.objects.filter(pk__in=ancestor_ids).values_list("id", "name")) if ancestor_ids else {}
+    for instance in instances:
+        hierarchy = [names[pk] for pk in path_ids(instance.hierarchy_path) if names.get(pk)]
+        if instance.name:
+            hierarchy.append(instance.name)
+        instance._prefetched_hierarchy = hierarchy
+    return instances
+
+
+def _primary_parent(instance):
+    from orchestrator.models import DigitalTwinInstanceRelationship
+
+    incoming = (
+        DigitalTwinInstanceRelationship.objects
+        .filter(target_instance=instance)
+        .exclude(source_instance=instance)
+        .select_related("source_instance")
+        .order_by("pk")
+    )
+    for rel in incoming:
+        source = rel.source_instance
+        if instance.pk not in path_ids(source.hierarchy_path):
+            return source
+    return None
+
+
+def refresh_instance_hierarchy(instance_id):
+    """Re-derive the parent of one instance and move its subtree if the path changed."""
+    from orchestrator.models import DigitalTwinInstance
+
+    with transaction.atomic():
+        instance = DigitalTwinInstance.objects.select_for_update().filter(pk=instance_id).first()
+        if instance is None:
+            return False
+        parent = _primary_parent(instance)
+        new_path = subtree_prefix(parent) if parent is not None else ""
+        if new_path == instance.hierarchy_path:
+            return False
+
+        old_prefix = subtree_prefix(instance)
+        new_prefix = f"{new_path}{instance.pk}/"
+        depth_delta = len(path_ids(new_path)) - instance.hierarchy_depth
+        DigitalTwinInstance.objects.filter(pk=instance.pk).update(
+            hierarchy_path=new_path, hierarchy_depth=len(path_ids(new_path))
+        )
+        # One UPDATE rewrites the prefix of the whole subtree
+        DigitalTwinInstance.objects.filter(hierarchy_path__startswith=old_prefix).update(
+            hierarchy_path=Concat(Value(new_prefix), Substr("hierarchy_path", len(old_prefix) + 1)),
+            hierarchy_depth=F("hierarchy_depth") + depth_delta,
+        )
+    return True
@@ -0,0 +1,257 @@
+# --- Bulk twin instantiation ---
+#
+# Creates whole twin trees (or N replicas of one) with a handful of
+# bulk_create statements inside one transaction: the instances level by level
+# (each level already knows its parents' ids, so hierarchy_path/depth are
+# written with the rows), then every DigitalTwinInstanceProperty of the new
+# instances (an INSERT ... SELECT unnest() per chunk on PostgreSQL), then the
+# parent -> child DigitalTwinInstanceRelationship rows.
+# bulk_create sends no post_save, so the Neo4j outbox entries the signals
+# would have queued are added in bulk too. Automatic "<ModelName> <N>" names
+# take one DigitalTwinInstanceNameSequence reservation per model, which also
+# moves the sequence past explicit names written in that format.
+#
+# A tree spec is a list of nodes {"model", "name", "relationship", "children"}
+# ("relationship" links the node to its parent; None makes it a root).
+# resolve_tree() builds it from the {"House 1": {"Room 1": {...}}} payloads of
+# /instances/hierarchical/, and replicate() repeats a root under new names
+# without copying its subtree.
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from orchestrator.models import (
+    DigitalTwinInstance,
+    DigitalTwinInstanceNameSequence,
+    DigitalTwinInstanceProperty,
+    DigitalTwinInstanceRelationship,
+    ModelElement,
+    ModelRelationship,
+)
+
+logger = logging.getLogger(__name__)
+
+BULK_CREATE_BATCH = 2000
+
+
+def match_models(names, dtdl_models, similarity_threshold):
+    """{name: (best DTDLModel or None, score)} with a single similarity matrix for all names."""
+    from orchestrator.embeddings import similarity_matrix
+
+    names = list(dict.fromkeys(names))
+    if not names or not dtdl_models:
+        return {name: (None, 0.0) for name in names}
+    scores = similarity_matrix(names, [m.name for m in dtdl_models])
+    matches = {}
+    for name, row in zip(names, scores):
+        idx = int(row.argmax())
+        score = float(row[idx])
+        if score > 0.0 and score >= float(similarity_threshold):
+            matches[name] = (dtdl_models[idx], score)
+        else:
+            matches[name] = (None, max(score, 0.0))
+    return matches
+
+
+def tree_names(tree):
+    """Every twin name of a {"name": {children}} payload, parents first."""
+    names = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            names.extend(node)
+            stack.extend(node.values())
+    return names
+
+
+class RelationshipResolver:
+    """ModelRelationship from a parent model to a child model, loaded once per system."""
+
+    def __init__(self, system):
+        self._by_model = {}
+        for rel in ModelRelationship.objects.filter(dtdl_model__system=system).order_by('pk'):
+            self._by_model.setdefault(rel.dtdl_model_id, []).append(rel)
+        self._cache = {}
+
+    def find(self, parent_model, child_model):
+        key = (parent_model.id, child_model.id)
+        if key not in self._cache:
+            # target pode ser apenas o prefixo do dtdl_id (ex: 'dtmi:housegen:Room' para 'dtmi:housegen:Room;1')
+            prefix = child_model.dtdl_id.split(';')[0]
+            candidates = self._by_model.get(parent_model.id, [])
+            rel = next((r for r in candidates if r.target in (child_model.dtdl_id, prefix)), None)
+            if rel is None:
+                rel = next((r for r in candidates if r.target.startswith(prefix)), None)
+            self._cache[key] = rel
+        return self._cache[key]
+
+
+def resolve_tree(tree, matches, relationships, parent_model=None):
+    """Tree spec of a {"name": {children}} payload.
+
+    `matches` is the output of match_models() and `relationships` a
+    RelationshipResolver. Names without a model are skipped with their
+    subtree; a child without a relationship to its parent model becomes a root.
+    """
+    nodes = []
+    if not isinstance(tree, dict):
+        return nodes
+    for twin_name, children in tree.items():
+        model, score = matches.get(twin_name, (None, 0.0))
+        if model is None:
+            logger.warning(f"No DTDL model suggested for '{twin_name}' (score={score:.2f})")
+            continue
+        relationship = None
+        if parent_model is not None:
+            relationship = relationships.find(parent_model, model)
+            if relationship is None:
+                logger.warning(
+                    f"No relationship between '{parent_model.name}' and '{model.name}' "
+                    f"(expected target: '{model.dtdl_id.split(';')[0]}')"
+                )
+        nodes.append({
+            "model": model,
+            "name": twin_name,
+            "relationship": relationship,
+            "children": resolve_tree(children, matches, relationships, model),
+        })
+    return nodes
+
+
+def replicate(root, count, name_format="{base} {i}"):
+    """`count` copies of a root node named name_format (base = first word of the root name, i from 1)."""
+    base = root["name"].split()[0] if root.get("name") else root["model"].name
+    return [{**root, "name": name_format.format(base=base, i=i)} for i in range(1, count + 1)]
+
+
+def _flatten(roots):
+    # Pre-order (node, parent index, depth), the order the instances are returned in
+    entries = []
+    stack = [(root, None, 0) for root in reversed(roots)]
+    while stack:
+        node, parent, depth = stack.pop()
+        index = len(entries)
+        entries.append((node, parent, depth))
+        for child in reversed(node.get("children") or ()):
+            stack.append((child, index, depth + 1))
+    return entries
+
+
+def instantiate(roots, bind_devices=True, batch_size=BULK_CREATE_BATCH):
+    """Create the instances, properties and relationships of a tree spec.
+
+    Returns the new DigitalTwinInstance objects (pk set, model loaded) in
+    pre-order. With bind_devices, causal properties then get a device
+    binding suggestion, as DigitalTwinInstanceProperty.associate_all_for_instance
+    does (outside the transaction: it is the slow part).
+    """
+    entries = _flatten(roots)
+    if not entries:
+        return []
+
+    unnamed = {}
+    explicit_max = {}  # model id -> largest <N> of explicit "<ModelName> <N>" names
+    for node, _, _ in entries:
+        model = node["model"]
+        if not node.get("name"):
+            unnamed[model.id] = unnamed.get(model.id, 0) + 1
+        elif (number := DigitalTwinInstanceNameSequence.number_in(model.name, node["name"])) is not None:
+            explicit_max[model.id] = max(explicit_max.get(model.id, 0), number)
+    model_ids = {node["model"].id for node, _, _ in entries}
+    elements = {model_id: [] for model_id in model_ids}
+    for element in ModelElement.objects.filter(dtdl_model_id__in=model_ids).order_by('pk'):
+        elements[element.dtdl_model_id].append(element)
+
+    levels = {}
+    for index, (_, _, depth) in enumerate(entries):
+        levels.setdefault(depth, []).append(index)
+
+    instances = [None] * len(entries)
+    with transaction.atomic():
+        next_number = {
+            model_id: DigitalTwinInstanceNameSequence.reserve(
+                model_id, unnamed.get(model_id, 0), after=explicit_max.get(model_id, 0)
+            )
+            for model_id in sorted(unnamed.keys() | explicit_max.keys())
+        }
+        for depth in sorted(levels):
+            level = []
+            for index in levels[depth]:
+                node, parent, _ = entries[index]
+                model = node["model"]
+                name = node.get("name")
+                if not name:
+                    name = f"{model.name} {next_number[model.id]}"
+                    next_number[model.id] += 1
+                path, path_depth = "", 0
+                if parent is not None and node.get("relationship") is not None:
+                    parent_instance = instances[parent]
+                    path = f"{parent_instance.hierarchy_path}{parent_instance.pk}/"
+                    path_depth = parent_instance.hierarchy_depth + 1
+                instances[index] = DigitalTwinInstance(
+                    model=model, name=name, hierarchy_path=path, hierarchy_depth=path_depth
+                )
+                level.append(instances[index])
+            DigitalTwinInstance.objects.bulk_create(level, batch_size=batch_size)
+
+        properties = _create_properties(instances, elements, batch_size)
+        relationships = DigitalTwinInstanceRelationship.objects.bulk_create(
+            [
+                DigitalTwinInstanceRelationship(
+                    source_instance_id=instances[parent].pk,
+                    target_instance_id=instances[index].pk,
+                    relationship_id=node["relationship"].pk,
+                )
+                for index, (node, parent, _) in enumerate(entries)
+                if parent is not None and node.get("relationship") is not None
+            ],
+            batch_size=batch_size,
+        )
+        if getattr(settings, 'USE_NEO4J', False):
+            from orchestrator.neo4j_outbox import enqueue_properties, enqueue_relationships
+            enqueue_properties([pk for pk, _ in properties], batch_size=batch_size)
+            enqueue_relationships([r.pk for r in relationships], batch_size=batch_size)
+
+    if bind_devices:
+        causal = {element.pk for model_elements in elements.values() for element in model_elements if element.isCausal()}
+        bind_causal_properties([pk for pk, element_id in properties if element_id in causal])
+    return instances
+
+
+def _create_properties(instances, elements, batch_size):
+    """DigitalTwinInstanceProperty rows of every element of each instance's model; returns [(id, element id)]."""
+    rows = [(instance.pk, element.pk) for instance in instances for element in elements[instance.model_id]]
+    if connection.vendor != "postgresql":
+        # Portable fallback (e.g. SQLite in development)
+        created = DigitalTwinInstanceProperty.objects.bulk_create(
+            [DigitalTwinInstanceProperty(dtinstance_id=i, property_id=e) for i, e in rows], batch_size=batch_size
+        )
+        return [(dtip.pk, dtip.property_id) for dtip in created]
+    # Same INSERT as bulk_create without building a model instance per row
+    # (at 10k+ twins that is most of the time spent)
+    table = DigitalTwinInstanceProperty._meta.db_table
+    created = []
+    with connection.cursor() as cursor:
+        for i in range(0, len(rows), batch_size):
+            chunk = rows[i:i + batch_size]
+            cursor.execute(
+                f"INSERT INTO {table} (dtinstance_id, property_id, value) "
+                f"SELECT * FROM unnest(%s::bigint[], %s::bigint[], %s::varchar[]) RETURNING id, property_id",
+                [[r[0] for r in chunk], [r[1] for r in chunk], [""] * len(chunk)],
+            )
+            created.extend(cursor.fetchall())
+    return created
+
+
+def bind_causal_properties(dtip_ids):
+    """suggest_device_binding() for the given (causal) properties; returns how many got a device."""
+    bound = 0
+    dt_properties = DigitalTwinInstanceProperty.objects.filter(pk__in=dtip_ids).select_related('property', 'dtinstance__model')
+    for dtip in dt_properties.order_by('pk'):
+        dtip.suggest_device_binding()
+        if dtip.device_property_id is not None:
+            dtip.save(update_fields=["device_property"])
+            bound += 1
+    return bound
@@ -0,0 +1,204 @@
+# --- Push-based device liveness for listen_gateway ---
+#
+# A device is alive while it keeps sending telemetry: every message received
+# by the listener moves its last-seen time, and its deadline is last-seen +
+# Device.get_inactivity_timeout() (DeviceType.inactivityTimeout unless the
+# device overrides it). Deadlines live in a min-heap with one entry per
+# device; an entry popped before the real deadline is pushed back with the
+# current one, so a busy device costs a dict write per message and one heap
+# operation per timeout period. Only state changes come out of collect(), and
+# only those touch DigitalTwinInstance.active and write inactivity events.
+# Devices that are not known to be alive are still polled through the
+# ThingsBoard attributes API, at a low rate (fallback for devices that are up
+# but silent).
+import heapq
+import logging
+import time
+
+from django.db.models import BooleanField, Case, Value, When
+from django.utils import timezone
+
+from facade.influx import get_influx_writer
+from facade.utils import format_influx_line
+from orchestrator.models import DigitalTwinInstance, DigitalTwinInstanceProperty
+
+logger = logging.getLogger(__name__)
+
+
+class LivenessTracker:
+    """Active/inactive state of devices derived from telemetry arrival times."""
+
+    def __init__(self, default_timeout=60.0):
+        self.default_timeout = float(default_timeout)
+        self._timeouts = {}   # device_id -> seconds
+        self._last_seen = {}  # device_id -> monotonic time (tracking start for never-seen devices)
+        self._state = {}      # device_id -> True / False / None (unknown yet)
+        self._heap = []       # (deadline, device_id), at most one live entry per device
+        self._queued = set()
+        self._activated = set()
+        self._counters = {"messages": 0, "activations": 0, "deactivations": 0}
+
+    def _push(self, device_id):
+        if device_id not in self._queued:
+            heapq.heappush(self._heap, (self._last_seen[device_id] + self._timeouts[device_id], device_id))
+            self._queued.add(device_id)
+
+    def track(self, timeouts, now=None):
+        """Set the tracked devices and their timeouts ({device_id: seconds or None}); others are dropped."""
+        now = time.monotonic() if now is None else now
+        for device_id in set(self._timeouts) - set(timeouts):
+            self._timeouts.pop(device_id, None)
+            self._last_seen.pop(device_id, None)
+            self._state.pop(device_id, None)
+            self._activated.discard(device_id)
+        for device_id, timeout in timeouts.items():
+            self._timeouts[device_id] = float(timeout) if timeout else self.default_timeout
+            if device_id not in self._last_seen:
+                self._last_seen[device_id] = now
+                self._state[device_id] = None
+                self._push(device_id)
+
+    def seen(self, device_id, now=None):
+        """Telemetry (or a positive fallback poll) from `device_id`."""
+        if device_id not in self._timeouts:
+            return
+        self._last_seen[device_id] = time.monotonic() if now is None else now
+        self._counters["messages"] += 1
+        if self._state[device_id] is not True:
+            self._state[device_id] = True
+            self._activated.add(device_id)
+        self._push(device_id)
+
+    def collect(self, now=None):
+        """(activated, deactivated) device ids since the previous call.
+
+        `deactivated` maps device id -> previous state (None when the device
+        was never seen since tracking started).
+        """
+        now = time.monotonic() if now is None else now
+        deactivated = {}
+        while self._heap and self._heap[0][0] <= now:
+            _, device_id = heapq.heappop(self._heap)
+            self._queued.discard(device_id)
+            if device_id not in self._timeouts:
+                continue
+            deadline = self._last_seen[device_id] + self._timeouts[device_id]
+            if deadline > now:
+                self._push(device_id)
+                continue
+            if self._state[device_id] is not False:
+                deactivated[device_id] = self._state[device_id]
+                self._state[device_id] = False
+                self._activated.discard(device_id)
+            # Keep watching: the next deadline only matters once it is seen again
+        activated, self._activated = self._activated, set()
+        self._counters["activations"] += len(activated)
+        self._counters["deactivations"] += len(deactivated)
+        return activated, deactivated
+
+    def silent_devices(self):
+        """Devices not known to be alive (inactive or never seen): candidates for the fallback poll."""
+        return [device_id for device_id, state in self._state.items() if state is not True]
+
+    def state(self, device_id):
+        return self._state.get(device_id)
+
+    def stats(self):
+        states = list(self._state.values())
+        data = dict(self._counters)
+        data.update({
+            "tracked": len(states),
+            "active": sum(1 for s in states if s is True),
+            "inactive": sum(1 for s in states if s is False),
+            "unknown": sum(1 for s in states if s is None),
+            "heap": len(self._heap),
+        })
+        return data
+
+
+class StatusTransitionBatch:
+    """Device active/inactive observations of one check cycle, applied together.
+
+    observe() only records the state; apply() reads the bound instances with
+    one query, flips the ones whose `active` differs with a single UPDATE
+    (active + last_status_check, bypassing DigitalTwinInstance.save) and,
+    when asked to, queues one availability line per transition on the Influx
+    writer in a single write_many(). An instance bound to several observed
+    devices is active when any of them is.
+    """
+
+    def __init__(self):
+        self._observed = {}  # device_id -> (device, is_active)
+
+    def __len__(self):
+        return len(self._observed)
+
+    def observe(self, device, is_active):
+        self._observed[device.id] = (device, bool(is_active))
+
+    def apply(self, influx_measurement=None):
+        """Returns [(instance_id, device, is_active, inactivity_duration_ms)] for the instances that changed."""
+        if not self._observed:
+            return []
+        desired = {}   # instance_id -> (is_active, device)
+        current = {}   # instance_id -> (active, last_status_check)
+        rows = DigitalTwinInstanceProperty.objects.filter(
+            device_property__device_id__in=list(self._observed)
+        ).values_list("dtinstance_id", "device_property__device_id", "dtinstance__active", "dtinstance__last_status_check")
+        for instance_id, device_id, active, last_check in rows:
+            device, is_active = self._observed[device_id]
+            if instance_id not in desired or (is_active and not desired[instance_id][0]):
+                desired[instance_id] = (is_active, device)
+            current[instance_id] = (active, last_check)
+
+        now = timezone.now()
+        transitions = []
+        for instance_id, (is_active, device) in desired.items():
+            active, last_check = current[instance_id]
+            if active != is_active:
+                # Time spent inactive, reported when the instance comes back
+                duration = int((now - last_check).total_seconds() * 1000) if is_active and last_check else 0
+                transitions.append((instance_id, device, is_active, duration))
+        if not transitions:
+            return []
+
+        activate = [t[0] for t in transitions if t[2]]
+        DigitalTwinInstance.objects.filter(id__in=[t[0] for t in transitions]).update(
+            active=Case(When(id__in=activate, then=Value(True)), default=Value(False), output_field=BooleanField()),
+            last_status_check=now,
+        )
+        if influx_measurement:
+            self._write_influx(influx_measurement, transitions, now)
+        return transitions
+
+    @staticmethod
+    def _write_influx(measurement, transitions, now):
+        timestamp = int(now.timestamp() * 1000)
+        lines = []
+        for instance_id, device, is_active, duration in transitions:
+            # Integer fields ("1i"), as the existing device_availability/device_status series
+            fields = {"active": f"{1 if is_active else 0}i"}
+            if duration > 0:
+                fields["inactivity_duration"] = f"{duration}i"
+            tags = {
+                "device": device.identifier,
+                "dt_instance": instance_id,
+                "device_type": device.type.name if device.type_id else "unknown",
+            }
+            lines.append(format_influx_line(measurement, tags, fields, timestamp=timestamp))
+        try:
+            queued = get_influx_writer().write_many(lines)
+            if queued < len(lines):
+                logger.error(f"Influx queue full: {len(lines) - queued} of {len(lines)} {measurement} events dropped")
+        except Exception as e:
+            logger.exception(f"Error queueing {measurement} events: {e}")
+
+
+def apply_liveness_transitions(activated, deactivated, devices, influx_measurement=None):
+    """Apply the transitions of LivenessTracker.collect() (`devices`: device_id -> Device)."""
+    batch = StatusTransitionBatch()
+    for device_ids, is_active in ((activated, True), (deactivated, False)):
+        for device_id in device_ids:
+            if device_id in devices:
+                batch.observe(devices[device_id], is_active)
+    return batch.apply(influx_measurement)
@@ -0,0 +1,130 @@
+"""
+Django Management Command: comparisons avoided by autobinding blocking
+Usage: python manage.py bench_autobinding_blocking [--houses 1000] [--rooms 2] [--orphans 50] [--score]
+
+Builds the scenarios/house2.0 topology in memory, replicated --houses times
+(no database rows), with one DT property and one device property per causal
+property (DT hierarchy rooted at "House 7", device "House 7 - Room 1 -
+AirConditioner1") and counts the DT x device property comparisons with and
+without blocking. --score also times the vectorized top-k over random unit
+vectors for both layouts.
+"""
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from orchestrator.blocking import Block, build_blocks, count_comparisons, extract_blocking_key
+from orchestrator.embeddings import top_k_similar
+
+# commands/ -> management/ -> orchestrator/ -> <project_root>
+SCENARIO_DIR = Path(__file__).resolve().parents[3] / "scenarios" / "house2.0"
+
+CAUSAL = "Causal"
+
+
+def _base_id(dtmi):
+    return dtmi.split(";")[0]
+
+
+def load_scenario(directory):
+    """{model id: (name, causal property names, [(relationship name, target id)])} and the root model id."""
+    models = {}
+    for path in sorted(Path(directory).glob("*.json")):
+        spec = json.loads(path.read_text())
+        causal, relationships = [], []
+        for content in spec.get("contents", []):
+            types = content.get("@type")
+            types = types if isinstance(types, list) else [types]
+            if "Property" in types and CAUSAL in types:
+                causal.append(content["name"])
+            elif "Relationship" in types:
+                relationships.append((content["name"], _base_id(content["target"])))
+        models[_base_id(spec["@id"])] = (spec["@id"].split(":")[-1].split(";")[0], causal, relationships)
+    targets = {target for _, _, rels in models.values() for _, target in rels}
+    roots = [model_id for model_id in models if model_id not in targets]
+    if len(roots) != 1:
+        raise CommandError(f"Expected one root model in {directory}, found {roots}")
+    return models, roots[0]
+
+
+def build_topology(models, root_id, houses, rooms):
+    """DT property blocking sources (hierarchy roots) and device names, one entry per causal property."""
+    dt_roots, device_names = [], []
+
+    def walk(model_id, house, path, ordinal):
+        name, causal, relationships = models[model_id]
+        if path:
+            instance = f"{name}{ordinal}" if not relationships else f"{name} {ordinal}"
+            path = path + [instance]
+        else:
+            path = [f"{name} {house}"]
+        for prop in causal:
+            dt_roots.append(path[0])
+            device_names.append(" - ".join(path))
+        for rel_name, target in relationships:
+            fanout = rooms if rel_name == "has_rooms" else 1
+            for i in range(1, fanout + 1):
+                walk(target, house, path, i)
+
+    for house in range(1, houses + 1):
+        walk(root_id, house, [], house)
+    return dt_roots, device_names
+
+
+class Command(BaseCommand):
+    help = 'Count autobinding comparisons avoided by house/room blocking on the House 2.0 topology'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--houses', type=int, default=1000, help='Copies of the House 2.0 topology (default: 1000)')
+        parser.add_argument('--rooms', type=int, default=2, help='Rooms per house (default: 2)')
+        parser.add_argument('--orphans', type=int, default=0,
+                            help='Extra device properties with no house identifier (land in the fallback bucket)')
+        parser.add_argument('--scenario-dir', default=str(SCENARIO_DIR), help='Directory with the DTDL models')
+        parser.add_argument('--score', action='store_true',
+                            help='Also time the top-k similarity search over random unit vectors (dim 384)')
+        parser.add_argument('--top-k', type=int, default=32)
+
+    def handle(self, *args, **options):
+        models, root_id = load_scenario(options['scenario_dir'])
+        dt_roots, device_names = build_topology(models, root_id, max(1, options['houses']), max(1, options['rooms']))
+        device_names += [f"Sensor Gateway Spare {chr(65 + i % 26)}" for i in range(options['orphans'])]
+        print(f"[{datetime.now().isoformat()}] 🏠 {options['houses']} houses: {len(dt_roots)} DT properties, {len(device_names)} device properties")
+
+        t0 = time.perf_counter()
+        dt_keys = [extract_blocking_key(name) for name in dt_roots]
+        device_keys = [extract_blocking_key(name) for name in device_names]
+        blocks = build_blocks(dt_keys, device_keys)
+        blocking_time = time.perf_counter() - t0
+        full = Block(None, list(range(len(dt_roots))), list(range(len(device_names))))
+
+        total = count_comparisons([full])
+        blocked = count_comparisons(blocks)
+        shared = {block.key for block in blocks if block.key is not None}
+        fallback_dt = sum(len(block.rows) for block in blocks if block.key is None)
+        fallback_devices = sum(1 for key in device_keys if key not in shared)
+        print(
+            f"[{datetime.now().isoformat()}] BENCH_AUTOBINDING_BLOCKING houses={options['houses']} blocks={len(shared)} "
+            f"fallback_dt={fallback_dt} fallback_devices={fallback_devices} "
+            f"comparisons_full={total} comparisons_blocked={blocked} avoided={total - blocked} "
+            f"avoided_pct={100.0 * (total - blocked) / max(1, total):.3f} blocking_ms={blocking_time * 1000:.1f}"
+        )
+
+        if options['score']:
+            rng = np.random.default_rng(0)
+            dt_vectors = rng.standard_normal((len(dt_roots), 384)).astype(np.float32)
+            device_vectors = rng.standard_normal((len(device_names), 384)).astype(np.float32)
+            dt_vectors /= np.linalg.norm(dt_vectors, axis=1, keepdims=True)
+            device_vectors /= np.linalg.norm(device_vectors, axis=1, keepdims=True)
+            for label, layout in (('full', [full]), ('blocked', blocks)):
+                t0 = time.perf_counter()
+                for block in layout:
+                    cols = np.asarray(block.cols)
+                    for _ in top_k_similar(dt_vectors[block.rows], device_vectors[cols], options['top_k']):
+                        pass
+                print(f"[{datetime.now().isoformat()}] BENCH_AUTOBINDING_BLOCKING_SCORE layout={label} seconds={time.perf_counter() - t0:.3f}")
+
+        self.stdout.write(self.style.SUCCESS('Autobinding blocking benchmark finished'))
@@ -0,0 +1,97 @@
+"""
+Django Management Command: bulk twin instantiation benchmark
+Usage: python manage.py bench_bulk_instantiation --system-id 1 [--template template.json] [--replicas 10000] [--compare 20] [--keep]
+
+Creates --replicas copies of the template tree (default: 10k houses of
+template.json) through orchestrator.instantiation in one transaction and
+logs BENCH_BULK_INSTANTIATION with instances/properties/relationships per
+second. With --compare N, N replicas are first created the former way (one
+DigitalTwinInstance.objects.create + relationship per node) to put the
+per-instance cost side by side. Device binding suggestions are skipped
+(they do not depend on how the rows are written). The run is one
+transaction, rolled back at the end unless --keep.
+"""
+import json
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from orchestrator.instantiation import RelationshipResolver, instantiate, match_models, replicate, resolve_tree, tree_names
+from orchestrator.models import (
+    DigitalTwinInstance,
+    DigitalTwinInstanceProperty,
+    DigitalTwinInstanceRelationship,
+    DTDLModel,
+    SystemContext,
+)
+
+
+def _create_one_by_one(nodes, parent=None, created=None):
+    created = [] if created is None else created
+    for node in nodes:
+        instance = DigitalTwinInstance.objects.create(model=node["model"], name=node["name"])
+        created.append(instance)
+        if parent is not None and node["relationship"] is not None:
+            DigitalTwinInstanceRelationship.objects.create(
+                source_instance=parent, target_instance=instance, relationship=node["relationship"]
+            )
+        _create_one_by_one(node["children"], instance, created)
+    return created
+
+
+class Command(BaseCommand):
+    help = 'Benchmark of the bulk twin instantiation engine (N replicas of a template tree)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--system-id', type=int, required=True, help='System whose DTDL models the template maps to')
+        parser.add_argument('--template', default='template.json')
+        parser.add_argument('--replicas', type=int, default=10000, help='Template copies to create (default: 10000)')
+        parser.add_argument('--compare', type=int, default=0, help='Also create N replicas one instance at a time')
+        parser.add_argument('--similarity-threshold', type=float, default=0.60)
+        parser.add_argument('--keep', action='store_true', help='Keep the created instances')
+
+    def _report(self, mode, replicas, ids, elapsed):
+        properties = DigitalTwinInstanceProperty.objects.filter(dtinstance_id__in=ids).count()
+        relationships = DigitalTwinInstanceRelationship.objects.filter(target_instance_id__in=ids).count()
+        rate = lambda n: n / elapsed if elapsed > 0 else 0.0
+        print(
+            f"[{datetime.now().isoformat()}] BENCH_BULK_INSTANTIATION mode={mode} replicas={replicas} "
+            f"instances={len(ids)} properties={properties} relationships={relationships} "
+            f"elapsed_s={elapsed:.2f} instances_per_s={rate(len(ids)):.0f} "
+            f"rows_per_s={rate(len(ids) + properties + relationships):.0f}"
+        )
+
+    def handle(self, *args, **options):
+        system = SystemContext.objects.filter(id=options['system_id']).first()
+        if system is None:
+            raise CommandError(f"System {options['system_id']} not found")
+        with open(options['template'], 'r') as f:
+            template = json.load(f)
+        dtdl_models = list(DTDLModel.objects.filter(system=system))
+        roots = resolve_tree(
+            template,
+            match_models(tree_names(template), dtdl_models, options['similarity_threshold']),
+            RelationshipResolver(system),
+        )
+        if not roots:
+            raise CommandError("No DTDL model matches the root of the template")
+
+        with transaction.atomic():
+            if options['compare'] > 0:
+                t0 = time.perf_counter()
+                ids = [i.id for i in _create_one_by_one(replicate(roots[0], options['compare'], "{base} one-by-one {i}"))]
+                self._report("one_by_one", options['compare'], ids, time.perf_counter() - t0)
+
+            with CaptureQueriesContext(connection) as queries:
+                t0 = time.perf_counter()
+                instances = instantiate(replicate(roots[0], options['replicas'], "{base} bulk {i}"), bind_devices=False)
+                elapsed = time.perf_counter() - t0
+            print(f"[{datetime.now().isoformat()}] 🔢 Bulk instantiation queries: {len(queries)}")
+            self._report("bulk", options['replicas'], [i.id for i in instances], elapsed)
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS('Bulk instantiation benchmark finished'))
@@ -0,0 +1,144 @@
+"""
+Django Management Command: Neo4j query plans with and without the twin-graph schema
+Usage: python manage.py bench_neo4j_schema [--nodes 100000] [--properties-per-twin 4] [--lookups 200] [--keep]
+
+Builds a synthetic graph of --nodes DigitalTwin + TwinProperty nodes under a
+synthetic SystemContext (negative ids, so it never collides with synced
+data), then PROFILEs the lookups used by the sync (property/twin by id, the
+UNWIND upsert) and the old name-based property match, first without the
+constraints/indexes of orchestrator.neo4j_schema and then with them. Each
+query logs BENCH_NEO4J_SCHEMA with the plan's leaf operators, total db hits
+and the mean latency over --lookups runs.
+
+Meant for a development Neo4j: the schema is dropped during the "before"
+phase and re-created at the end.
+"""
+import random
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from neomodel import db
+
+from orchestrator.neo4j_schema import await_indexes, drop_schema, ensure_schema
+from orchestrator.neo4j_sync import UPSERT_PROPERTIES, run_batched
+
+SYSTEM_ID = -1
+
+QUERIES = {
+    "property_by_id": "MATCH (p:TwinProperty {property_id: $property_id}) RETURN p.value",
+    "twin_by_id": "MATCH (t:DigitalTwin {dt_id: $dt_id}) RETURN t.name",
+    "property_by_names": (
+        "MATCH (p:TwinProperty)<-[:HAS_PROPERTY]-(t:DigitalTwin) "
+        "WHERE t.name = $twin_name AND p.name = $property_name RETURN p"
+    ),
+    "upsert_properties": UPSERT_PROPERTIES,
+}
+
+CLEANUP = """
+MATCH (:SystemContext {system_id: $system_id})-[:CONTAINS]->(t:DigitalTwin)
+WITH t LIMIT 5000
+OPTIONAL MATCH (t)-[:HAS_PROPERTY]->(p:TwinProperty)
+DETACH DELETE p, t
+RETURN count(DISTINCT t)
+"""
+
+
+def _plan_summary(profile):
+    """(total db hits, leaf operator names) of a PROFILE plan."""
+    hits = profile.get("dbHits", 0)
+    children = profile.get("children") or []
+    leaves = [] if children else [profile.get("operatorType", "?").split("@")[0]]
+    for child in children:
+        child_hits, child_leaves = _plan_summary(child)
+        hits += child_hits
+        leaves += child_leaves
+    return hits, leaves
+
+
+def _profile(query, params):
+    db.cypher_query("RETURN 1")  # opens the neomodel driver if needed
+    with db.driver.session(database=db._database_name) as session:
+        return session.run("PROFILE " + query, params).consume().profile
+
+
+def _rows(twins, properties_per_twin):
+    rows = []
+    for i in range(1, twins + 1):
+        dt_id = -i
+        for j in range(properties_per_twin):
+            rows.append({
+                "system_id": SYSTEM_ID,
+                "system_name": "bench_neo4j_schema",
+                "system_description": "Synthetic graph (bench_neo4j_schema)",
+                "dt_id": dt_id,
+                "twin_name": f"BenchTwin - {dt_id}",
+                "twin_description": f"Digital Twin Instance {dt_id}",
+                "model_name": f"BenchModel{i % 20}",
+                "property_id": dt_id * properties_per_twin - j,
+                "name": f"prop{j}",
+                "value": "0",
+                "type": "Property",
+            })
+    return rows
+
+
+class Command(BaseCommand):
+    help = 'PROFILE twin-graph lookups on a synthetic Neo4j graph before and after ensure_neo4j_schema'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nodes', type=int, default=100000, help='Twin + property nodes to create (default: 100000)')
+        parser.add_argument('--properties-per-twin', type=int, default=4)
+        parser.add_argument('--lookups', type=int, default=200, help='Timed runs per query and phase (default: 200)')
+        parser.add_argument('--keep', action='store_true', help='Keep the synthetic graph at the end')
+
+    def handle(self, *args, **options):
+        per_twin = max(1, options['properties_per_twin'])
+        twins = max(1, options['nodes'] // (per_twin + 1))
+        rows = _rows(twins, per_twin)
+        try:
+            ensure_schema()
+        except Exception as e:
+            raise CommandError(f"Neo4j unreachable: {e}")
+        await_indexes()
+
+        t0 = time.perf_counter()
+        run_batched(UPSERT_PROPERTIES, "rows", rows, 5000)
+        elapsed = time.perf_counter() - t0
+        print(f"[{datetime.now().isoformat()}] 🧱 Synthetic graph: {twins} twins, {len(rows)} properties in {elapsed:.1f}s")
+
+        rng = random.Random(0)
+        samples = rng.sample(rows, min(options['lookups'], len(rows)))
+        params = {
+            "property_by_id": [{"property_id": row["property_id"]} for row in samples],
+            "twin_by_id": [{"dt_id": row["dt_id"]} for row in samples],
+            "property_by_names": [{"twin_name": row["twin_name"], "property_name": row["name"]} for row in samples],
+            "upsert_properties": [{"rows": samples[i:i + 10]} for i in range(0, len(samples), 10)],
+        }
+        try:
+            for phase in ("before", "after"):
+                if phase == "before":
+                    drop_schema()
+                else:
+                    ensure_schema()
+                    await_indexes()
+                for name, query in QUERIES.items():
+                    hits, leaves = _plan_summary(_profile(query, params[name][0]))
+                    t0 = time.perf_counter()
+                    for p in params[name]:
+                        db.cypher_query(query, p)
+                    mean_ms = (time.perf_counter() - t0) * 1000.0 / len(params[name])
+                    print(
+                        f"[{datetime.now().isoformat()}] BENCH_NEO4J_SCHEMA phase={phase} query={name} "
+                        f"plan={'+'.join(sorted(set(leaves)))} db_hits={hits} mean_ms={mean_ms:.3f}"
+                    )
+        finally:
+            ensure_schema()
+            if not options['keep']:
+                deleted = 1
+                while deleted:
+                    rows_deleted, _ = db.cypher_query(CLEANUP, {"system_id": SYSTEM_ID})
+                    deleted = rows_deleted[0][0]
+                db.cypher_query("MATCH (s:SystemContext {system_id: $system_id}) DETACH DELETE s", {"system_id": SYSTEM_ID})
+
+        self.stdout.write(self.style.SUCCESS('Neo4j schema benchmark finished'))
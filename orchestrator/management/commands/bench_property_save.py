@@ -0,0 +1,121 @@
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.structured_logging import HOTPATH_LOGGERS, TextFormatter, configure_hotpath_logging
+from facade.models import Property
+from facade.rpc import RPCResponse
+from orchestrator.models import DigitalTwinInstanceProperty
+
+MODES = ('off', 'sync-debug', 'queued-debug', 'queued')
+
+
+class Command(BaseCommand):
+    help = 'Microbenchmark of Property / DigitalTwinInstanceProperty save() under different hot-path logging setups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=['property', 'dt-property'], default='dt-property',
+                            help='Save a device Property or a causal DT property bound to one (default: dt-property)')
+        parser.add_argument('--id', type=int, default=None,
+                            help='Primary key of the object to save (default: first eligible one)')
+        parser.add_argument('--saves', type=int, default=2000, help='Saves per mode (default: 2000)')
+        parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES),
+                            help='off: logging disabled; sync-debug: DEBUG + timing written inline (like the former print() calls); '
+                                 'queued-debug: same volume through the background listener; queued: configured defaults')
+        parser.add_argument('--log-file', default=os.devnull,
+                            help='Where log lines go during the benchmark (default: /dev/null)')
+
+    def _target(self, options):
+        if options['target'] == 'property':
+            qs = Property.objects.select_related('device__gateway').exclude(rpc_write_method__isnull=True).exclude(rpc_write_method='')
+        else:
+            qs = DigitalTwinInstanceProperty.objects.select_related(
+                'property', 'device_property__device__gateway'
+            ).filter(device_property__isnull=False)
+        if options['id'] is not None:
+            qs = qs.filter(pk=options['id'])
+        obj = qs.order_by('pk').first()
+        if obj is None:
+            raise CommandError(f"No eligible {options['target']} found")
+        return obj
+
+    def _configure(self, mode, stream):
+        if mode == 'queued':
+            configure_hotpath_logging(
+                level=getattr(settings, 'HOTPATH_LOG_LEVEL', 'INFO'),
+                fmt=getattr(settings, 'HOTPATH_LOG_FORMAT', 'text'),
+                timing=getattr(settings, 'HOTPATH_LOG_TIMING', False),
+                stream=stream, force=True,
+            )
+        elif mode == 'queued-debug':
+            configure_hotpath_logging(level='DEBUG', timing=True, stream=stream, force=True)
+        else:
+            configure_hotpath_logging(stream=stream, force=True)
+            handler = logging.StreamHandler(stream)
+            handler.setFormatter(TextFormatter())
+            for name in HOTPATH_LOGGERS:
+                logger = logging.getLogger(name)
+                if mode == 'off':
+                    logger.setLevel(logging.CRITICAL + 1)
+                else:
+                    logger.handlers = [handler]
+                    logger.setLevel(logging.DEBUG)
+                    logging.getLogger(f"{name}.timing").setLevel(logging.INFO)
+
+    def _run_mode(self, obj, target, saves):
+        device_property = obj if target == 'property' else obj.device_property
+        samples = []
+        with transaction.atomic():
+            for i in range(saves):
+                value = str(i % 100)
+                # Stub a successful RPC so only the save path itself is measured
+                response = RPCResponse(200, json.dumps({device_property.name: value}))
+                obj.value = value
+                t0 = time.perf_counter()
+                if target == 'property':
+                    obj.save(rpc_response=response)
+                else:
+                    obj.save(device_rpc_response=response, correlation_id=f"bench-{i}")
+                samples.append(time.perf_counter() - t0)
+            transaction.set_rollback(True)
+        samples.sort()
+        return {
+            'mean': sum(samples) / len(samples),
+            'p50': samples[len(samples) // 2],
+            'p99': samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+        }
+
+    def handle(self, *args, **options):
+        obj = self._target(options)
+        saves = max(1, options['saves'])
+        print(f"[{datetime.now().isoformat()}] ⏱️ Save benchmark: {saves} saves of {options['target']} id={obj.pk} per mode, logs -> {options['log_file']}")
+
+        results = {}
+        with open(options['log_file'], 'a') as stream:
+            try:
+                for mode in options['modes']:
+                    self._configure(mode, stream)
+                    self._run_mode(obj, options['target'], min(saves, 50))  # warm up
+                    results[mode] = r = self._run_mode(obj, options['target'], saves)
+                    overhead = ''
+                    if 'off' in results and mode != 'off':
+                        overhead = f" overhead_us={(r['mean'] - results['off']['mean']) * 1e6:.1f}"
+                    print(
+                        f"[{datetime.now().isoformat()}] BENCH_PROPERTY_SAVE mode={mode} target={options['target']} saves={saves} "
+                        f"mean_us={r['mean'] * 1e6:.1f} p50_us={r['p50'] * 1e6:.1f} p99_us={r['p99'] * 1e6:.1f}{overhead}"
+                    )
+            finally:
+                # Back to the configured setup on stdout
+                configure_hotpath_logging(
+                    level=getattr(settings, 'HOTPATH_LOG_LEVEL', 'INFO'),
+                    fmt=getattr(settings, 'HOTPATH_LOG_FORMAT', 'text'),
+                    timing=getattr(settings, 'HOTPATH_LOG_TIMING', False),
+                    force=True,
+                )
+        self.stdout.write(self.style.SUCCESS('Property save benchmark finished'))
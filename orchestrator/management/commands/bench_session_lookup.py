@@ -0,0 +1,117 @@
+import threading
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from facade import utils
+
+
+class _LegacyLookup:
+    """get_session_for_gateway as it was before the per-gateway registry.
+
+    Every lookup took the process-wide _request_lock and then the Redis
+    session manager lock before reading the session dict; creating a session
+    also ran the Redis INCR/EXPIRE (and SETEX for the first process) under
+    both locks. The session objects themselves come from the current manager.
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.request_lock = threading.Lock()
+        self.manager_lock = threading.Lock()
+
+    def __call__(self, gateway_id):
+        with self.request_lock:
+            with self.manager_lock:
+                sessions = self.manager._local_sessions
+                if gateway_id in sessions:
+                    return sessions[gateway_id]
+                redis_client = self.manager._redis_client
+                if redis_client:
+                    try:
+                        connection_count_key = f"urllc:session:{gateway_id}:connections"
+                        connection_count = redis_client.incr(connection_count_key)
+                        redis_client.expire(connection_count_key, 3600)
+                        if connection_count == 1:
+                            redis_client.setex(self.manager._get_session_key(gateway_id), 3600, "primary")
+                    except Exception:
+                        pass
+                return self.manager.get_session(gateway_id)
+
+
+class Command(BaseCommand):
+    help = 'Microbenchmark of facade.utils.get_session_for_gateway lookups under concurrent threads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', nargs='+', type=int, default=[1, 8, 64],
+                            help='Thread counts to benchmark (default: 1 8 64)')
+        parser.add_argument('--lookups', type=int, default=50000,
+                            help='Lookups per thread (default: 50000)')
+        parser.add_argument('--gateways', type=int, default=4,
+                            help='Distinct gateway ids the threads spread over (default: 4)')
+        parser.add_argument('--compare-legacy', action='store_true',
+                            help='Also run each case through the previous lookup path (_request_lock + manager lock)')
+
+    def _run_case(self, n_threads, lookups, gateway_ids, lookup):
+        barrier = threading.Barrier(n_threads + 1)
+        samples = [[] for _ in range(n_threads)]
+
+        def worker(idx):
+            local_samples = samples[idx]
+            n_gw = len(gateway_ids)
+            barrier.wait()
+            for i in range(lookups):
+                gateway_id = gateway_ids[(idx + i) % n_gw]
+                # Sample 1 in 64 lookups to keep timer overhead out of the throughput number
+                if i & 63 == 0:
+                    t0 = time.perf_counter_ns()
+                lookup(gateway_id)
+                if i & 63 == 0:
+                    local_samples.append(time.perf_counter_ns() - t0)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(n_threads)]
+        for t in threads:
+            t.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(x for s in samples for x in s)
+        total = n_threads * lookups
+        p50 = latencies[len(latencies) // 2] if latencies else 0
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0
+        return {
+            'total': total,
+            'elapsed': elapsed,
+            'ops_per_s': total / elapsed if elapsed else 0.0,
+            'p50_ns': p50,
+            'p99_ns': p99,
+        }
+
+    def handle(self, *args, **options):
+        lookups = max(1, options['lookups'])
+        gateway_ids = list(range(1, max(1, options['gateways']) + 1))
+
+        # Warm up: create the sessions so every measured lookup hits an existing gateway
+        for gateway_id in gateway_ids:
+            utils.get_session_for_gateway(gateway_id)
+
+        modes = [('registry', utils.get_session_for_gateway)]
+        if options['compare_legacy']:
+            modes.append(('legacy', _LegacyLookup(utils._redis_session_manager)))
+
+        print(f"[{datetime.now().isoformat()}] ⏱️ Session lookup benchmark: {lookups} lookups/thread over {len(gateway_ids)} gateways")
+        for n_threads in options['threads']:
+            for mode, lookup in modes:
+                r = self._run_case(max(1, n_threads), lookups, gateway_ids, lookup)
+                print(
+                    f"[{datetime.now().isoformat()}] BENCH_SESSION_LOOKUP mode={mode} threads={n_threads} "
+                    f"lookups={r['total']} elapsed={r['elapsed']:.3f}s ops_per_s={r['ops_per_s']:.0f} "
+                    f"p50_ns={r['p50_ns']} p99_ns={r['p99_ns']}"
+                )
+
+        utils.close_all_sessions()
+        self.stdout.write(self.style.SUCCESS('Session lookup benchmark finished'))
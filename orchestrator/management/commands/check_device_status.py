@@ -4,41 +4,22 @@ from asgiref.sync import sync_to_async
 import requests
 import json
 import logging
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
 from facade.models import Device, Property, write_inactivity_event, InactivityType
-from orchestrator.models import DigitalTwinInstance, DigitalTwinInstanceProperty
-from facade.api import get_jwt_token_gateway
+from orchestrator.liveness import StatusTransitionBatch
+from core.api import get_gateway_auth_headers
 from datetime import datetime, timedelta
 
 # Configuração básica de logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class JWTTokenManager:
-    def __init__(self):
-        self.tokens = {}  # {gateway_id: {'token': token, 'expires_at': datetime}}
-        self.token_lifetime = timedelta(hours=23)  # Define um tempo de vida menor que 24h para ter margem de segurança
-
-    def get_token(self, gateway_id):
-        if gateway_id in self.tokens:
-            token_data = self.tokens[gateway_id]
-            if datetime.now() < token_data['expires_at']:
-                return token_data['token']
-            
-        return None
-
-    def set_token(self, gateway_id, token):
-        self.tokens[gateway_id] = {
-            'token': token,
-            'expires_at': datetime.now() + self.token_lifetime
-        }
-
 class Command(BaseCommand):
     help = 'Periodically check device status in ThingsBoard and update local DigitalTwin status'
 
     def __init__(self):
         super().__init__()
-        self.token_manager = JWTTokenManager()
         # Reuse a requests.Session per gateway to benefit from connection pooling
         self.sessions = {}  # gateway_id -> requests.Session()
 
@@ -63,6 +44,13 @@ class Command(BaseCommand):
         )
 
     def handle(self, *args, **options):
+        if getattr(settings, 'LIVENESS_ENABLED', True):
+            # listen_gateway já mantém DigitalTwinInstance.active a partir da telemetria:
+            # dois escritores (silêncio vs. atributo 'active' do TB) alternariam as mesmas linhas
+            raise CommandError(
+                "LIVENESS_ENABLED=True: listen_gateway owns DigitalTwinInstance.active. "
+                "Set LIVENESS_ENABLED=False (listen_gateway then runs without liveness) to use this status poller."
+            )
         interval = options['interval']
         device_ids = options['device_ids']
         # Store concurrency option on the instance for check_devices_status
@@ -74,20 +62,12 @@ class Command(BaseCommand):
         except KeyboardInterrupt:
             logger.info("Stopping device status checker...")
 
-    async def get_jwt_token(self, device):
-        gateway_id = device.gateway_id
-        cached_token = self.token_manager.get_token(gateway_id)
-        if cached_token:
-            logger.info(f"Using cached JWT token for gateway {gateway_id}")
-            return cached_token
-
-        logger.info(f"Requesting new JWT token for gateway {gateway_id}")
-        response, status_code = await sync_to_async(get_jwt_token_gateway)(None, gateway_id)
+    async def get_auth_headers(self, device, force_refresh=False):
+        """Gateway auth headers from the process-wide token cache (JWT or ApiKey)."""
+        response, status_code = await sync_to_async(get_gateway_auth_headers)(None, device.gateway_id, force_refresh)
         if status_code == 200:
-            token = response['token']
-            self.token_manager.set_token(gateway_id, token)
-            return token
-        logger.error(f"Failed to get JWT token for gateway {gateway_id}, status code: {status_code}")
+            return response['headers']
+        logger.error(f"Failed to get auth headers for gateway {device.gateway_id}, status code: {status_code}: {response.get('error')}")
         return None
 
     def _get_session(self, gateway_id):
@@ -98,11 +78,12 @@ class Command(BaseCommand):
             self.sessions[gateway_id] = s
         return self.sessions[gateway_id]
 
-    async def check_device_status(self, device):
+    async def check_device_status(self, device, batch):
+        """Check one device; its state is recorded in `batch` (applied once per cycle)."""
         logger.info(f"Checking status for device {device.name} (ID: {device.id})")
         try:
-            jwt_token = await self.get_jwt_token(device)
-            if not jwt_token:
+            headers = await self.get_auth_headers(device)
+            if not headers:
                 logger.warning(f"Failed to get JWT token for device {device.name}")
                 await sync_to_async(write_inactivity_event)(
                     device, 
@@ -112,10 +93,6 @@ class Command(BaseCommand):
                 return False
 
             url = f"{device.gateway.url}/api/plugins/telemetry/DEVICE/{device.identifier}/values/attributes"
-            headers = {
-                "Content-Type": "application/json",
-                "X-Authorization": f"Bearer {jwt_token}"
-            }
             # Use a session per gateway to reuse TCP connections and reduce latency
             session = self._get_session(device.gateway_id)
             request_timeout = 3
@@ -132,10 +109,8 @@ class Command(BaseCommand):
 
             if response.status_code == 401:
                 logger.warning(f"JWT token expired for device {device.name}, requesting a new one...")
-                self.token_manager.set_token(device.gateway_id, None)
-                jwt_token = await self.get_jwt_token(device)
-                if jwt_token:
-                    headers["X-Authorization"] = f"Bearer {jwt_token}"
+                headers = await self.get_auth_headers(device, force_refresh=True)
+                if headers:
                     response = await sync_to_async(session.get)(url, headers=headers, timeout=request_timeout)
 
             if response.status_code == 200:
@@ -155,19 +130,7 @@ class Command(BaseCommand):
                         "Device marked as inactive in ThingsBoard"
                     )
 
-                dt_instances = await sync_to_async(list)(
-                    DigitalTwinInstance.objects.filter(
-                        digitaltwininstanceproperty__device_property__device=device
-                    ).distinct()
-                )
-
-                for dt_instance in dt_instances:
-                    current_active = await sync_to_async(lambda: dt_instance.active)()
-                    if current_active != is_active:
-                        logger.info(f"Updating DigitalTwinInstance {dt_instance.id} status to {'active' if is_active else 'inactive'}")
-                        dt_instance.active = is_active
-                        await sync_to_async(dt_instance.save)()
-
+                batch.observe(device, is_active)
                 return is_active
             else:
                 logger.error(f"Failed to check status for device {device.name}, HTTP {response.status_code}: {response.text}")
@@ -192,9 +155,9 @@ class Command(BaseCommand):
         while True:
             try:
                 if device_ids:
-                    devices = await sync_to_async(list)(Device.objects.filter(id__in=device_ids).select_related('gateway')) 
+                    devices = await sync_to_async(list)(Device.objects.filter(id__in=device_ids).select_related('gateway', 'type'))
                 else:
-                    devices = await sync_to_async(list)(Device.objects.all().select_related('gateway'))
+                    devices = await sync_to_async(list)(Device.objects.all().select_related('gateway', 'type'))
 
                 logger.info(f"Found {len(devices)} devices to check")
                 # Concurrency control to avoid creating too many simultaneous requests
@@ -205,13 +168,20 @@ class Command(BaseCommand):
                 else:
                     sem = asyncio.Semaphore(int(concurrency))
 
+                batch = StatusTransitionBatch()
+
                 async def _bounded_check(d):
                     async with sem:
-                        return await self.check_device_status(d)
+                        return await self.check_device_status(d, batch)
 
                 tasks = [ _bounded_check(device) for device in devices ]
                 await asyncio.gather(*tasks)
 
+                # All active/inactive flips of this cycle: one SELECT + one UPDATE
+                transitions = await sync_to_async(batch.apply)()
+                for instance_id, _, is_active, _ in transitions:
+                    logger.info(f"Updated DigitalTwinInstance {instance_id} status to {'active' if is_active else 'inactive'}")
+
                 await asyncio.sleep(interval)
             except Exception as e:
                 logger.exception(f"Error in check_devices_status: {e}")
@@ -30,7 +30,7 @@ class Command(BaseCommand):
             causal_properties = list(DigitalTwinInstanceProperty.objects.filter(
                 dtinstance=dt_instance, 
                 property__supplement_types__contains=["dtmi:dtdl:extension:causal:v1:Causal"]
-            ))
+            ).select_related('property', 'device_property__device__gateway'))
             props_time = time.time() - props_start
             print(f"[{datetime.now().isoformat()}] 📝 Found {len(causal_properties)} causal properties in {props_time:.3f}s")
             
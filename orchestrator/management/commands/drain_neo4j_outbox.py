@@ -0,0 +1,65 @@
+"""
+Django Management Command: apply pending twin-graph changes to Neo4j
+Usage: python manage.py drain_neo4j_outbox [--batch-size 1000] [--interval 0.5] [--once]
+
+Reads orchestrator.Neo4jOutbox (filled by the signal handlers), coalesces the
+changes per property/relationship and writes each batch with UNWIND ... MERGE.
+Every batch logs NEO4J_OUTBOX_DRAIN with the outbox lag.
+"""
+import logging
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from orchestrator.neo4j_outbox import drain_once, outbox_stats
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Drain the Neo4j outbox: coalesce pending twin-graph changes and apply them in UNWIND batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'NEO4J_OUTBOX_BATCH_SIZE', 1000),
+                            help='Outbox entries per batch')
+        parser.add_argument('--interval', type=float, default=getattr(settings, 'NEO4J_OUTBOX_POLL_INTERVAL', 0.5),
+                            help='Seconds to wait when the outbox is empty')
+        parser.add_argument('--once', action='store_true', help='Drain until the outbox is empty, then exit')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        interval = max(0.05, options['interval'])
+        backoff = interval
+        stats = outbox_stats()
+        print(f"[{datetime.now().isoformat()}] 🔄 Neo4j outbox drainer: {stats['pending']} pending, lag {stats['lag_seconds']:.1f}s, batch {batch_size}")
+
+        total = 0
+        try:
+            while True:
+                try:
+                    result = drain_once(batch_size)
+                except Exception as e:
+                    if options['once']:
+                        raise CommandError(f"Neo4j outbox drain failed: {e}")
+                    # Entries stay in the outbox and are retried
+                    logger.warning(f"Neo4j outbox drain failed, retrying in {backoff:.1f}s: {e}")
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, 30.0)
+                    continue
+                backoff = interval
+                if result['entries']:
+                    total += result['entries']
+                    print(
+                        f"[{datetime.now().isoformat()}] NEO4J_OUTBOX_DRAIN entries={result['entries']} "
+                        f"applied={result['applied']} lag_ms={result['lag_ms']:.1f}"
+                    )
+                    continue
+                if options['once']:
+                    break
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f"Neo4j outbox drainer stopped after {total} entries"))
@@ -0,0 +1,36 @@
+"""
+Django Management Command: create the Neo4j constraints and indexes of the twin graph
+Usage: python manage.py ensure_neo4j_schema
+
+Idempotent (CREATE ... IF NOT EXISTS); entrypoint.sh runs it on start when
+USE_NEO4J is enabled. See orchestrator.neo4j_schema.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from orchestrator.neo4j_schema import await_indexes, ensure_schema, schema_state
+
+
+class Command(BaseCommand):
+    help = 'Create the Neo4j uniqueness constraints and indexes used by the twin-graph sync'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-wait', action='store_true', help='Do not wait for the new indexes to come online')
+
+    def handle(self, *args, **options):
+        try:
+            result = ensure_schema()
+        except Exception as e:
+            raise CommandError(f"Neo4j unreachable: {e}")
+        failed = {name: error for name, error in result.items() if error != "ok"}
+        if not options['no_wait']:
+            await_indexes()
+        state = schema_state()
+        for name in result:
+            line = f"{name}: {state.get(name, 'missing')}"
+            if name in failed:
+                self.stderr.write(self.style.ERROR(f"{line} ({failed[name]})"))
+            else:
+                self.stdout.write(line)
+        if failed:
+            raise CommandError(f"{len(failed)} Neo4j schema statement(s) failed")
+        self.stdout.write(self.style.SUCCESS('Neo4j schema is up to date'))
@@ -20,7 +20,7 @@ from django.db import transaction
 from facade.models import Device, Property
 from orchestrator.models import SystemContext, DTDLModel, DigitalTwinInstance, ModelElement, DigitalTwinInstanceProperty, DigitalTwinInstanceRelationship, ModelRelationship
 from orchestrator.utils import normalize_name
-from orchestrator.helpers import compute_similarity
+from orchestrator.embeddings import similarity_matrix
 import re
 import os
 from django.conf import settings
@@ -439,11 +439,13 @@ class Command(BaseCommand):
                         if not el:
                             best = None
                             best_score = 0.0
-                            for e in elems_qs:
-                                score = compute_similarity(prop.name, e.name)
-                                if score > best_score:
-                                    best_score = score
-                                    best = e
+                            elems = list(elems_qs)
+                            if elems:
+                                scores = similarity_matrix([prop.name], [e.name for e in elems])[0]
+                                idx = int(scores.argmax())
+                                if scores[idx] > best_score:
+                                    best_score = float(scores[idx])
+                                    best = elems[idx]
                             if best and best_score >= float(os.environ.get('ASSOC_SIM_THRESHOLD', 0.7)):
                                 el = best
                             else:
@@ -8,10 +8,14 @@ from asgiref.sync import sync_to_async
 import websockets
 from django.conf import settings
 from django.core.management.base import BaseCommand
-from facade.models import Property
+from facade.models import InactivityType, Property, write_inactivity_event
 from facade.utils import format_influx_line
-from orchestrator.models import DigitalTwinInstance, DigitalTwinInstanceProperty
-from datetime import datetime
+from facade.influx import get_influx_writer
+from core.api import get_gateway_auth_headers
+from core.gateway_auth import get_gateway_token_cache
+from orchestrator.models import DigitalTwinInstanceProperty
+from orchestrator.liveness import LivenessTracker, apply_liveness_transitions
+from orchestrator.telemetry import TelemetryBatcher, TelemetryIndex
 from urllib.parse import urlparse
 
 # Configuração básica de logging
@@ -19,15 +23,250 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 THINGSBOARD_WS_URL_TEMPLATE = "ws://{thingsboard_server}/api/ws/plugins/telemetry?token={your_jwt_token}"
-INFLUXDB_URL = f"http://{settings.INFLUXDB_HOST}:{settings.INFLUXDB_PORT}/api/v2/write?org={settings.INFLUXDB_ORGANIZATION}&bucket={settings.INFLUXDB_BUCKET}&precision=ms"
 INFLUXDB_TOKEN = settings.INFLUXDB_TOKEN
 USE_INFLUX_TO_EVALUATE = settings.USE_INFLUX_TO_EVALUATE
-INFLUX_WRITE_TIMEOUT = float(getattr(settings, 'INFLUX_WRITE_TIMEOUT', 0.2))
 
-headers = {
-    "Authorization": f"Token {INFLUXDB_TOKEN}",
-    "Content-Type": "text/plain"
-}
+SUBSCRIBE_BATCH_SIZE = 200  # tsSubCmds entries per WS frame when (re)subscribing
+
+
+def _ts_sub_cmd(device, cmd_id, unsubscribe=False):
+    cmd = {
+        "entityType": "DEVICE",
+        "entityId": device.identifier,
+        "scope": "LATEST_TELEMETRY",
+        "cmdId": cmd_id,
+    }
+    if unsubscribe:
+        cmd["unsubscribe"] = True
+    return cmd
+
+
+def _subscription_key(device):
+    # A device moved to another gateway or with a new ThingsBoard id needs a new subscription
+    return (device.gateway_id, device.identifier)
+
+
+def _gateway_fingerprint(gateway):
+    # What the socket URL and its token depend on
+    return (gateway.url, gateway.username, gateway.password, gateway.auth_method, gateway.api_key)
+
+
+class GatewaySubscriptionSocket:
+    """One ThingsBoard telemetry WebSocket carrying many device subscriptions.
+
+    Every device gets its own `cmdId`; ThingsBoard echoes it back as
+    `subscriptionId` on each update, which is how messages are routed to the
+    device. Devices can be added/removed while the socket is connected.
+    """
+
+    def __init__(self, command, gateway, shard):
+        self.command = command
+        self.gateway = gateway
+        self.shard = shard
+        self.devices_by_cmd = {}  # cmd_id -> device
+        self.cmd_by_device = {}   # device_id -> cmd_id
+        self._next_cmd_id = 1
+        self.websocket = None
+        self.task = None
+
+    @property
+    def name(self):
+        return f"gateway {self.gateway.id} socket #{self.shard}"
+
+    def __len__(self):
+        return len(self.cmd_by_device)
+
+    async def _send_cmds(self, cmds):
+        websocket = self.websocket
+        if websocket is None or not cmds:
+            return
+        for i in range(0, len(cmds), SUBSCRIBE_BATCH_SIZE):
+            await websocket.send(json.dumps({
+                "tsSubCmds": cmds[i:i + SUBSCRIBE_BATCH_SIZE],
+                "historyCmds": [],
+                "attrSubCmds": [],
+            }))
+
+    async def add(self, device):
+        cmd_id = self._next_cmd_id
+        self._next_cmd_id += 1
+        self.devices_by_cmd[cmd_id] = device
+        self.cmd_by_device[device.id] = cmd_id
+        try:
+            await self._send_cmds([_ts_sub_cmd(device, cmd_id)])
+        except websockets.exceptions.ConnectionClosed:
+            pass  # resubscribed on reconnect
+
+    async def remove(self, device_id):
+        cmd_id = self.cmd_by_device.pop(device_id, None)
+        if cmd_id is None:
+            return
+        device = self.devices_by_cmd.pop(cmd_id)
+        try:
+            await self._send_cmds([_ts_sub_cmd(device, cmd_id, unsubscribe=True)])
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def reconnect(self, gateway):
+        """Use the updated `gateway` (URL/credentials) from the next connection on."""
+        self.gateway = gateway
+        websocket = self.websocket
+        if websocket is not None:
+            await websocket.close()  # run() reconnects and resubscribes everything
+
+    async def run(self):
+        backoff_key = f"gw{self.gateway.id}-ws{self.shard}"
+        while True:
+            try:
+                jwt_token = await self.command.get_gateway_token(self.gateway, backoff_key)
+                if not jwt_token:
+                    await asyncio.sleep(5)
+                    continue
+
+                async with websockets.connect(self.command.build_ws_url(self.gateway, jwt_token), timeout=10) as websocket:
+                    self.websocket = websocket
+                    logger.info(f"Connected {self.name}; subscribing {len(self)} devices")
+                    await self._send_cmds([
+                        _ts_sub_cmd(device, cmd_id) for cmd_id, device in list(self.devices_by_cmd.items())
+                    ])
+                    self.command.failure_counts[backoff_key] = 0
+
+                    async for message in websocket:
+                        try:
+                            data = json.loads(message)
+                        except json.JSONDecodeError as e:
+                            logger.warning(f"Malformed message on {self.name}: {e}")
+                            continue
+                        cmd_id = data.get('subscriptionId')
+                        device = self.devices_by_cmd.get(cmd_id)
+                        if device is None:
+                            continue  # late update for a subscription removed meanwhile
+                        if data.get('errorCode'):
+                            logger.warning(f"Subscription error for device {device.name} on {self.name}: {data.get('errorMsg')}")
+                            continue
+                        try:
+                            await self.command.process_message(device, data)
+                        except Exception:
+                            # One device's bad update must not take down the other subscriptions
+                            logger.exception(f"Error processing message for device {device.name} on {self.name}")
+
+            except asyncio.CancelledError:
+                raise
+            except (websockets.exceptions.ConnectionClosed, asyncio.TimeoutError, OSError) as e:
+                self.websocket = None
+                delay = self._next_delay(backoff_key)
+                msg = str(e)
+                if isinstance(e, websockets.exceptions.ConnectionClosed) and getattr(e, 'code', None) == 1011 and 'Invalid JWT' in msg:
+                    self.command.rejected_tokens.add(self.gateway.id)
+                    logger.warning(f"Invalid JWT on {self.name}; will refresh token and retry in {delay}s")
+                elif self._should_log(backoff_key):
+                    logger.warning(f"Connection error on {self.name}: {msg}; reconnecting in {delay}s")
+                await asyncio.sleep(delay)
+            except Exception as e:
+                # e.g. handshake rejected (401/503 while ThingsBoard restarts): keep the shard alive
+                self.websocket = None
+                delay = self._next_delay(backoff_key)
+                if self._should_log(backoff_key):
+                    logger.warning(f"Unexpected error on {self.name} ({type(e).__name__}: {e}); reconnecting in {delay}s")
+                await asyncio.sleep(delay)
+            finally:
+                self.websocket = None
+
+    def _next_delay(self, backoff_key):
+        self.command.failure_counts[backoff_key] += 1
+        retries = self.command.failure_counts[backoff_key]
+        return min(60, 2 ** min(retries, 6))
+
+    def _should_log(self, backoff_key):
+        now = time.time()
+        if now - self.command.last_log_at[backoff_key] > 60:
+            self.command.last_log_at[backoff_key] = now
+            return True
+        return False
+
+
+class GatewayConnectionManager:
+    """Packs device subscriptions into as few WebSockets as possible.
+
+    One socket per gateway, sharded into additional sockets once a socket
+    holds `max_per_socket` subscriptions. `sync()` applies the difference
+    between the current and the desired device set incrementally.
+    """
+
+    def __init__(self, command, max_per_socket):
+        self.command = command
+        self.max_per_socket = max(1, int(max_per_socket))
+        self.sockets = defaultdict(list)  # gateway_id -> [GatewaySubscriptionSocket]
+        self.socket_by_device = {}        # device_id -> GatewaySubscriptionSocket
+        self.subscription_keys = {}       # device_id -> (gateway_id, identifier) it is subscribed with
+
+    def _socket_with_capacity(self, gateway):
+        shards = self.sockets[gateway.id]
+        for sock in shards:
+            if len(sock) < self.max_per_socket:
+                return sock
+        sock = GatewaySubscriptionSocket(self.command, gateway, shard=(shards[-1].shard + 1) if shards else 0)
+        sock.task = asyncio.create_task(sock.run())
+        shards.append(sock)
+        logger.info(f"Opened {sock.name} (max {self.max_per_socket} subscriptions per socket)")
+        return sock
+
+    def _restart_dead_sockets(self):
+        for shards in self.sockets.values():
+            for sock in shards:
+                if sock.task is not None and sock.task.done() and not sock.task.cancelled():
+                    error = sock.task.exception()
+                    logger.error(f"{sock.name} stopped ({error!r}); restarting it with {len(sock)} subscriptions")
+                    sock.task = asyncio.create_task(sock.run())
+
+    async def sync(self, devices):
+        """`devices` maps device_id -> Device (with gateway loaded)."""
+        self._restart_dead_sockets()
+        for device_id in list(self.socket_by_device.keys()):
+            device = devices.get(device_id)
+            if device is None or _subscription_key(device) != self.subscription_keys[device_id]:
+                sock = self.socket_by_device.pop(device_id)
+                del self.subscription_keys[device_id]
+                await sock.remove(device_id)
+                logger.info(f"Unsubscribed device {device_id} from {sock.name}" + ("" if device is None else " (gateway/identifier changed)"))
+
+        gateways = {device.gateway.id: device.gateway for device in devices.values()}
+        for gateway_id, shards in self.sockets.items():
+            gateway = gateways.get(gateway_id)
+            if gateway is not None and _gateway_fingerprint(gateway) != _gateway_fingerprint(shards[0].gateway):
+                logger.info(f"Gateway {gateway_id} URL/credentials changed; reconnecting {len(shards)} socket(s)")
+                for sock in shards:
+                    await sock.reconnect(gateway)
+
+        for device_id, device in devices.items():
+            if device_id not in self.socket_by_device:
+                sock = self._socket_with_capacity(device.gateway)
+                await sock.add(device)
+                self.socket_by_device[device_id] = sock
+                self.subscription_keys[device_id] = _subscription_key(device)
+
+        # Close sockets left without subscriptions
+        for gateway_id, shards in list(self.sockets.items()):
+            for sock in [s for s in shards if len(s) == 0]:
+                sock.task.cancel()
+                shards.remove(sock)
+                logger.info(f"Closed idle {sock.name}")
+            if not shards:
+                del self.sockets[gateway_id]
+
+    def stats(self):
+        return {
+            "sockets": sum(len(shards) for shards in self.sockets.values()),
+            "subscriptions": len(self.socket_by_device),
+            "connected": sum(1 for shards in self.sockets.values() for sock in shards if sock.websocket is not None),
+        }
+
+    def close(self):
+        for shards in self.sockets.values():
+            for sock in shards:
+                if sock.task:
+                    sock.task.cancel()
+
 
 class Command(BaseCommand):
     help = 'Starts WebSocket client to listen for ThingsBoard updates for all devices'
@@ -35,82 +274,59 @@ class Command(BaseCommand):
     def __init__(self):
         super().__init__()
         self.active_tasks = {}  # Armazena tarefas ativas por device_id
+        self.active_task_keys = {}  # device_id -> gateway/identificador com que a tarefa ativa foi criada
         self.use_influxdb = bool(USE_INFLUX_TO_EVALUATE)
         # Failure counters and last-log timestamps to throttle noisy errors
         self.failure_counts = defaultdict(int)
         self.last_log_at = defaultdict(lambda: 0.0)
-        # Token cache and per-gateway HTTP sessions to reduce auth/connection overhead
-        self.token_cache = {}  # gateway_id -> {'token': str, 'expires_at': epoch_seconds}
+        # Per-gateway HTTP sessions; JWTs come from the process-wide gateway token cache
         self.sessions = {}  # gateway_id -> requests.Session()
+        # Gateways whose JWT was rejected by ThingsBoard and must be refreshed on next use
+        self.rejected_tokens = set()
         # Concurrency semaphore will be set in handle() from CLI options
         self.sem = None
+        # Multiplexed mode (--multiplex): one WebSocket per gateway (sharded) instead of one per device
+        self.connection_manager = None
+        # (device_id, key) -> Property/DT property ids, and the batcher that writes values in bulk
+        self.telemetry_index = TelemetryIndex(getattr(settings, 'TELEMETRY_INDEX_REFRESH_INTERVAL', 300))
+        self.telemetry_batcher = TelemetryBatcher(getattr(settings, 'TELEMETRY_FLUSH_INTERVAL', 0.1))
+        # Device liveness from received telemetry (None when disabled with --no-liveness)
+        self.liveness = None
+        self.liveness_devices = {}  # device_id -> Device, for the fallback poll and inactivity events
 
     async def get_jwt_token(self, device):
-        gateway = device.gateway
+        return await self.get_gateway_token(device.gateway, device.id)
+
+    async def get_gateway_token(self, gateway, backoff_key):
+        """JWT (or ApiKey) for the gateway; failures back off per `backoff_key`."""
         if getattr(gateway, 'auth_method', None) == getattr(gateway, 'AUTH_METHOD_API_KEY', 'api_key'):
             if gateway.api_key:
                 return gateway.api_key
             logger.warning(f"Gateway {gateway} configured for ApiKey auth but api_key is empty")
             return None
-        # Check token cache first
         gw_id = getattr(gateway, 'id', None)
-        if gw_id is not None:
-            cached = self.token_cache.get(gw_id)
-            if cached and cached.get('token') and cached.get('expires_at', 0) > time.time():
-                return cached['token']
-        url = f"{gateway.url}/api/auth/login"
-        payload = {
-            "username": gateway.username,
-            "password": gateway.password
-        }
-        headers = {
-            "Content-Type": "application/json"
-        }
+        force_refresh = gw_id in self.rejected_tokens
         try:
-            response = await sync_to_async(requests.post)(url, headers=headers, data=json.dumps(payload), timeout=5)
-            # If login failed, log status and body to help debugging
-            if response.status_code != 200:
-                body = None
-                try:
-                    body = response.json()
-                except Exception:
-                    body = response.text
-                logger.warning(f"Failed to authenticate to {url}: status={response.status_code}, body={body}")
-                raise Exception(f"Auth failed: {response.status_code}")
-
-            # reset failure counter on success
-            self.failure_counts[device.id] = 0
-            token = None
-            try:
-                token = response.json().get("token")
-            except Exception:
-                token = None
-
+            response, status_code = await sync_to_async(get_gateway_auth_headers)(None, gw_id, force_refresh)
+            token = response.get("token") if status_code == 200 else None
             if not token:
-                logger.warning(f"Auth response from {url} did not provide a token: {response.text}")
-                raise Exception("Empty token returned from auth endpoint")
-
-            # cache token for 23 hours to avoid repeated logins
-            if gw_id is not None:
-                try:
-                    self.token_cache[gw_id] = {
-                        'token': token,
-                        'expires_at': time.time() + (23 * 3600)
-                    }
-                except Exception:
-                    pass
+                logger.warning(f"Failed to authenticate to gateway {gw_id}: status={status_code}, body={response}")
+                raise Exception(f"Auth failed: {status_code}")
 
+            # reset failure counter on success
+            self.rejected_tokens.discard(gw_id)
+            self.failure_counts[backoff_key] = 0
             return token
         except Exception as e:
             # exponential backoff: cap at 60s
-            self.failure_counts[device.id] += 1
-            retries = self.failure_counts[device.id]
+            self.failure_counts[backoff_key] += 1
+            retries = self.failure_counts[backoff_key]
             delay = min(60, 2 ** min(retries, 6))
             now = time.time()
-            # throttle logging to once every 60s per device (avoid huge logs)
-            if now - self.last_log_at[device.id] > 60:
-                logger.warning(f"Failed to get JWT token for device {getattr(device, 'name', device.id)}: {str(e)}; will retry in {delay}s")
-                self.last_log_at[device.id] = now
+            # throttle logging to once every 60s per device/socket (avoid huge logs)
+            if now - self.last_log_at[backoff_key] > 60:
+                logger.warning(f"Failed to get JWT token for {backoff_key}: {str(e)}; will retry in {delay}s")
+                self.last_log_at[backoff_key] = now
             # sleep here to slow down retry attempts
             await asyncio.sleep(delay)
             return None
@@ -121,9 +337,12 @@ class Command(BaseCommand):
         jwt_token = await self.get_jwt_token(device)
         if not jwt_token:
             return None
+        return self.build_ws_url(device.gateway, jwt_token)
 
+    @staticmethod
+    def build_ws_url(gateway, jwt_token):
         # Parse gateway URL and construct websocket URL properly (supports http/https)
-        parsed = urlparse(device.gateway.url)
+        parsed = urlparse(gateway.url)
         netloc = parsed.netloc or parsed.path  # handle urls without scheme
         scheme = 'wss' if parsed.scheme == 'https' else 'ws'
         return f"{scheme}://{netloc}/api/ws/plugins/telemetry?token={jwt_token}"
@@ -146,35 +365,112 @@ class Command(BaseCommand):
             default=5,
             help='Polling interval in seconds to refresh device list and tasks (default: 5)'
         )
+        parser.add_argument(
+            '--multiplex',
+            action='store_true',
+            default=getattr(settings, 'LISTEN_GATEWAY_MULTIPLEX', False),
+            help='Share one WebSocket per gateway for all device subscriptions instead of one socket per device'
+        )
+        parser.add_argument(
+            '--max-subscriptions-per-socket',
+            type=int,
+            default=getattr(settings, 'LISTEN_GATEWAY_MAX_SUBSCRIPTIONS_PER_SOCKET', 1000),
+            help='With --multiplex, open another socket for the gateway above this many devices (default: 1000)'
+        )
+        parser.add_argument(
+            '--no-liveness',
+            action='store_true',
+            default=not getattr(settings, 'LIVENESS_ENABLED', True),
+            help='Do not track device liveness from telemetry (DigitalTwinInstance.active is left untouched; '
+                 'the default when LIVENESS_ENABLED=False, where check_device_status maintains it)'
+        )
+
+    async def refresh_telemetry_index(self, bindings):
+        """Load new/stale/rebound devices into the telemetry index and drop removed ones.
+
+        `bindings` maps each bound device id to the ids of its DT properties.
+        """
+        removed = self.telemetry_index.loaded_devices() - set(bindings)
+        if removed:
+            self.telemetry_index.forget(removed)
+        to_load = self.telemetry_index.devices_to_load(bindings, bindings)
+        if to_load:
+            await sync_to_async(self.telemetry_index.load)(to_load)
 
     async def listen(self):
+        self.batcher_task = asyncio.create_task(self.telemetry_batcher.run())
+        if self.liveness is not None:
+            self.liveness_task = asyncio.create_task(self.run_liveness())
         while True:
             dtinstanceproperties = await sync_to_async(list)(DigitalTwinInstanceProperty.objects.filter(
                 device_property__isnull=False
-            ).select_related('device_property__device__gateway'))
-            
-            # Iniciar ou atualizar tasks para novos dispositivos
-            for dtinstanceproperty in dtinstanceproperties:
-                device = dtinstanceproperty.device_property.device
-                device_id = device.id
-                if device_id not in self.active_tasks:
-                    # Create a per-device task that will obtain/refresh JWTs as needed
-                    self.active_tasks[device_id] = asyncio.create_task(
-                        self.listen_to_device(device)
-                    )
-            
-            # Remover tasks de dispositivos que não existem mais no banco
-            active_device_ids = {d.device_property.device.id for d in dtinstanceproperties}
-            for device_id in list(self.active_tasks.keys()):
-                if device_id not in active_device_ids:
-                    self.active_tasks[device_id].cancel()
-                    del self.active_tasks[device_id]
-                    logger.info(f"Stopped listening for device {device_id}")
+            ).select_related('device_property__device__gateway', 'device_property__device__type'))
+            bindings = defaultdict(set)
+            for p in dtinstanceproperties:
+                bindings[p.device_property.device.id].add(p.id)
+            await self.refresh_telemetry_index(bindings)
+
+            if self.liveness is not None:
+                self.liveness_devices = {p.device_property.device.id: p.device_property.device for p in dtinstanceproperties}
+                self.liveness.track({
+                    device_id: device.get_inactivity_timeout() for device_id, device in self.liveness_devices.items()
+                })
+                logger.info(f"Liveness: {self.liveness.stats()}")
+
+            if self.connection_manager is not None:
+                # Multiplexed mode: incrementally (un)subscribe on the shared gateway sockets
+                devices = {p.device_property.device.id: p.device_property.device for p in dtinstanceproperties}
+                await self.connection_manager.sync(devices)
+                logger.info(f"WebSocket multiplexer: {self.connection_manager.stats()}")
+            else:
+                self.sync_device_tasks(dtinstanceproperties)
+
+            if self.use_influxdb:
+                stats = get_influx_writer().stats()
+                logger.info(
+                    f"InfluxDB writer: queue_depth={stats['queue_depth']} written={stats['written']} "
+                    f"dropped={stats['dropped']} failed={stats['failed']} "
+                    f"retries={stats['retries']} dropped_write_failed={stats['dropped_write_failed']}"
+                )
+
+            logger.info(f"Telemetry batcher: {self.telemetry_batcher.stats()} index_entries={len(self.telemetry_index)}")
+
+            token_stats = get_gateway_token_cache().stats()
+            logger.info(
+                f"Gateway token cache: hit_rate={token_stats['hit_rate']} refreshes={token_stats['refreshes']} "
+                f"failures={token_stats['refresh_failures']}"
+            )
 
             # Sleep using configured interval (default 5s for higher responsiveness)
             sleep_interval = getattr(self, 'poll_interval', 5)
             await asyncio.sleep(sleep_interval)
 
+    def sync_device_tasks(self, dtinstanceproperties):
+        # Iniciar ou atualizar tasks para novos dispositivos
+        for dtinstanceproperty in dtinstanceproperties:
+            device = dtinstanceproperty.device_property.device
+            device_id = device.id
+            task_key = (_subscription_key(device), _gateway_fingerprint(device.gateway))
+            if device_id in self.active_tasks and self.active_task_keys[device_id] != task_key:
+                # Gateway, credenciais ou identificador mudaram: reinicia a tarefa com o dispositivo atualizado
+                self.active_tasks.pop(device_id).cancel()
+                logger.info(f"Restarting listener for device {device_id} (gateway/identifier changed)")
+            if device_id not in self.active_tasks:
+                self.active_task_keys[device_id] = task_key
+                # Create a per-device task that will obtain/refresh JWTs as needed
+                self.active_tasks[device_id] = asyncio.create_task(
+                    self.listen_to_device(device)
+                )
+
+        # Remover tasks de dispositivos que não existem mais no banco
+        active_device_ids = {d.device_property.device.id for d in dtinstanceproperties}
+        for device_id in list(self.active_tasks.keys()):
+            if device_id not in active_device_ids:
+                self.active_tasks[device_id].cancel()
+                del self.active_tasks[device_id]
+                del self.active_task_keys[device_id]
+                logger.info(f"Stopped listening for device {device_id}")
+
     async def listen_to_device(self, device):
         while True:
             try:
@@ -220,6 +516,7 @@ class Command(BaseCommand):
                 # than reconnecting immediately with the same (invalid) token.
                 msg = str(e)
                 if isinstance(e, websockets.exceptions.ConnectionClosed) and getattr(e, 'code', None) == 1011 and 'Invalid JWT' in msg:
+                    self.rejected_tokens.add(getattr(device.gateway, 'id', None))
                     logger.warning(f"Invalid JWT for device {device.name}; will refresh token and retry in {delay}s")
                 else:
                     if now - self.last_log_at[device.id] > 60:
@@ -271,71 +568,57 @@ class Command(BaseCommand):
                 self.last_log_at[getattr(device, 'id', 'global')] = now
             return False
 
-    async def update_dt_instance_status(self, device, is_active):
-        """Atualiza o status do DigitalTwinInstance e registra mudanças no InfluxDB"""
-        dt_instances = await sync_to_async(list)(
-            DigitalTwinInstance.objects.filter(
-                digitaltwininstanceproperty__device_property__device=device
-            ).distinct()
+    async def run_liveness(self):
+        """Apply liveness transitions every LIVENESS_CHECK_INTERVAL seconds.
+
+        Devices that are not known to be alive are polled through the
+        attributes API every LIVENESS_FALLBACK_POLL_INTERVAL seconds.
+        """
+        check_interval = float(getattr(settings, 'LIVENESS_CHECK_INTERVAL', 1.0))
+        fallback_interval = float(getattr(settings, 'LIVENESS_FALLBACK_POLL_INTERVAL', 300))
+        next_poll = time.monotonic() + fallback_interval
+        while True:
+            await asyncio.sleep(check_interval)
+            try:
+                if fallback_interval > 0 and time.monotonic() >= next_poll:
+                    next_poll = time.monotonic() + fallback_interval
+                    await self.poll_silent_devices()
+                activated, deactivated = self.liveness.collect()
+                if activated or deactivated:
+                    await self.apply_liveness(activated, deactivated)
+            except Exception as e:
+                logger.exception(f"Error applying device liveness: {e}")
+
+    async def poll_silent_devices(self):
+        """Fallback for devices that are up but send no telemetry: read their `active` attribute."""
+        devices = [self.liveness_devices[d] for d in self.liveness.silent_devices() if d in self.liveness_devices]
+        if not devices:
+            return
+        results = await asyncio.gather(*(self.check_device_status(device) for device in devices))
+        alive = [device for device, is_active in zip(devices, results) if is_active]
+        for device in alive:
+            self.liveness.seen(device.id)
+        logger.info(f"Liveness fallback poll: {len(alive)}/{len(devices)} silent devices reported active")
+
+    async def apply_liveness(self, activated, deactivated):
+        transitions = await sync_to_async(apply_liveness_transitions)(
+            activated, deactivated, self.liveness_devices,
+            influx_measurement="device_availability" if self.use_influxdb else None,
         )
-        
-        for dt_instance in dt_instances:
-            current_state = await sync_to_async(lambda: dt_instance.active)()
-            if current_state != is_active:
-                current_timestamp = int(time.time() * 1000)  # Horário atual em milissegundos
-                
-                # Obtém o timestamp da última verificação
-                last_check_timestamp = await sync_to_async(lambda: int(dt_instance.last_status_check.timestamp() * 1000))()
-                
-                # Calcula a duração da inatividade
-                inactivity_duration = 0
-                if not is_active:
-                    # Se está ficando inativo agora, marca o início da inatividade
-                    inactivity_duration = 0  # Não há inatividade ainda
-                else:
-                    # Se está voltando a ficar ativo, calcula o tempo que ficou inativo
-                    inactivity_duration = current_timestamp - last_check_timestamp
-                
-                # Atualiza o estado no Django
-                dt_instance.active = is_active
-                dt_instance.last_status_check = datetime.fromtimestamp(current_timestamp / 1000)  # Salva em segundos
-                await sync_to_async(dt_instance.save)()
-                logger.info(f"Updated DT Instance {dt_instance.id} status to {'active' if is_active else 'inactive'}")
-                
-                # Envia os dados para o InfluxDB
-                if self.use_influxdb and inactivity_duration > 0:
-                    logger.info(f"Writing availability event to InfluxDB for device {device.identifier}")
-                    try:
-                        device_type_name = await sync_to_async(lambda: device.type.name if device.type else 'unknown')()
-                        
-                        tags = [
-                            f"device={device.identifier}",
-                            f"dt_instance={dt_instance.id}",
-                            f"device_type={device_type_name}"
-                        ]
-                        
-                        fields = [
-                            f"active={1 if is_active else 0}i",
-                            f"inactivity_duration={inactivity_duration}i"
-                        ]
-                        
-                        measurement = f"device_availability,{','.join(tags)} {','.join(fields)} {current_timestamp}"
-                        
-                        response = await sync_to_async(requests.post)(
-                            INFLUXDB_URL, 
-                            headers=headers, 
-                            data=measurement
-                        )
-                        
-                        if response.status_code != 204:
-                            logger.error(f"Failed to write availability event: {response.text}")
-                            logger.error(f"Attempted measurement: {measurement}")
-                        else:
-                            logger.info(f"Device {device.identifier} {'activated' if is_active else 'deactivated'} " + 
-                                        f"after {inactivity_duration / 1000:.2f} seconds of {'inactivity' if is_active else 'activity'}")
-                        
-                    except Exception as e:
-                        logger.exception(f"Error writing availability to InfluxDB: {str(e)}")
+        logger.info(
+            f"Liveness transitions: {len(activated)} devices active, {len(deactivated)} inactive "
+            f"(DT instances updated: {sum(1 for t in transitions if t[2])} active, "
+            f"{sum(1 for t in transitions if not t[2])} inactive)"
+        )
+        # Inactivity events only for devices that were seen alive (not for the initial silent ones)
+        for device_id, previous in deactivated.items():
+            device = self.liveness_devices.get(device_id)
+            if previous is True and device is not None:
+                await sync_to_async(write_inactivity_event)(
+                    device,
+                    InactivityType.TIMEOUT,
+                    f"No telemetry for {device.get_inactivity_timeout() or self.liveness.default_timeout}s"
+                )
 
     async def process_message(self, device, data):
         """Processa mensagens recebidas do ThingsBoard"""
@@ -347,45 +630,40 @@ class Command(BaseCommand):
         
         latest_values = data.get('data')
         if latest_values:
+            if self.liveness is not None:
+                self.liveness.seen(device.id)
+            if not self.telemetry_index.is_loaded(device.id):
+                await sync_to_async(self.telemetry_index.load)([device.id])
             for key, value in latest_values.items():
                 try:
                     hora, valor = value[0]
-                    # Atualiza a propriedade do dispositivo
-                    await sync_to_async(Property.objects.filter(device=device, name=key).update)(value=valor)
-                    
-                    # Atualiza o DigitalTwinInstanceProperty apenas se o dispositivo estiver ativo
-                    await sync_to_async(DigitalTwinInstanceProperty.objects.filter(
-                        device_property__device=device,
-                        property__name=key,
-                        dtinstance__active=True
-                    ).update)(value=valor)
+                    # Property / DigitalTwinInstanceProperty (dtinstance ativo) are updated in bulk by
+                    # the telemetry batcher; the index resolves the rows without querying the DB
+                    entry = self.telemetry_index.lookup(device.id, key)
+                    if entry is not None:
+                        self.telemetry_batcher.add(entry, valor)
                     
                     if self.use_influxdb and INFLUXDB_TOKEN:
                         timestamp = int(time.time() * 1000)
-                        property = await sync_to_async(lambda: Property.objects.filter(device=device, name=key).first())()
                         # Do not append _i to the key. Force integer types for Boolean/Integer properties
-                        if property:
+                        ptype = entry.type if entry is not None else None
+                        if ptype in ('Boolean', 'Integer'):
+                            # ensure Python int so format_influx_line will render as integer (with i suffix)
                             try:
-                                ptype = property.type
+                                property_value = int(entry.typed_value(valor))
                             except Exception:
-                                ptype = None
-                            if ptype in ('Boolean', 'Integer'):
-                                # ensure Python int so format_influx_line will render as integer (with i suffix)
-                                try:
-                                    property_value = int(property.get_value())
-                                except Exception:
-                                    # fallback: coerce from the raw telemetry value
-                                    try:
-                                        property_value = int(valor)
-                                    except Exception:
-                                        property_value = 0
-                            elif ptype == 'Double':
+                                # fallback: coerce from the raw telemetry value
                                 try:
-                                    property_value = float(property.get_value())
+                                    property_value = int(valor)
                                 except Exception:
-                                    property_value = property.get_value()
-                            else:
-                                property_value = property.get_value()
+                                    property_value = 0
+                        elif ptype == 'Double':
+                            try:
+                                property_value = float(entry.typed_value(valor))
+                            except Exception:
+                                property_value = valor
+                        elif ptype is not None:
+                            property_value = entry.typed_value(valor)
                         else:
                             # no local Property found — use the raw telemetry value
                             property_value = valor
@@ -411,15 +689,10 @@ class Command(BaseCommand):
                         else:
                             fields = {key: property_value, "received_timestamp": timestamp}
                         data = format_influx_line("device_data", tags, fields, timestamp=timestamp)
-                        logger.debug(f"Posting to InfluxDB (middts listener): {data}")
-                        response = await asyncio.to_thread(
-                            requests.post,
-                            INFLUXDB_URL,
-                            headers=headers,
-                            data=data,
-                            timeout=INFLUX_WRITE_TIMEOUT,
-                        )
-                        logger.debug(f"Response Code: {response.status_code}, Response Text: {response.text} - Data Sent: {data}")
+                        # Non-blocking: the shared writer batches lines and flushes them in the background
+                        if not get_influx_writer().write(data):
+                            logger.warning(f"InfluxDB queue full, dropped point for {device.name} - {key}")
+                        logger.debug(f"Queued for InfluxDB (middts listener): {data}")
                         logger.info(f"Updated property for {device.name} - {key}: {valor} and sent to InfluxDB with received_timestamp")
 
                 except Exception as e:
@@ -451,6 +724,12 @@ class Command(BaseCommand):
             except Exception:
                 self.sem = None
 
+        if not options.get('no_liveness'):
+            self.liveness = LivenessTracker(getattr(settings, 'DEFAULT_INACTIVITY_TIMEOUT', 60))
+
+        if options.get('multiplex'):
+            self.connection_manager = GatewayConnectionManager(self, options.get('max_subscriptions_per_socket') or 1000)
+
         loop = asyncio.get_event_loop()
         try:
             logger.info("Starting WebSocket listener...")
@@ -460,3 +739,7 @@ class Command(BaseCommand):
             logger.info("Stopping WebSocket listener...")
             for task in self.active_tasks.values():
                 task.cancel()
+            if self.connection_manager is not None:
+                self.connection_manager.close()
+            # Persist values still waiting in the current merge window
+            self.telemetry_batcher.flush_sync()
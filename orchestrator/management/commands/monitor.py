@@ -6,10 +6,12 @@ import logging
 from asgiref.sync import sync_to_async
 import websockets
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from facade.models import Device, Property, write_inactivity_event, InactivityType
-from orchestrator.models import DigitalTwinInstance, DigitalTwinInstanceProperty
-from facade.api import get_jwt_token_gateway
+from orchestrator.liveness import StatusTransitionBatch
+from orchestrator.models import DigitalTwinInstanceProperty
+from core.api import get_gateway_auth_headers
+from facade.influx import get_influx_writer
 from datetime import datetime, timedelta
 
 # Configuração básica de logging
@@ -17,39 +19,14 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 THINGSBOARD_WS_URL_TEMPLATE = "ws://{thingsboard_server}/api/ws/plugins/telemetry?token={your_jwt_token}"
-INFLUXDB_URL = f"http://{settings.INFLUXDB_HOST}:{settings.INFLUXDB_PORT}/api/v2/write?org={settings.INFLUXDB_ORGANIZATION}&bucket={settings.INFLUXDB_BUCKET}&precision=ms"
 INFLUXDB_TOKEN = settings.INFLUXDB_TOKEN
 USE_INFLUX_TO_EVALUATE = settings.USE_INFLUX_TO_EVALUATE
 
-headers = {
-    "Authorization": f"Token {INFLUXDB_TOKEN}",
-    "Content-Type": "text/plain"
-}
-
-class JWTTokenManager:
-    def __init__(self):
-        self.tokens = {}  # {gateway_id: {'token': token, 'expires_at': datetime}}
-        self.token_lifetime = timedelta(hours=23)  # Define um tempo de vida menor que 24h para ter margem de segurança
-
-    def get_token(self, gateway_id):
-        if gateway_id in self.tokens:
-            token_data = self.tokens[gateway_id]
-            if datetime.now() < token_data['expires_at']:
-                return token_data['token']
-        return None
-
-    def set_token(self, gateway_id, token):
-        self.tokens[gateway_id] = {
-            'token': token,
-            'expires_at': datetime.now() + self.token_lifetime
-        }
-
 class Command(BaseCommand):
     help = 'Unified command to check device status and listen for ThingsBoard updates'
 
     def __init__(self):
         super().__init__()
-        self.token_manager = JWTTokenManager()
         self.active_tasks = {}  # Armazena tarefas ativas por device_id
 
     def add_arguments(self, parser):
@@ -61,6 +38,13 @@ class Command(BaseCommand):
         )
 
     def handle(self, *args, **options):
+        if getattr(settings, 'LIVENESS_ENABLED', True):
+            # listen_gateway já mantém DigitalTwinInstance.active a partir da telemetria:
+            # dois escritores (silêncio vs. atributo 'active' do TB) alternariam as mesmas linhas
+            raise CommandError(
+                "LIVENESS_ENABLED=True: listen_gateway owns DigitalTwinInstance.active. "
+                "Set LIVENESS_ENABLED=False (listen_gateway then runs without liveness) to use this status poller."
+            )
         interval = options['interval']
         self.use_influxdb = USE_INFLUX_TO_EVALUATE  # Inicializa a variável com o valor da configuração
         loop = asyncio.get_event_loop()
@@ -72,23 +56,20 @@ class Command(BaseCommand):
             for task in self.active_tasks.values():
                 task.cancel()
 
-    async def get_jwt_token(self, device):
-        """Obtém o token JWT para o gateway do dispositivo"""
+    async def get_auth(self, device, force_refresh=False):
+        """Gateway auth (headers + token) from the process-wide token cache"""
         gateway_id = device.gateway_id
-        cached_token = self.token_manager.get_token(gateway_id)
-        if cached_token:
-            # logger.info(f"Using cached JWT token for gateway {gateway_id}")
-            return cached_token
-
-        # logger.info(f"Requesting new JWT token for gateway {gateway_id}")
-        response, status_code = await sync_to_async(get_jwt_token_gateway)(None, gateway_id)
+        response, status_code = await sync_to_async(get_gateway_auth_headers)(None, gateway_id, force_refresh)
         if status_code == 200:
-            token = response['token']
-            self.token_manager.set_token(gateway_id, token)
-            return token
+            return response
         logger.error(f"Failed to get JWT token for gateway {gateway_id}, status code: {status_code}")
         return None
 
+    async def get_jwt_token(self, device):
+        """Obtém o token JWT para o gateway do dispositivo"""
+        auth = await self.get_auth(device)
+        return auth.get('token') if auth else None
+
     async def get_ws_url(self, device):
         """Constrói a URL do WebSocket para o dispositivo"""
         jwt_token = await self.get_jwt_token(device)
@@ -117,21 +98,23 @@ class Command(BaseCommand):
         logger.info(f"Starting periodic device status checks every {interval} seconds")
         while True:
             try:
-                devices = await sync_to_async(list)(Device.objects.all().select_related('gateway'))
+                devices = await sync_to_async(list)(Device.objects.all().select_related('gateway', 'type'))
                 logger.info(f"Found {len(devices)} devices to check")
-                tasks = [self.check_device_status(device) for device in devices]
+                batch = StatusTransitionBatch()
+                tasks = [self.check_device_status(device, batch) for device in devices]
                 await asyncio.gather(*tasks)
+                await self.update_dt_instance_status(batch)
                 await asyncio.sleep(interval)
             except Exception as e:
                 logger.exception(f"Error in check_devices_status: {e}")
                 await asyncio.sleep(interval)
 
-    async def check_device_status(self, device):
-        """Verifica o status de um dispositivo no ThingsBoard"""
+    async def check_device_status(self, device, batch):
+        """Verifica o status de um dispositivo no ThingsBoard (estado registrado em `batch`)"""
         logger.info(f"Checking status for device {device.name} (ID: {device.id})")
         try:
-            jwt_token = await self.get_jwt_token(device)
-            if not jwt_token:
+            auth = await self.get_auth(device)
+            if not auth:
                 logger.warning(f"Failed to get JWT token for device {device.name}")
                 await sync_to_async(write_inactivity_event)(
                     device, 
@@ -141,17 +124,17 @@ class Command(BaseCommand):
                 return False
 
             url = f"{device.gateway.url}/api/plugins/telemetry/DEVICE/{device.identifier}/values/attributes"
-            headers = {
-                "Content-Type": "application/json",
-                "X-Authorization": f"Bearer {jwt_token}"
-            }
-            
-            response = await sync_to_async(requests.get)(url, headers=headers)
+            response = await sync_to_async(requests.get)(url, headers=auth['headers'])
+            if response.status_code == 401 and auth.get('token_type') == 'bearer':
+                # Cached JWT rejected: refresh once and retry
+                auth = await self.get_auth(device, force_refresh=True)
+                if auth:
+                    response = await sync_to_async(requests.get)(url, headers=auth['headers'])
             if response.status_code == 200:
                 attributes = response.json()
                 is_active = any(attr.get('key') == 'active' and attr.get('value', False) for attr in attributes)
                 logger.info(f"Device {device.name} is {'active' if is_active else 'inactive'}")
-                await self.update_dt_instance_status(device, is_active)
+                batch.observe(device, is_active)
                 return is_active
             else:
                 logger.error(f"Failed to check status for device {device.name}, HTTP {response.status_code}: {response.text}")
@@ -210,55 +193,13 @@ class Command(BaseCommand):
                 logger.error(f"Connection error for device {device.name}: {e.message}")
                 await asyncio.sleep(10)
 
-    async def update_dt_instance_status(self, device, is_active):
-        """Atualiza o status do DigitalTwinInstance e registra mudanças no InfluxDB"""
-        dt_instances = await sync_to_async(list)(
-            DigitalTwinInstance.objects.filter(
-                digitaltwininstanceproperty__device_property__device=device
-            ).distinct()
+    async def update_dt_instance_status(self, batch):
+        """Aplica as mudanças de status do ciclo (um UPDATE) e registra os eventos no InfluxDB (uma escrita)"""
+        transitions = await sync_to_async(batch.apply)(
+            influx_measurement="device_status" if self.use_influxdb else None
         )
-        for dt_instance in dt_instances:
-            current_state = await sync_to_async(lambda: dt_instance.active)()
-            current_timestamp = int(time.time() * 1000)  # Horário atual em milissegundos
-
-            if current_state != is_active:
-                # Obtém o timestamp da última verificação
-                # last_check_timestamp = await sync_to_async(lambda: int(dt_instance.last_status_check.timestamp() * 1000))()
-
-                # # Calcula a duração com base no estado anterior
-                # if is_active:
-                #     # Se o dispositivo está sendo reativado, calcula o tempo de inatividade
-                #     inactivity_duration = current_timestamp - last_check_timestamp
-                #     logger.info(f"Device {device.identifier} reactivated after {inactivity_duration / 1000:.2f} seconds of inactivity")
-                #     if self.use_influxdb:
-                #         await self.write_influx_event(
-                #             device=device,
-                #             dt_instance=dt_instance,
-                #             duration=inactivity_duration,
-                #             event_type="inactivity_duration"
-                #         )
-                # else:
-                #     # Se o dispositivo está sendo desativado, calcula o tempo de atividade
-                #     activity_duration = current_timestamp - last_check_timestamp
-                #     logger.info(f"Device {device.identifier} deactivated after {activity_duration / 1000:.2f} seconds of activity")
-                #     if self.use_influxdb:
-                #         await self.write_influx_event(
-                #             device=device,
-                #             dt_instance=dt_instance,
-                #             duration=activity_duration,
-                #             event_type="activity_duration"
-                #         )
-                if self.use_influxdb:
-                    await self.write_influx_event_status(
-                        device=device,
-                        dt_instance=dt_instance,
-                        status=is_active
-                    )
-                # Atualiza o estado no Django
-                dt_instance.active = is_active
-                dt_instance.last_status_check = datetime.fromtimestamp(current_timestamp / 1000)  # Salva em segundos
-                await sync_to_async(dt_instance.save)()
-                logger.info(f"Updated DT Instance {dt_instance.id} status to {'active' if is_active else 'inactive'}")
+        for instance_id, device, is_active, _ in transitions:
+            logger.info(f"Updated DT Instance {instance_id} ({device.identifier}) status to {'active' if is_active else 'inactive'}")
 
     async def write_influx_event(self, device, dt_instance, duration, event_type):
         """Escreve um evento no InfluxDB"""
@@ -276,28 +217,7 @@ class Command(BaseCommand):
             ]
             current_timestamp = int(time.time() * 1000)
             measurement = f"device_availability,{','.join(tags)} {','.join(fields)} {current_timestamp}"
-            response = await sync_to_async(requests.post)(INFLUXDB_URL, headers=headers, data=measurement)
-            if response.status_code != 204:
-                logger.error(f"Failed to write {event_type} event: {response.text}")
+            if not get_influx_writer().write(measurement):
+                logger.error(f"Failed to queue {event_type} event (Influx queue full)")
         except Exception as e:
             logger.exception(f"Error writing {event_type} to InfluxDB: {str(e)}")
-    
-    async def write_influx_event_status(self, device, dt_instance, status):
-        """Escreve um evento no InfluxDB"""
-        try:
-            # Obter o nome do tipo de dispositivo de forma assíncrona
-
-            tags = [
-                f"device={device.identifier}",
-                f"dt_instance={dt_instance.id}",
-            ]
-            fields = [
-                f"active={1 if status else 0}i",
-            ]
-            current_timestamp = int(time.time() * 1000)
-            measurement = f"device_status,{','.join(tags)} {','.join(fields)} {current_timestamp}"
-            response = await sync_to_async(requests.post)(INFLUXDB_URL, headers=headers, data=measurement)
-            if response.status_code != 204:
-                logger.error(f"Failed to write status of {device} event: {response.text}")
-        except Exception as e:
-            logger.exception(f"Error writing status of {device} to InfluxDB: {str(e)}")
\ No newline at end of file
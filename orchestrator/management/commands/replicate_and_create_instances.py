@@ -1,63 +1,44 @@
-from django.core.management.base import BaseCommand
-import copy
+from django.core.management.base import BaseCommand, CommandError
 import json
-from django.test import RequestFactory
-from orchestrator.api import create_hierarchical_instances
-from ninja.errors import HttpError
+import time
+from orchestrator.instantiation import RelationshipResolver, instantiate, match_models, replicate, resolve_tree, tree_names
+from orchestrator.models import DTDLModel, SystemContext
 
 class Command(BaseCommand):
-    help = "Replica e cria instâncias hierárquicas via API"
+    help = "Replica e cria instâncias hierárquicas (criação em lote, orchestrator.instantiation)"
 
     def add_arguments(self, parser):
         parser.add_argument('--system-id', type=int, required=True)
         parser.add_argument('--template', type=str, required=True, help='Caminho para o arquivo JSON de template')
         parser.add_argument('--n-replicas', type=int, required=True)
-        parser.add_argument('--token', type=str, default=None)
+        parser.add_argument('--similarity-threshold', type=float, default=0.60)
+        parser.add_argument('--no-bind-devices', action='store_true',
+                            help='Não sugerir dispositivos para as propriedades causais')
 
     def handle(self, *args, **options):
-        system_id = options['system_id']
-        n_replicas = options['n_replicas']
-        token = options['token']
+        system = SystemContext.objects.filter(id=options['system_id']).first()
+        if system is None:
+            raise CommandError(f"System {options['system_id']} not found")
         with open(options['template'], 'r') as f:
             template_json = json.load(f)
 
-        for i in range(1, n_replicas + 1):
-            replica = copy.deepcopy(template_json)
-            root_name = list(replica.keys())[0]
-            new_root = f"{root_name.split()[0]} {i}"
-            replica[new_root] = replica.pop(root_name)
-            # Call the orchestrator view internally to avoid HTTP roundtrip.
-            try:
-                if token:
-                    rf = RequestFactory()
-                    # create a dummy POST request and inject Authorization header
-                    req = rf.post("/orchestrator/internal/")
-                    req.META['HTTP_AUTHORIZATION'] = f'Bearer {token}'
-                else:
-                    req = None
+        # O template é resolvido (modelos e relacionamentos) uma única vez para todas as réplicas
+        dtdl_models = list(DTDLModel.objects.filter(system=system))
+        matches = match_models(tree_names(template_json), dtdl_models, options['similarity_threshold'])
+        roots = resolve_tree(template_json, matches, RelationshipResolver(system))
+        if not roots:
+            raise CommandError("No DTDL model matches the root of the template")
 
-                result = create_hierarchical_instances(req, system_id, replica)
-                # If the view returns a Django HttpResponse-like object, try to stringify
-                if hasattr(result, 'status_code'):
-                    # likely an HttpResponse; extract content
-                    try:
-                        body = result.content.decode('utf-8')
-                    except Exception:
-                        body = str(result)
-                    status = getattr(result, 'status_code', 'unknown')
-                    self.stdout.write(f"Replica {i}: status={status}, response={body}")
-                else:
-                    # result is likely a Python object (list/dict)
-                    self.stdout.write(f"Replica {i}: ok, created={json.dumps(result)}")
-            except HttpError as e:
-                # ninja.errors.HttpError exposes status_code and message
-                try:
-                    status = e.status_code
-                except Exception:
-                    status = 'error'
-                self.stderr.write(f"Replica {i}: HttpError status={status}, detail={e}")
-            except Exception as e:
-                self.stderr.write(f"Replica {i}: unexpected error: {e}")
+        t0 = time.perf_counter()
+        instances = instantiate(
+            replicate(roots[0], options['n_replicas']),
+            bind_devices=not options['no_bind_devices'],
+        )
+        elapsed = time.perf_counter() - t0
+        self.stdout.write(
+            f"{options['n_replicas']} replicas: {len(instances)} instances created in {elapsed:.1f}s "
+            f"(ids {instances[0].id}..{instances[-1].id})" if instances else "No instances created"
+        )
 
 
-# python manage.py replicate_and_create_instances --system-id 1 --template template.json --n-replicas 100
\ No newline at end of file
+# python manage.py replicate_and_create_instances --system-id 1 --template template.json --n-replicas 100
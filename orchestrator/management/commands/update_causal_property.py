@@ -1,24 +1,187 @@
+import copy
 import random
-import requests
 import uuid
 from django.conf import settings
 from facade.utils import format_influx_line
+from facade.influx import write_influx_line
 
-INFLUXDB_URL = f"http://{settings.INFLUXDB_HOST}:{settings.INFLUXDB_PORT}/api/v2/write?org={settings.INFLUXDB_ORGANIZATION}&bucket={settings.INFLUXDB_BUCKET}&precision=ms"
 INFLUXDB_TOKEN = settings.INFLUXDB_TOKEN
 USE_INFLUX_TO_EVALUATE = settings.USE_INFLUX_TO_EVALUATE
 ENABLE_INFLUX_LATENCY_MEASUREMENTS = settings.ENABLE_INFLUX_LATENCY_MEASUREMENTS
-INFLUXDB_HEADERS = {
-    "Authorization": f"Token {INFLUXDB_TOKEN}",
-    "Content-Type": "text/plain"
-}
 import asyncio
+import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from asgiref.sync import sync_to_async
 from django.core.management.base import BaseCommand
+from core.structured_logging import log_event
+from facade.models import RPCCallTypes
+from facade.rpc import with_fresh_db_connection
 from orchestrator.models import DigitalTwinInstance, DigitalTwinInstanceProperty
 
+logger = logging.getLogger(__name__)
+
+class CausalCycle:
+    """Bookkeeping of one polling cycle; reported once all its commands finished."""
+
+    def __init__(self, number, interval):
+        self.number = number
+        self.interval = interval
+        self.started = time.monotonic()
+        self.dispatched = 0
+        self.coalesced = 0
+        self.completed = 0
+        self.succeeded = 0
+        self.dispatch_finished = False
+        self.reported = False
+
+    def dispatch_done(self):
+        self.dispatch_finished = True
+
+    @property
+    def finished(self):
+        return self.dispatch_finished and self.completed >= self.dispatched
+
+
+class CausalCommandDispatcher:
+    """Bounded worker pool for causal-property commands.
+
+    Each gateway gets its own queue served by `max_inflight_per_gateway`
+    workers (one slow gateway does not block the others), and a global
+    semaphore caps commands in flight across all gateways. The RPC runs on the
+    event loop (Property.acall_rpc); only the DB part of the save goes to a
+    small thread pool. A property is never queued twice: while its previous
+    command is pending, new values for it are coalesced (skipped).
+    """
+
+    def __init__(self, max_inflight=256, max_inflight_per_gateway=64, db_workers=8):
+        self.max_inflight = max(1, int(max_inflight))
+        self.max_inflight_per_gateway = max(1, int(max_inflight_per_gateway))
+        self._global = asyncio.Semaphore(self.max_inflight)
+        self._queues = {}    # gateway_id -> asyncio.Queue
+        self._workers = []
+        self._pending = {}   # DT property id -> commands queued/in flight
+        self._pending_total = 0
+        self._db_executor = ThreadPoolExecutor(max_workers=max(1, int(db_workers)), thread_name_prefix='causal-db')
+        self.overruns = 0
+
+    @property
+    def pending(self):
+        return self._pending_total
+
+    def is_pending(self, dtip_id):
+        return dtip_id in self._pending
+
+    def start_cycle(self, number, interval):
+        return CausalCycle(number, interval)
+
+    def end_dispatch(self, cycle):
+        cycle.dispatch_done()
+        self._finish_check(cycle)
+
+    def submit(self, cycle, prop, correlation_id, scheduled_at=None):
+        gateway_id = prop.device_property.device.gateway_id
+        queue = self._queues.get(gateway_id)
+        if queue is None:
+            queue = self._queues[gateway_id] = asyncio.Queue()
+            for _ in range(self.max_inflight_per_gateway):
+                self._workers.append(asyncio.create_task(self._worker(queue)))
+        self._pending[prop.id] = self._pending.get(prop.id, 0) + 1
+        self._pending_total += 1
+        cycle.dispatched += 1
+        queue.put_nowait((cycle, prop, correlation_id, time.time(), scheduled_at))
+
+    async def _worker(self, queue):
+        while True:
+            cycle, prop, correlation_id, queued_at, scheduled_at = await queue.get()
+            success = False
+            try:
+                async with self._global:
+                    success = await self._propagate(prop, correlation_id, queued_at, scheduled_at)
+            except Exception as e:
+                logger.error("❌ Worker error for DT property %s: %s", prop.id, e)
+            finally:
+                remaining = self._pending.get(prop.id, 1) - 1
+                if remaining > 0:
+                    self._pending[prop.id] = remaining
+                else:
+                    self._pending.pop(prop.id, None)
+                self._pending_total -= 1
+                cycle.completed += 1
+                cycle.succeeded += int(bool(success))
+                self._finish_check(cycle)
+
+    def _finish_check(self, cycle):
+        if cycle.reported or not cycle.finished:
+            return
+        cycle.reported = True
+        elapsed = time.monotonic() - cycle.started
+        overrun = elapsed > cycle.interval
+        if overrun:
+            self.overruns += 1
+        print(
+            f"[{datetime.now().isoformat()}] CYCLE_RESULT cycle={cycle.number} commands={cycle.dispatched} "
+            f"success={cycle.succeeded} failed={cycle.dispatched - cycle.succeeded} coalesced={cycle.coalesced} "
+            f"elapsed={elapsed:.3f}s interval={cycle.interval} overrun={int(overrun)} total_overruns={self.overruns}"
+        )
+
+    async def _propagate(self, prop, correlation_id, queued_at, scheduled_at=None):
+        propagate_start = time.time()
+        queue_wait = propagate_start - queued_at
+        prop_name = getattr(prop.property, 'name', f'prop_{prop.id}')
+        device_property = prop.device_property
+        device_identifier = device_property.device.identifier
+        dt_id = prop.dtinstance_id
+        logger.debug("🚀 Starting propagation for '%s' (queue_wait=%.3fs)", prop_name, queue_wait)
+
+        def rpc_result(success, propagate_time, **fields):
+            result = {
+                "success": int(success),
+                "tb_id": device_identifier,
+                "dt_id": dt_id,
+                "prop": prop_name,
+                "time": f"{propagate_time:.6f}",
+                **fields,
+                "queue_wait": f"{queue_wait:.6f}",
+            }
+            if scheduled_at is not None:
+                # Open-loop mode: delay between the scheduled arrival and the actual send
+                result["scheduled_ts"] = f"{scheduled_at:.6f}"
+                result["sched_lag"] = f"{propagate_start - scheduled_at:.6f}"
+            log_event(logger, "RPC_RESULT", result, level=logging.INFO if success else logging.WARNING)
+
+        status_code = None
+        try:
+            # RPC on the event loop; the DB side of the save reuses its response
+            device_property.value = prop.value
+            device_property.correlation_id = correlation_id
+            device_property.m2s_sent_logged = True
+            response = await device_property.acall_rpc(RPCCallTypes.WRITE)
+            status_code = getattr(response, 'status_code', None)
+            await sync_to_async(with_fresh_db_connection(prop.save), thread_sensitive=False, executor=self._db_executor)(
+                propagate_to_device=True,
+                correlation_id=correlation_id,
+                m2s_sent_logged=True,
+                device_rpc_response=response,
+            )
+        except Exception as e:
+            propagate_time = time.time() - propagate_start
+            # Non-fatal: log so we have visibility in container logs
+            logger.warning("❌ Error propagating causal property '%s' after %.3fs: %s", prop_name, propagate_time, e)
+            # sanitize error for single-line logging
+            err_str = str(e).replace('\n', ' ').replace('"', '\\"')
+            rpc_result(False, propagate_time, error=err_str, status=status_code)
+            return False
+
+        propagate_time = time.time() - propagate_start
+        if status_code == 200:
+            rpc_result(True, propagate_time, attempt=1)
+            return True
+        rpc_result(False, propagate_time, status=status_code, attempts=1)
+        return False
+
+
 class Command(BaseCommand):
     help = 'Update causal properties of DigitalTwinInstanceProperties'
 
@@ -29,6 +192,48 @@ class Command(BaseCommand):
             default=5,
             help='Interval in seconds between polling cycles (default: 5)'
         )
+        parser.add_argument(
+            '--max-inflight',
+            type=int,
+            default=getattr(settings, 'CAUSAL_UPDATE_MAX_INFLIGHT', 256),
+            help='Maximum commands in flight across all gateways (default: CAUSAL_UPDATE_MAX_INFLIGHT or 256)'
+        )
+        parser.add_argument(
+            '--max-inflight-per-gateway',
+            type=int,
+            default=getattr(settings, 'CAUSAL_UPDATE_MAX_INFLIGHT_PER_GATEWAY', 64),
+            help='Maximum commands in flight per gateway (default: CAUSAL_UPDATE_MAX_INFLIGHT_PER_GATEWAY or 64)'
+        )
+        parser.add_argument(
+            '--db-workers',
+            type=int,
+            default=getattr(settings, 'CAUSAL_UPDATE_DB_WORKERS', 8),
+            help='Threads used for the DB side of each save (default: CAUSAL_UPDATE_DB_WORKERS or 8)'
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=0,
+            help='Open-loop workload: target commands per second spread over the selected twins (default: 0 = --interval bursts)'
+        )
+        parser.add_argument(
+            '--arrival',
+            choices=['poisson', 'constant'],
+            default='poisson',
+            help='Open-loop inter-arrival distribution (default: poisson)'
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=0,
+            help='Open-loop workload: stop issuing commands after N seconds (default: 0 = run forever)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=None,
+            help='Random seed for Poisson inter-arrival times'
+        )
         parser.add_argument(
             '--dt-ids',
             nargs='+',
@@ -151,223 +356,254 @@ class Command(BaseCommand):
         loop = asyncio.get_event_loop()
         print(f"[{datetime.now().isoformat()}] 🚀 Starting causal property updater with dt_ids: {dt_ids}")
         print(f"[{datetime.now().isoformat()}] ⏱️  Polling interval set to {interval} seconds")
+        print(f"[{datetime.now().isoformat()}] 🚦 In-flight limits: global={options['max_inflight']} per_gateway={options['max_inflight_per_gateway']} db_workers={options['db_workers']}")
         try:
-            loop.run_until_complete(self.update_causal_properties(dt_ids, interval))
+            if options['rate'] > 0:
+                print(f"[{datetime.now().isoformat()}] 📈 Open-loop workload: {options['rate']} commands/s, {options['arrival']} arrivals, report window {interval}s")
+                loop.run_until_complete(self.run_open_loop(
+                    dt_ids,
+                    options['rate'],
+                    arrival=options['arrival'],
+                    duration=options['duration'],
+                    window=interval,
+                    seed=options['seed'],
+                    max_inflight=options['max_inflight'],
+                    max_inflight_per_gateway=options['max_inflight_per_gateway'],
+                    db_workers=options['db_workers'],
+                ))
+            else:
+                loop.run_until_complete(self.update_causal_properties(
+                    dt_ids,
+                    interval,
+                    max_inflight=options['max_inflight'],
+                    max_inflight_per_gateway=options['max_inflight_per_gateway'],
+                    db_workers=options['db_workers'],
+                ))
         except KeyboardInterrupt:
             print(f"[{datetime.now().isoformat()}] ⏹️ Stopping causal property updater...")
 
-    async def update_causal_properties(self, dt_ids, interval=5):
+    async def update_causal_properties(self, dt_ids, interval=5, max_inflight=256,
+                                       max_inflight_per_gateway=64, db_workers=8):
+        dispatcher = CausalCommandDispatcher(max_inflight, max_inflight_per_gateway, db_workers)
         cycle_count = 0
+        next_cycle_at = time.monotonic()
         while True:
             cycle_start = time.time()
             cycle_count += 1
-            print(f"[{datetime.now().isoformat()}] 🔄 Starting update cycle #{cycle_count}")
-            
+            print(f"[{datetime.now().isoformat()}] 🔄 Starting update cycle #{cycle_count} (in flight from previous cycles: {dispatcher.pending})")
+
             try:
-                # Fetch DT instances
-                dt_fetch_start = time.time()
-                if dt_ids:
-                    dt_instances = await sync_to_async(list)(DigitalTwinInstance.objects.filter(id__in=dt_ids))
-                else:
-                    dt_instances = await sync_to_async(list)(DigitalTwinInstance.objects.all())
-                dt_fetch_time = time.time() - dt_fetch_start
-                print(f"[{datetime.now().isoformat()}] 📊 Fetched {len(dt_instances)} DT instances in {dt_fetch_time:.3f}s")
+                # One query per cycle: causal properties with DT instance, model element,
+                # bound device property, device and gateway
+                props_fetch_start = time.time()
+                causal_properties = await sync_to_async(with_fresh_db_connection(list))(self.causal_properties_queryset(dt_ids))
+                props_fetch_time = time.time() - props_fetch_start
+                print(f"[{datetime.now().isoformat()}] 📝 Found {len(causal_properties)} causal properties in {props_fetch_time:.3f}s")
 
-                total_properties_updated = 0
-                total_propagation_time = 0
-                
-                for i, dt_instance in enumerate(dt_instances):
-                    instance_start = time.time()
-                    print(f"[{datetime.now().isoformat()}] 🔧 Processing DT instance {dt_instance.id} ({i+1}/{len(dt_instances)})")
-                    
-                    # Fetch causal properties
-                    props_fetch_start = time.time()
-                    causal_properties = await sync_to_async(list)(DigitalTwinInstanceProperty.objects.filter(
-                        dtinstance=dt_instance, 
-                        property__supplement_types__contains=["dtmi:dtdl:extension:causal:v1:Causal"]
-                    ))
-                    props_fetch_time = time.time() - props_fetch_start
-                    print(f"[{datetime.now().isoformat()}] 📝 Found {len(causal_properties)} causal properties in {props_fetch_time:.3f}s")
-                    
-                    for j, prop in enumerate(causal_properties):
-                        prop_start = time.time()
-                        property_name = await sync_to_async(lambda p: getattr(p.property, 'name', f'prop_{p.id}'))(prop)
-                        print(f"[{datetime.now().isoformat()}] 🔄 Processing property '{property_name}' ({j+1}/{len(causal_properties)})")
-
-                        device_property = await sync_to_async(lambda: prop.device_property)()
-                        property_schema = await sync_to_async(lambda: prop.property.schema)()
-                        device_identifier = await sync_to_async(lambda: getattr(getattr(device_property, 'device', None), 'identifier', None))() if device_property else None
-                        dt_id = await sync_to_async(lambda: getattr(prop, 'dtinstance_id', None))()
-
-                        if device_property:
-                            # Check if property has RPC write method BEFORE generating command
-                            rpc_write_method = await sync_to_async(lambda: getattr(device_property, 'rpc_write_method', None))()
-                            
-                            if not rpc_write_method:
-                                print(f"[{datetime.now().isoformat()}] ⏭️ Skipping property '{property_name}' - no rpc_write_method defined")
-                                continue
-                            
-                            # Generate new value
-                            value_gen_start = time.time()
-                            old_value = prop.value
-                            if property_schema == 'Boolean':
-                                new_value = bool(random.getrandbits(1))
-                            elif property_schema == 'Integer':
-                                new_value = int(random.randint(0, 100))
-                            elif property_schema == 'Double':
-                                new_value = float(round(random.uniform(0, 100), 2))
-                            else:
-                                new_value = f"random_{random.randint(1000, 9999)}"
-
-                            prop.value = new_value
-                            value_gen_time = time.time() - value_gen_start
-                            print(f"[{datetime.now().isoformat()}] 💱 Changed '{property_name}': {old_value} → {new_value} (type: {property_schema}, gen_time: {value_gen_time:.3f}s)")
-
-                            # Registrar no InfluxDB ANTES de propagar (only for properties that will trigger RPC)
-                            # Use correlation_id (UUID) for end-to-end tracing instead of request_id
-                            correlation_id = str(uuid.uuid4())
-                            sent_timestamp = int(time.time() * 1000)
-                            
-                            if USE_INFLUX_TO_EVALUATE and ENABLE_INFLUX_LATENCY_MEASUREMENTS and INFLUXDB_TOKEN:
-                                # Use format_influx_line for consistent formatting
-                                tags = {
-                                    "sensor": device_identifier,
-                                    "dt_id": dt_id,
-                                    "source": "middts",
-                                    "direction": "M2S",
-                                    "correlation_id": correlation_id
-                                }
-                                fields = {
-                                    property_name: float(1.0 if new_value else 0.0) if isinstance(new_value, bool) else float(new_value),
-                                    "sent_timestamp": sent_timestamp
-                                }
-                                influx_line = format_influx_line("latency_measurement", tags, fields, timestamp=sent_timestamp)
-                                
-                                try:
-                                    resp = requests.post(INFLUXDB_URL, headers=INFLUXDB_HEADERS, data=influx_line)
-                                    if resp.status_code != 204:
-                                        print(f"[M2S-SENT] ⚠️ Failed to write: {resp.status_code} - {resp.text}")
-                                    else:
-                                        print(f"[M2S-SENT] ✅ Logged sent_timestamp for {device_identifier} (correlation_id={correlation_id})")
-                                except Exception as e:
-                                    print(f"[M2S-SENT] ⚠️ Exception: {e}")
-                            else:
-                                print(f"[M2S-SENT] SKIP - latency measurements disabled for '{property_name}' (correlation_id={correlation_id})")
-
-                            # Propagate para o dispositivo
-                            async def _propagate(p, corr_id, target_value, max_attempts=1):
-                                propagate_start = time.time()
-                                prop_name = await sync_to_async(lambda pp: getattr(pp.property, 'name', f'prop_{pp.id}'))(p)
-                                print(f"[{datetime.now().isoformat()}] 🚀 Starting propagation for '{prop_name}'")
-
-                                last_status = None
-                                for attempt in range(1, max_attempts + 1):
-                                    try:
-                                        # Ensure each retry sends the intended new value (save() may rollback to old on failure)
-                                        p.value = target_value
-                                        response = await sync_to_async(lambda: p.save(
-                                            propagate_to_device=True,
-                                            correlation_id=corr_id,
-                                            m2s_sent_logged=True,
-                                        ))()
-
-                                        status_code = getattr(response, 'status_code', None)
-                                        last_status = status_code
-
-                                        if status_code == 200:
-                                            propagate_time = time.time() - propagate_start
-                                            # Try to get device identifier and dt id for structured logging
-                                            try:
-                                                device_identifier = await sync_to_async(lambda pp: getattr(getattr(pp, 'device_property', None).device, 'identifier', None))(p)
-                                            except Exception:
-                                                device_identifier = None
-                                            try:
-                                                dt_id = await sync_to_async(lambda pp: getattr(pp, 'dtinstance', None).id)(p)
-                                            except Exception:
-                                                dt_id = None
-                                            print(f"[{datetime.now().isoformat()}] ✅ Propagation completed for '{prop_name}' in {propagate_time:.3f}s (attempt {attempt}/{max_attempts})")
-                                            print(f"[{datetime.now().isoformat()}] RPC_RESULT success=1 tb_id={device_identifier} dt_id={dt_id} prop={prop_name} time={propagate_time:.6f} attempt={attempt}")
-                                            return (True, propagate_time)
-
-                                        if attempt < max_attempts:
-                                            print(f"[{datetime.now().isoformat()}] 🔄 COMMAND-RETRY {attempt}/{max_attempts-1} for '{prop_name}' (status={status_code})")
-                                            await asyncio.sleep(0.05 * attempt)
-                                            continue
-
-                                        propagate_time = time.time() - propagate_start
-                                        try:
-                                            device_identifier = await sync_to_async(lambda pp: getattr(getattr(pp, 'device_property', None).device, 'identifier', None))(p)
-                                        except Exception:
-                                            device_identifier = None
-                                        try:
-                                            dt_id = await sync_to_async(lambda pp: getattr(pp, 'dtinstance', None).id)(p)
-                                        except Exception:
-                                            dt_id = None
-                                        print(f"[{datetime.now().isoformat()}] ❌ Propagation failed for '{prop_name}' after {propagate_time:.3f}s (final_status={status_code})")
-                                        print(f"[{datetime.now().isoformat()}] RPC_RESULT success=0 tb_id={device_identifier} dt_id={dt_id} prop={prop_name} time={propagate_time:.6f} status={status_code} attempts={max_attempts}")
-                                        return (False, propagate_time)
-
-                                    except Exception as e:
-                                        if attempt < max_attempts:
-                                            print(f"[{datetime.now().isoformat()}] 🔄 COMMAND-RETRY {attempt}/{max_attempts-1} for '{prop_name}' due exception: {str(e)[:120]}")
-                                            await asyncio.sleep(0.05 * attempt)
-                                            continue
-
-                                        propagate_time = time.time() - propagate_start
-                                        # Non-fatal: log to stdout so we have visibility in container logs
-                                        try:
-                                            device_identifier = await sync_to_async(lambda pp: getattr(getattr(pp, 'device_property', None).device, 'identifier', None))(p)
-                                        except Exception:
-                                            device_identifier = None
-                                        try:
-                                            dt_id = await sync_to_async(lambda pp: getattr(pp, 'dtinstance', None).id)(p)
-                                        except Exception:
-                                            dt_id = None
-                                        print(f"[{datetime.now().isoformat()}] ❌ Error propagating causal property '{prop_name}' after {propagate_time:.3f}s: {e}")
-                                        # sanitize error for single-line logging
-                                        err_str = str(e).replace('\n', ' ').replace('"', '\\"')
-                                        print(f"[{datetime.now().isoformat()}] RPC_RESULT success=0 tb_id={device_identifier} dt_id={dt_id} prop={prop_name} time={propagate_time:.6f} error={err_str} status={last_status}")
-                                        return (False, propagate_time)
-
-                            # Schedule background propagation and continue immediately
-                            try:
-                                propagation_task = asyncio.create_task(_propagate(prop, correlation_id, new_value, max_attempts=1))
-                                # Don't await here - let it run in background
-                                print(f"[{datetime.now().isoformat()}] 📤 Scheduled background propagation for '{property_name}'")
-                            except RuntimeError:
-                                # If there's no running loop for some reason, fall back to
-                                # a synchronous best-effort save (prevents silent drop).
-                                fallback_start = time.time()
-                                print(f"[{datetime.now().isoformat()}] 🔄 Using fallback synchronous propagation for '{property_name}'")
-                                try:
-                                    prop.save(propagate_to_device=True, correlation_id=correlation_id)
-                                    fallback_time = time.time() - fallback_start
-                                    print(f"[{datetime.now().isoformat()}] ✅ Fallback propagation completed for '{property_name}' in {fallback_time:.3f}s")
-                                except Exception as e:
-                                    fallback_time = time.time() - fallback_start
-                                    print(f"[{datetime.now().isoformat()}] ❌ Fallback propagation error for '{property_name}' after {fallback_time:.3f}s: {e}")
-
-                            total_properties_updated += 1
-                        else:
-                            print(f"[{datetime.now().isoformat()}] ⏭️ Skipping property '{property_name}' - no device_property")
-                        
-                        prop_time = time.time() - prop_start
-                        print(f"[{datetime.now().isoformat()}] ⏱️ Property '{property_name}' processing took {prop_time:.3f}s")
-                    
-                    instance_time = time.time() - instance_start
-                    print(f"[{datetime.now().isoformat()}] 📋 DT instance {dt_instance.id} completed in {instance_time:.3f}s")
+                cycle = dispatcher.start_cycle(cycle_count, interval)
+                for prop in causal_properties:
+                    property_name = getattr(prop.property, 'name', f'prop_{prop.id}')
+                    device_property = prop.device_property
+                    if not device_property:
+                        print(f"[{datetime.now().isoformat()}] ⏭️ Skipping property '{property_name}' - no device_property")
+                        continue
+                    # Check if property has RPC write method BEFORE generating command
+                    if not device_property.rpc_write_method:
+                        print(f"[{datetime.now().isoformat()}] ⏭️ Skipping property '{property_name}' - no rpc_write_method defined")
+                        continue
+                    if dispatcher.is_pending(prop.id):
+                        # Previous command for this property still queued/in flight: do not pile up
+                        cycle.coalesced += 1
+                        continue
+
+                    self.issue_command(dispatcher, cycle, prop)
+
+                dispatcher.end_dispatch(cycle)
+                dispatch_time = time.time() - cycle_start
+                print(
+                    f"[{datetime.now().isoformat()}] 🏁 Cycle #{cycle_count} dispatched: {cycle.dispatched} commands "
+                    f"({cycle.coalesced} coalesced with in-flight commands) in {dispatch_time:.3f}s"
+                )
 
-                cycle_time = time.time() - cycle_start
-                print(f"[{datetime.now().isoformat()}] 🏁 Cycle #{cycle_count} completed: {total_properties_updated} properties updated in {cycle_time:.3f}s")
-                print(f"[{datetime.now().isoformat()}] 💤 Sleeping for {interval} seconds...")
-                
             except Exception as e:
                 cycle_time = time.time() - cycle_start
                 print(f"[{datetime.now().isoformat()}] 🚨 Error in update cycle #{cycle_count} after {cycle_time:.3f}s: {e}")
                 import traceback
                 traceback.print_exc()
 
-            await asyncio.sleep(interval)
+            # Fixed-rate schedule: cycles start every `interval` seconds
+            next_cycle_at += interval
+            delay = next_cycle_at - time.monotonic()
+            if delay < 0:
+                print(f"[{datetime.now().isoformat()}] CYCLE_OVERRUN cycle={cycle_count} phase=dispatch lag={-delay:.3f}s interval={interval}")
+                dispatcher.overruns += 1
+                next_cycle_at = time.monotonic()
+                delay = 0
+            print(f"[{datetime.now().isoformat()}] 💤 Sleeping for {delay:.3f} seconds...")
+            await asyncio.sleep(delay)
+
+    async def run_open_loop(self, dt_ids, rate, arrival='poisson', duration=0, window=5, seed=None,
+                            max_inflight=256, max_inflight_per_gateway=64, db_workers=8):
+        """Issue commands at `rate`/s on an absolute schedule, independent of completions.
+
+        Arrival k is due at t0 + sum of the first k inter-arrival gaps. When the
+        generator falls behind it sends the overdue arrivals immediately and
+        reports how late they were, instead of silently stretching the
+        schedule (coordinated omission).
+        """
+        dispatcher = CausalCommandDispatcher(max_inflight, max_inflight_per_gateway, db_workers)
+        targets = await sync_to_async(with_fresh_db_connection(self.workload_targets))(dt_ids)
+        if not targets:
+            print(f"[{datetime.now().isoformat()}] ❌ No causal properties with a bound RPC write method; nothing to send")
+            return
+        print(f"[{datetime.now().isoformat()}] 🎯 Open-loop targets: {len(targets)} causal properties on {len({p.dtinstance_id for p in targets})} DT instances")
+
+        rng = random.Random(seed)
+
+        def next_gap():
+            return 1.0 / rate if arrival == 'constant' else rng.expovariate(rate)
+
+        t0 = time.monotonic()
+        wall0 = time.time()
+        next_at = t0
+        issued = 0
+        window_number = 1
+        cycle = dispatcher.start_cycle(window_number, window)
+        window_start = t0
+        window_lags = []
+
+        while True:
+            now = time.monotonic()
+            if duration and next_at - t0 >= duration:
+                break
+            delay = next_at - now
+            if delay > 0:
+                await asyncio.sleep(delay)
+                now = time.monotonic()
+
+            # Send every arrival that is due, without waiting for earlier commands
+            while next_at <= now and not (duration and next_at - t0 >= duration):
+                prop = targets[issued % len(targets)]
+                if dispatcher.is_pending(prop.id):
+                    # Previous command for this property still in flight: send an independent copy
+                    prop = copy.deepcopy(prop)
+                scheduled_at = wall0 + (next_at - t0)
+                window_lags.append(now - next_at)
+                self.issue_command(dispatcher, cycle, prop, scheduled_at=scheduled_at)
+                issued += 1
+                next_at += next_gap()
+
+            if now - window_start >= window:
+                dispatcher.end_dispatch(cycle)
+                self.report_workload_window(window_number, rate, cycle.dispatched, now - window_start, window_lags, dispatcher.pending)
+                window_number += 1
+                cycle = dispatcher.start_cycle(window_number, window)
+                window_start = now
+                window_lags = []
+
+        dispatcher.end_dispatch(cycle)
+        self.report_workload_window(window_number, rate, cycle.dispatched, time.monotonic() - window_start, window_lags, dispatcher.pending)
+        # Let the commands already issued finish before returning
+        while dispatcher.pending:
+            await asyncio.sleep(0.05)
+        print(f"[{datetime.now().isoformat()}] 🏁 Open-loop workload finished: {issued} commands in {time.monotonic() - t0:.3f}s")
+
+    @staticmethod
+    def report_workload_window(number, rate, issued, elapsed, lags, inflight):
+        lags = sorted(lags)
+        if lags:
+            p50 = lags[len(lags) // 2]
+            p99 = lags[min(len(lags) - 1, int(len(lags) * 0.99))]
+            lag_max = lags[-1]
+        else:
+            p50 = p99 = lag_max = 0.0
+        achieved = issued / elapsed if elapsed > 0 else 0.0
+        print(
+            f"[{datetime.now().isoformat()}] WORKLOAD window={number} target_rate={rate} issued={issued} "
+            f"achieved_rate={achieved:.2f} sched_lag_p50={p50:.6f} sched_lag_p99={p99:.6f} "
+            f"sched_lag_max={lag_max:.6f} inflight={inflight}"
+        )
+
+    def workload_targets(self, dt_ids):
+        """Causal properties that can receive commands, interleaved across DT instances."""
+        by_instance = {}
+        for prop in self.causal_properties_queryset(dt_ids):
+            if prop.device_property and prop.device_property.rpc_write_method:
+                by_instance.setdefault(prop.dtinstance_id, []).append(prop)
+        # Round-robin over instances so every twin receives an equal share of the rate
+        targets = []
+        groups = list(by_instance.values())
+        for i in range(max((len(g) for g in groups), default=0)):
+            targets.extend(g[i] for g in groups if i < len(g))
+        return targets
+
+    def issue_command(self, dispatcher, cycle, prop, scheduled_at=None):
+        """Generate a new value for `prop`, log its M2S sent_timestamp and queue the command."""
+        property_name = getattr(prop.property, 'name', f'prop_{prop.id}')
+        device_property = prop.device_property
+        property_schema = prop.property.schema
+        device_identifier = device_property.device.identifier
+        dt_id = prop.dtinstance_id
+
+        # Generate new value
+        old_value = prop.value
+        if property_schema == 'Boolean':
+            new_value = bool(random.getrandbits(1))
+        elif property_schema == 'Integer':
+            new_value = int(random.randint(0, 100))
+        elif property_schema == 'Double':
+            new_value = float(round(random.uniform(0, 100), 2))
+        else:
+            new_value = f"random_{random.randint(1000, 9999)}"
+
+        prop.value = new_value
+        logger.debug("💱 Changed '%s': %s → %s (type: %s)", property_name, old_value, new_value, property_schema)
+
+        # Registrar no InfluxDB ANTES de propagar (only for properties that will trigger RPC)
+        # Use correlation_id (UUID) for end-to-end tracing instead of request_id
+        correlation_id = str(uuid.uuid4())
+        sent_timestamp = int(time.time() * 1000)
+
+        if USE_INFLUX_TO_EVALUATE and ENABLE_INFLUX_LATENCY_MEASUREMENTS and INFLUXDB_TOKEN:
+            # Use format_influx_line for consistent formatting
+            tags = {
+                "sensor": device_identifier,
+                "dt_id": dt_id,
+                "source": "middts",
+                "direction": "M2S",
+                "correlation_id": correlation_id
+            }
+            fields = {
+                property_name: float(1.0 if new_value else 0.0) if isinstance(new_value, bool) else float(new_value),
+                "sent_timestamp": sent_timestamp
+            }
+            if scheduled_at is not None:
+                # Open-loop mode: keep the intended send time next to the actual one
+                fields["scheduled_timestamp"] = int(scheduled_at * 1000)
+            influx_line = format_influx_line("latency_measurement", tags, fields, timestamp=sent_timestamp)
+
+            try:
+                if not write_influx_line(influx_line):
+                    logger.warning("[M2S-SENT] ⚠️ Failed to write: Influx queue full")
+                else:
+                    logger.debug("[M2S-SENT] ✅ Logged sent_timestamp for %s (correlation_id=%s)", device_identifier, correlation_id)
+            except Exception as e:
+                logger.warning("[M2S-SENT] ⚠️ Exception: %s", e)
+        else:
+            logger.debug("[M2S-SENT] SKIP - latency measurements disabled for '%s' (correlation_id=%s)", property_name, correlation_id)
+
+        dispatcher.submit(cycle, prop, correlation_id, scheduled_at=scheduled_at)
+
+    @staticmethod
+    def causal_properties_queryset(dt_ids):
+        qs = DigitalTwinInstanceProperty.objects.filter(
+            property__supplement_types__contains=["dtmi:dtdl:extension:causal:v1:Causal"]
+        ).select_related(
+            'property', 'dtinstance', 'device_property__device__gateway'
+        ).order_by('dtinstance_id', 'id')
+        if dt_ids:
+            qs = qs.filter(dtinstance_id__in=dt_ids)
+        return qs
 
     def get_dt_ids_from_thingsboard_ids(self, thingsboard_ids):
         """
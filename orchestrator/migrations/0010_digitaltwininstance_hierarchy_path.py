@@ -0,0 +1,33 @@
+# Generated by Django 5.1 on 2026-10-17 00:58
+
+from django.db import migrations, models
+
+
+def backfill_hierarchy_paths(apps, schema_editor):
+    from orchestrator.hierarchy import rebuild_hierarchy_paths
+
+    rebuild_hierarchy_paths(
+        apps.get_model('orchestrator', 'DigitalTwinInstance'),
+        apps.get_model('orchestrator', 'DigitalTwinInstanceRelationship'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchestrator', '0009_systemcontext_dtdlmodel_created_by'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='digitaltwininstance',
+            name='hierarchy_depth',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='digitaltwininstance',
+            name='hierarchy_path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=1024),
+        ),
+        migrations.RunPython(backfill_hierarchy_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1 on 2026-10-17 01:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchestrator', '0010_digitaltwininstance_hierarchy_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SentenceEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(max_length=255)),
+                ('text_hash', models.CharField(max_length=64)),
+                ('dimensions', models.PositiveIntegerField()),
+                ('vector', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Sentence embedding',
+                'verbose_name_plural': 'Sentence embeddings',
+                'unique_together': {('model_name', 'text_hash')},
+            },
+        ),
+    ]
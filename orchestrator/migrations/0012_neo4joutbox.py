@@ -0,0 +1,28 @@
+# Generated by Django 5.1 on 2026-10-17 01:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchestrator', '0011_sentenceembedding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Neo4jOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('property', 'Property'), ('relationship', 'Relationship')], max_length=16)),
+                ('object_id', models.BigIntegerField()),
+                ('op', models.CharField(choices=[('upsert', 'Upsert'), ('delete', 'Delete')], max_length=8)),
+                ('payload', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Neo4j outbox entry',
+                'verbose_name_plural': 'Neo4j outbox entries',
+            },
+        ),
+    ]
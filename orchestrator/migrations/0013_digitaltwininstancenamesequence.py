@@ -0,0 +1,25 @@
+# Generated by Django 5.1 on 2026-10-17 01:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchestrator', '0012_neo4joutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DigitalTwinInstanceNameSequence',
+            fields=[
+                ('model', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='instance_name_sequence', serialize=False, to='orchestrator.dtdlmodel')),
+                ('last_number', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Digital twin instance name sequence',
+                'verbose_name_plural': 'Digital twin instance name sequences',
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1 on 2026-10-17 01:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchestrator', '0013_digitaltwininstancenamesequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DTDLParseCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('specification_hash', models.CharField(max_length=64, unique=True)),
+                ('parsed_specification', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'DTDL parse cache entry',
+                'verbose_name_plural': 'DTDL parse cache entries',
+            },
+        ),
+    ]
@@ -2,16 +2,22 @@ from enum import unique
 from pickle import FALSE
 from typing import Iterable
 from django.conf import settings
-from django.db import IntegrityError, models
-import requests
-from requests.exceptions import RequestException
+from django.db import IntegrityError, models, transaction
 
-from core.parser_client import get_dtdl_parser_url
+from core.model_tracking import DirtyFieldsMixin
+from core.structured_logging import log_event
 from facade.models import Device, Property, RPCCallTypes
+import logging
+import re
 import time
 
+from orchestrator.hierarchy import path_ids, subtree_prefix
 from orchestrator.utils import normalize_name
 
+logger = logging.getLogger(__name__)
+# Per-step timing of DigitalTwinInstanceProperty.save (enabled with HOTPATH_LOG_TIMING)
+timing_logger = logging.getLogger(f"{__name__}.timing")
+
 # models.py
 
 
@@ -29,7 +35,7 @@ class SystemContext(models.Model):
         return self.name
 
 
-class DTDLModel(models.Model):
+class DTDLModel(DirtyFieldsMixin, models.Model):
     system = models.ForeignKey(SystemContext, on_delete=models.CASCADE)
     dtdl_id = models.CharField(max_length=255)
     name = models.CharField(max_length=255)
@@ -46,14 +52,12 @@ class DTDLModel(models.Model):
         return self.name
 
     def save(self, *args, **kwargs):
-        create_parsed_specification = False
-        if not self.pk or not self.parsed_specification:
-            create_parsed_specification = True
-        if self.pk:
-            old_specification = DTDLModel.objects.filter(pk=self.pk).first().specification
-            if self.specification != old_specification:
-                create_parsed_specification = True
-        if create_parsed_specification:
+        # Especificação carregada vem do DirtyFieldsMixin: não relê a linha para comparar
+        if (
+            self._state.adding
+            or not self.parsed_specification
+            or self.specification != self.loaded_value('specification')
+        ):
             self.create_parsed_specification()
         specification = self.specification
         self.dtdl_id = specification.get('@id')
@@ -62,29 +66,14 @@ class DTDLModel(models.Model):
 
 
     def create_parsed_specification(self):
+        # Cache por conteúdo (orchestrator.dtdl_parser): o parser só é chamado para especificações novas
+        from orchestrator.dtdl_parser import parse_specification
+
         specification = self.specification
         spec_id = specification.get('@id')
         if not spec_id:
             raise ValueError(f"Model {self.name} has no '@id' in its specification.")
-        payload = {
-            "id": spec_id,
-            "specification": specification
-        }
-        parser_url = get_dtdl_parser_url()
-        try:
-            response = requests.post(parser_url, json=payload)
-            response.raise_for_status()  # Levanta um erro se o status code for 4xx/5xx
-        except RequestException as e:
-            # Logar o erro aqui, por exemplo:
-            # logger.error(f"Failed to communicate with DTDL parser: {e}")
-            raise ConnectionError(f"Failed to communicate with DTDL parser at {parser_url}: {e}")
-        try:
-            parsed_data = response.json()
-        except ValueError:
-            # Quando a resposta não é JSON ou está malformada
-            raise ValueError(f"Failed to parse JSON response from DTDL parser at {parser_url}")
-
-        self.parsed_specification = parsed_data
+        self.parsed_specification = parse_specification(specification)
         return self
 
     def create_dtdl_models(self):
@@ -137,12 +126,8 @@ class DTDLModel(models.Model):
     #     DTDLModel.create_dtdl_model_parsed_from_json(self, self.parsed_specification)
     
     def create_dt_instance(self, ):
+        # save() materializa as propriedades dos elementos do modelo
         dt_instance = DigitalTwinInstance.objects.create(model=self)
-        for element in self.model_elements.all():
-            dti, created = DigitalTwinInstanceProperty.objects.update_or_create(
-                dtinstance=dt_instance, 
-                property=element
-            )
 
         for relationship in self.model_relationships.all():
             source_instance = DigitalTwinInstance.objects.filter(model__name=relationship.source).first()
@@ -199,6 +184,9 @@ class DigitalTwinInstance(models.Model):
     name = models.CharField(max_length=255, blank=True, default='')
     active = models.BooleanField(default=True)
     last_status_check = models.DateTimeField(auto_now=True)
+    # Ancestor ids, root first ("12/45/"); maintained from relationships, see orchestrator.hierarchy
+    hierarchy_path = models.CharField(max_length=1024, blank=True, default='', db_index=True, editable=False)
+    hierarchy_depth = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         verbose_name = "Digital twin instance"
@@ -209,36 +197,79 @@ class DigitalTwinInstance(models.Model):
         base = f"{self.model.name} - {self.id} ({'Active' if self.active else 'Inactive'})"
         return f"{base} - {self.name}" if self.name else base
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_model_id = instance.__dict__.get('model_id')
+        instance._loaded_name = instance.__dict__.get('name')
+        return instance
+
     def save(self, *args, **kwargs):
+        # Elementos/relacionamentos do modelo só são materializados na criação
+        # ou quando o modelo muda; updates de status/nome não consultam nada.
+        materialize = self._state.adding or self.model_id != getattr(self, '_loaded_model_id', None)
         # Se name não foi definido, gera automaticamente: <ModelName> <N>
         if not self.name:
-            # Busca instâncias existentes para este modelo
-            existing_names = (
-                DigitalTwinInstance.objects
-                .filter(model=self.model)
-                .values_list('name', flat=True)
-            )
-            # Busca nomes no formato "<ModelName> <N>"
-            import re
-            pattern = re.compile(rf"^{re.escape(self.model.name)} (\d+)$")
-            used_numbers = [
-                int(m.group(1))
-                for n in existing_names
-                if (m := pattern.match(n or ""))
+            self.name = f"{self.model.name} {DigitalTwinInstanceNameSequence.reserve(self.model_id)}"
+        elif materialize or self.name != getattr(self, '_loaded_name', None):
+            # Nome explícito no formato automático: a sequência não pode voltar a gerá-lo
+            number = DigitalTwinInstanceNameSequence.number_in(self.model.name, self.name)
+            if number is not None:
+                DigitalTwinInstanceNameSequence.reserve(self.model_id, 0, after=number)
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            # hierarchy_path/hierarchy_depth are owned by orchestrator.hierarchy (queryset updates):
+            # a full save of a copy loaded before a re-parenting must not write the old path back
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in ('hierarchy_path', 'hierarchy_depth')
             ]
-            next_number = max(used_numbers, default=0) + 1
-            self.name = f"{self.model.name} {next_number}"
         super().save(*args, **kwargs)
+        self._loaded_model_id = self.model_id
+        self._loaded_name = self.name
+        if materialize:
+            self.materialize_model()
+
+    def materialize_model(self):
+        """Create the missing properties of the model elements and the model relationships of this twin."""
         model = self.model
-        for element in model.model_elements.all():
-            DigitalTwinInstanceProperty.objects.update_or_create(dtinstance=self, property=element)
-        for relationship in model.model_relationships.all():
-            source_instance = DigitalTwinInstance.objects.filter(model=relationship.dtdl_model).first()
-            target_instance = DigitalTwinInstance.objects.filter(model__dtdl_id__icontains=relationship.target).first()
-            if source_instance and target_instance:
-                DigitalTwinInstanceRelationship.objects.update_or_create(
-                    source_instance=source_instance,
-                    target_instance=target_instance,
+        element_ids = set(model.model_elements.values_list('id', flat=True))
+        element_ids -= set(self.digitaltwininstanceproperty_set.values_list('property_id', flat=True))
+        if element_ids:
+            DigitalTwinInstanceProperty.objects.bulk_create(
+                [DigitalTwinInstanceProperty(dtinstance=self, property_id=element_id) for element_id in element_ids],
+                ignore_conflicts=True,
+            )
+            # bulk_create não dispara post_save: registra as novas propriedades no outbox do Neo4j
+            if getattr(settings, 'USE_NEO4J', False):
+                from orchestrator.neo4j_outbox import enqueue_properties
+                enqueue_properties(
+                    self.digitaltwininstanceproperty_set.filter(property_id__in=element_ids).values_list('id', flat=True)
+                )
+
+        self.link_model_relationships()
+
+    def link_model_relationships(self):
+        """DigitalTwinInstanceRelationship rows for the relationships of this twin's model."""
+        model = self.model
+        relationships = list(model.model_relationships.all())
+        if not relationships:
+            return
+        # Liga a primeira instância deste modelo à primeira instância do modelo alvo (mesmo sistema)
+        source_id = DigitalTwinInstance.objects.filter(model=model).order_by('pk').values_list('pk', flat=True).first()
+        system_models = list(DTDLModel.objects.filter(system_id=model.system_id).values_list('id', 'dtdl_id'))
+        first_instances = dict(
+            DigitalTwinInstance.objects.filter(model__system_id=model.system_id)
+            .values('model_id').annotate(first_id=models.Min('id')).values_list('model_id', 'first_id')
+        )
+        for relationship in relationships:
+            candidates = [
+                first_instances[model_id] for model_id, dtdl_id in system_models
+                if model_id in first_instances and dtmi_matches(relationship.target, dtdl_id)
+            ]
+            if source_id and candidates:
+                DigitalTwinInstanceRelationship.objects.get_or_create(
+                    source_instance_id=source_id,
+                    target_instance_id=min(candidates),
                     relationship=relationship
                 )
 
@@ -246,23 +277,94 @@ class DigitalTwinInstance(models.Model):
         """
         Retorna a hierarquia de nomes do Digital Twin, do topo até este.
         Exemplo: ['House 77', 'Room 1', 'AirConditioner1_77']
+        Uma única consulta (nenhuma para raízes), usando hierarchy_path.
         """
-        names = []
-        current = self
-        visited = set()
-        while current and current.id not in visited:
-            visited.add(current.id)
-            if current.name:
-                names.append(current.name)
-            parent_rel = DigitalTwinInstanceRelationship.objects.filter(target_instance=current).first()
-            if parent_rel:
-                current = parent_rel.source_instance
-            else:
-                break
-        return list(reversed(names))
+        prefetched = getattr(self, '_prefetched_hierarchy', None)
+        if prefetched is not None:
+            return list(prefetched)
+        names = dict(self.get_ancestors().values_list('id', 'name')) if self.hierarchy_path else {}
+        hierarchy = [names[pk] for pk in path_ids(self.hierarchy_path) if names.get(pk)]
+        if self.name:
+            hierarchy.append(self.name)
+        return hierarchy
+
+    def get_ancestors(self):
+        """Ancestors of this twin, from the root down (one indexed lookup)."""
+        return DigitalTwinInstance.objects.filter(pk__in=path_ids(self.hierarchy_path)).order_by('hierarchy_depth')
+
+    def get_descendants(self, max_depth=None):
+        """Every twin below this one (e.g. all twins under 'House 7'), optionally down to `max_depth` levels."""
+        qs = DigitalTwinInstance.objects.filter(hierarchy_path__startswith=subtree_prefix(self))
+        if max_depth is not None:
+            qs = qs.filter(hierarchy_depth__lte=self.hierarchy_depth + max_depth)
+        return qs
+
+    def get_root_id(self):
+        ancestors = path_ids(self.hierarchy_path)
+        return ancestors[0] if ancestors else self.pk
+
+class DigitalTwinInstanceNameSequence(models.Model):
+    """Last <N> given to the automatic "<ModelName> <N>" instance names of a model."""
+    model = models.OneToOneField(DTDLModel, primary_key=True, related_name='instance_name_sequence', on_delete=models.CASCADE)
+    last_number = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Digital twin instance name sequence"
+        verbose_name_plural = "Digital twin instance name sequences"
+
+    def __str__(self):
+        return f"{self.model_id}: {self.last_number}"
+
+    @staticmethod
+    def number_in(model_name, name):
+        """<N> of a name in the automatic "<ModelName> <N>" format, else None."""
+        match = re.match(rf"^{re.escape(model_name)} (\d+)$", name or "")
+        return int(match.group(1)) if match else None
+
+    @classmethod
+    def reserve(cls, model_id, count=1, after=0):
+        """First of `count` consecutive numbers reserved for instances of `model_id`.
+
+        Numbers start past `after` too (the largest <N> of explicit names about
+        to be written); count=0 only advances the sequence. The row stays
+        locked until the surrounding transaction ends, so concurrent creations
+        never get the same number.
+        """
+        with transaction.atomic():
+            sequence = cls.objects.select_for_update().filter(model_id=model_id).first()
+            if sequence is None:
+                sequence = cls._start(model_id)
+            first = max(sequence.last_number, after) + 1
+            if first + count - 1 != sequence.last_number:
+                sequence.last_number = first + count - 1
+                sequence.save(update_fields=['last_number'])
+        return first
+
+    @classmethod
+    def _start(cls, model_id):
+        # Primeiro uso: continua a partir dos nomes já existentes (uma única varredura por modelo)
+        model_name = DTDLModel.objects.values_list('name', flat=True).get(pk=model_id)
+        used_numbers = [
+            number
+            for n in DigitalTwinInstance.objects.filter(model_id=model_id).values_list('name', flat=True)
+            if (number := cls.number_in(model_name, n)) is not None
+        ]
+        try:
+            with transaction.atomic():
+                return cls.objects.create(model_id=model_id, last_number=max(used_numbers, default=0))
+        except IntegrityError:
+            return cls.objects.select_for_update().get(model_id=model_id)
+
+
+def dtmi_matches(target, dtdl_id):
+    """True when a relationship target ("dtmi:x:Room" or "dtmi:x:Room;1") names the model `dtdl_id`."""
+    if ';' in target:
+        return dtdl_id == target
+    return dtdl_id == target or dtdl_id.startswith(f"{target};")
+
 
 # Ajustando para que faça referência a model element
-class DigitalTwinInstanceProperty(models.Model):
+class DigitalTwinInstanceProperty(DirtyFieldsMixin, models.Model):
 
     dtinstance = models.ForeignKey(DigitalTwinInstance, on_delete=models.CASCADE)
     property = models.ForeignKey(ModelElement,on_delete=models.CASCADE)
@@ -285,7 +387,7 @@ class DigitalTwinInstanceProperty(models.Model):
         if self.device_property is not None:
             return  # já está associado
 
-        from orchestrator.helpers import compute_similarity
+        from orchestrator.embeddings import similarity_matrix
 
         def extract_root_context(hierarchy):
             return hierarchy[0].strip().lower() if hierarchy else None
@@ -294,12 +396,12 @@ class DigitalTwinInstanceProperty(models.Model):
         norm_hierarchy = [normalize_name(h) for h in hierarchy]
         dt_text = " ".join(norm_hierarchy + [normalize_name(self.dtinstance.model.name), normalize_name(self.property.schema or "")])
         dt_root_context = extract_root_context(norm_hierarchy)
+        dt_root_tokens = dt_root_context.split() if dt_root_context else []
+        num_root_tokens = len(dt_root_tokens)
 
-        best_device_text = ''
-        best_match = None
-        best_score = 0.0
-
-        for prop in Property.objects.filter(digitaltwininstanceproperty__isnull=True):
+        candidates = []
+        device_texts = []
+        for prop in Property.objects.filter(digitaltwininstanceproperty__isnull=True).select_related("device", "device__type"):
             metadata = prop.device.metadata or ""
             device_name_norm = normalize_name(prop.device.name)
             device_type_norm = normalize_name(prop.device.type.name) if prop.device.type else ''
@@ -308,33 +410,35 @@ class DigitalTwinInstanceProperty(models.Model):
             metadata_norm = normalize_name(metadata)
 
             device_hierarchy_tokens = device_name_norm.split()
-            dt_root_tokens = dt_root_context.split() if dt_root_context else []
-            num_root_tokens = len(dt_root_tokens)
             device_root_context = " ".join(device_hierarchy_tokens[:num_root_tokens]) if num_root_tokens > 0 else None
 
             if dt_root_context and device_root_context and dt_root_context != device_root_context:
                 continue
 
-            device_text = f"{device_name_norm} {device_type_norm} {metadata_norm} {property_name_norm} {property_type_norm}"
+            candidates.append(prop)
+            device_texts.append(f"{device_name_norm} {device_type_norm} {metadata_norm} {property_name_norm} {property_type_norm}")
 
-            score = compute_similarity(dt_text, device_text)
+        best_device_text = ''
+        best_match = None
+        best_score = 0.0
 
-            if score > best_score:
-                best_device_text = device_text
-                best_match = prop
-                best_score = score
+        if candidates:
+            # Um único lote de similaridades em vez de uma chamada por candidato
+            scores = similarity_matrix([dt_text], device_texts)[0]
+            best = int(scores.argmax())
+            if scores[best] > best_score:
+                best_device_text = device_texts[best]
+                best_match = candidates[best]
+                best_score = float(scores[best])
 
         if best_match and best_score >= 0.60:
             self.device_property = best_match
             print(f"[MIDDTS] Associação automática: '{self.property.name}' (DT: {dt_text}) → '{best_match.name}' (Device: {best_device_text}) (score: {best_score:.2f})")
 
     def save(self, *args, **kwargs):
-        import time
-        from datetime import datetime
-        
-        save_start = time.time()
+        save_start = time.perf_counter()
         property_name = getattr(self.property, 'name', f'prop_{getattr(self, "id", "new")}')
-        print(f"[{datetime.now().isoformat()}] 💾 SAVE START: Property '{property_name}' (DT: {getattr(self.dtinstance, 'id', 'unknown')})")
+        logger.debug("💾 SAVE START: Property '%s' (DT: %s)", property_name, self.dtinstance_id)
         
         # Allow callers to opt-out of propagating the DT property change to the
         # associated device/ThingsBoard. This avoids blocking network calls in
@@ -343,7 +447,6 @@ class DigitalTwinInstanceProperty(models.Model):
         if 'propagate_to_device' in kwargs:
             try:
                 propagate_to_device = bool(kwargs.pop('propagate_to_device'))
-                print(f"[{datetime.now().isoformat()}] 🔧 Propagate to device: {propagate_to_device}")
             except Exception:
                 propagate_to_device = True
         
@@ -351,90 +454,96 @@ class DigitalTwinInstanceProperty(models.Model):
         correlation_id = kwargs.pop('correlation_id', None)
         # Indicates sent_timestamp for this command was already logged upstream
         m2s_sent_logged = bool(kwargs.pop('m2s_sent_logged', False))
+        # Response of a device RPC the caller already sent (e.g. via Property.acall_rpc)
+        device_rpc_response = kwargs.pop('device_rpc_response', None)
         if correlation_id:
-            print(f"[{datetime.now().isoformat()}] 🔗 Correlation ID: {correlation_id}")
+            logger.debug("🔗 Correlation ID: %s", correlation_id)
 
         # called_binding = False
-        binding_start = time.time()
+        binding_start = time.perf_counter()
         if not self.device_property:
             if self.property.isCausal():
-                print(f"[{datetime.now().isoformat()}] 🔗 Property '{property_name}' is causal but has no device binding")
+                logger.debug("🔗 Property '%s' is causal but has no device binding", property_name)
                 # self.suggest_device_binding()
                 # called_binding = True
                 pass
-        else:
-            print(f"[{datetime.now().isoformat()}] 🔗 Property '{property_name}' has device binding: {self.device_property.name}")
-        binding_time = time.time() - binding_start
+        binding_time = time.perf_counter() - binding_start
 
         # Get old value for comparison
-        old_value_start = time.time()
-        old_value = DigitalTwinInstanceProperty.objects.get(pk=self.id).value if self.id else ''
-        old_value_time = time.time() - old_value_start
-        print(f"[{datetime.now().isoformat()}] 📊 Property '{property_name}' value change: '{old_value}' → '{self.value}' (fetch_time: {old_value_time:.3f}s)")
+        old_value_start = time.perf_counter()
+        old_value = ''
+        if self.id:
+            # Value captured when the instance was loaded; query only for instances built by hand
+            old_value = self.loaded_value('value')
+            if old_value is None:
+                old_value = DigitalTwinInstanceProperty.objects.get(pk=self.id).value
+        old_value_time = time.perf_counter() - old_value_start
+        logger.debug("📊 Property '%s' value change: '%s' → '%s'", property_name, old_value, self.value)
         
-        # Save to database
-        db_save_start = time.time()
+        # Save to database (only the dirty fields of a loaded instance)
+        db_save_start = time.perf_counter()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and self.device_property_id is not None and 'device_property' not in update_fields \
+                and 'device_property' in self.get_dirty_fields():
+            # Se a associação automática foi feita, garantir persistência junto com o mesmo UPDATE
+            kwargs['update_fields'] = list(update_fields) + ['device_property']
         super().save(*args, **kwargs)
-        db_save_time = time.time() - db_save_start
-        print(f"[{datetime.now().isoformat()}] 🗃️ Database save completed for '{property_name}' in {db_save_time:.3f}s")
-        
-        # Update device_property field if needed
-        device_update_start = time.time()
-        # Se a associação automática foi feita, garantir persistência
-        # if called_binding and self.device_property:
-        if self.device_property:
-            # Salva novamente para garantir que o device_property seja persistido
-            super().save(update_fields=["device_property"])
-        device_update_time = time.time() - device_update_start
-        print(f"[{datetime.now().isoformat()}] 🔗 Device property update for '{property_name}' took {device_update_time:.3f}s")
+        db_save_time = time.perf_counter() - db_save_start
 
         # Only propagate to the device (which may trigger ThingsBoard RPCs) when
         # explicitly allowed. This avoids synchronous HTTP calls from periodic updaters.
         propagation_time = 0
         if propagate_to_device and self.id and self.device_property and self.property.isCausal():
-            propagation_start = time.time()
-            print(f"[{datetime.now().isoformat()}] 🚀 Starting device propagation for '{property_name}' to device '{self.device_property.name}'")
+            propagation_start = time.perf_counter()
             
             device_property = self.device_property
             old_device_value = device_property.value
             device_property.value = self.value
+            logger.debug("📤 Saving '%s' to device property '%s': '%s' → '%s'",
+                         property_name, device_property.name, old_device_value, device_property.value)
             
-            device_save_start = time.time()
-            print(f"[{datetime.now().isoformat()}] 📤 Saving to device property: '{old_device_value}' → '{device_property.value}'")
             # Propagate tracing/metrics flags to device property save
+            device_save_kwargs = {'m2s_sent_logged': m2s_sent_logged}
             if correlation_id:
-                device_property.save(correlation_id=correlation_id, m2s_sent_logged=m2s_sent_logged)
-            else:
-                device_property.save(m2s_sent_logged=m2s_sent_logged)
-            device_save_time = time.time() - device_save_start
-            print(f"[{datetime.now().isoformat()}] ✅ Device property save completed in {device_save_time:.3f}s")
+                device_save_kwargs['correlation_id'] = correlation_id
+            if device_rpc_response is not None:
+                device_save_kwargs['rpc_response'] = device_rpc_response
+            device_property.save(**device_save_kwargs)
             
             # Check if device changed the value back
-            verification_start = time.time()
             if device_property.value != self.value:
-                print(f"[{datetime.now().isoformat()}] ⚠️ Device property value changed during save: '{self.value}' → '{device_property.value}'")
+                logger.warning("⚠️ Device property value changed during save of '%s': '%s' → '%s'",
+                               property_name, self.value, device_property.value)
                 self.value = old_value if old_value else device_property.value if device_property.value else ''
                 super().save(*args, **kwargs)
-            verification_time = time.time() - verification_start
             
-            propagation_time = time.time() - propagation_start
-            print(f"[{datetime.now().isoformat()}] 🏁 Device propagation completed for '{property_name}' in {propagation_time:.3f}s (device_save: {device_save_time:.3f}s, verification: {verification_time:.3f}s)")
-        else:
+            propagation_time = time.perf_counter() - propagation_start
+        elif logger.isEnabledFor(logging.DEBUG):
             if not propagate_to_device:
-                print(f"[{datetime.now().isoformat()}] ⏭️ Skipping device propagation for '{property_name}' (disabled)")
+                reason = 'disabled'
             elif not self.device_property:
-                print(f"[{datetime.now().isoformat()}] ⏭️ Skipping device propagation for '{property_name}' (no device binding)")
-            elif not self.property.isCausal():
-                print(f"[{datetime.now().isoformat()}] ⏭️ Skipping device propagation for '{property_name}' (not causal)")
-
-        total_save_time = time.time() - save_start
-        print(f"[{datetime.now().isoformat()}] 💾 SAVE COMPLETE: Property '{property_name}' total time: {total_save_time:.3f}s (binding: {binding_time:.3f}s, db_save: {db_save_time:.3f}s, device_update: {device_update_time:.3f}s, propagation: {propagation_time:.3f}s)")
+                reason = 'no device binding'
+            else:
+                reason = 'not causal'
+            logger.debug("⏭️ Skipping device propagation for '%s' (%s)", property_name, reason)
+
+        total_save_time = time.perf_counter() - save_start
+        if timing_logger.isEnabledFor(logging.INFO):
+            log_event(timing_logger, "DT_PROPERTY_SAVE_TIMING", {
+                "property": property_name,
+                "dtinstance": self.dtinstance_id,
+                "total": f"{total_save_time:.6f}s",
+                "binding": f"{binding_time:.6f}s",
+                "old_value_fetch": f"{old_value_time:.6f}s",
+                "db_save": f"{db_save_time:.6f}s",
+                "propagation": f"{propagation_time:.6f}s",
+            })
         
         # Log performance warnings
         if total_save_time > 1.0:
-            print(f"[{datetime.now().isoformat()}] 🐌 SLOW SAVE WARNING: Property '{property_name}' took {total_save_time:.3f}s (threshold: 1.0s)")
+            logger.warning("🐌 SLOW SAVE WARNING: Property '%s' took %.3fs (threshold: 1.0s)", property_name, total_save_time)
         if propagation_time > 0.5:
-            print(f"[{datetime.now().isoformat()}] 🐌 SLOW PROPAGATION WARNING: Property '{property_name}' propagation took {propagation_time:.3f}s (threshold: 0.5s)")
+            logger.warning("🐌 SLOW PROPAGATION WARNING: Property '%s' propagation took %.3fs (threshold: 0.5s)", property_name, propagation_time)
 
     @classmethod
     def dedupe_for_instance(cls, dtinstance):
@@ -509,6 +618,60 @@ class DigitalTwinInstanceRelationship(models.Model):
     def save(self, *args, **kwargs):
         self.clean()
         super().save(*args, **kwargs)
+
+
+class DTDLParseCache(models.Model):
+    """DTDL parser output per specification content (see orchestrator.dtdl_parser)."""
+    specification_hash = models.CharField(max_length=64, unique=True)  # sha256 of cache version + canonical JSON
+    parsed_specification = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "DTDL parse cache entry"
+        verbose_name_plural = "DTDL parse cache entries"
+
+    def __str__(self):
+        return self.specification_hash[:12]
+
+
+class SentenceEmbedding(models.Model):
+    """Persistent cache of sentence embeddings used by autobinding (see orchestrator.embeddings)."""
+    model_name = models.CharField(max_length=255)
+    text_hash = models.CharField(max_length=64)  # sha256 of model name + normalized text
+    dimensions = models.PositiveIntegerField()
+    vector = models.BinaryField()  # float32, unit-normalized
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Sentence embedding"
+        verbose_name_plural = "Sentence embeddings"
+        unique_together = ('model_name', 'text_hash')
+
+    def __str__(self):
+        return f"{self.model_name}:{self.text_hash[:12]} ({self.dimensions}d)"
+
+
+class Neo4jOutbox(models.Model):
+    """Pending twin-graph changes, written with the PostgreSQL change and applied by drain_neo4j_outbox."""
+    KIND_PROPERTY = 'property'
+    KIND_RELATIONSHIP = 'relationship'
+    KIND_CHOICES = [(KIND_PROPERTY, 'Property'), (KIND_RELATIONSHIP, 'Relationship')]
+    OP_UPSERT = 'upsert'
+    OP_DELETE = 'delete'
+    OP_CHOICES = [(OP_UPSERT, 'Upsert'), (OP_DELETE, 'Delete')]
+
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    op = models.CharField(max_length=8, choices=OP_CHOICES)
+    payload = models.JSONField(null=True, blank=True)  # node keys for deletes (the row is gone by then)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Neo4j outbox entry"
+        verbose_name_plural = "Neo4j outbox entries"
+
+    def __str__(self):
+        return f"{self.op} {self.kind} {self.object_id}"
 # [
 #     {
 #       "id": "dtmi:housegen:Room;1",
@@ -0,0 +1,139 @@
+# --- Transactional outbox for the twin graph ---
+#
+# Signal handlers only insert a Neo4jOutbox row, in the same PostgreSQL
+# transaction as the change itself; drain_neo4j_outbox applies the rows in
+# batches. Several changes to the same property/relationship in one batch are
+# coalesced into the last one, and the batch is written with the UNWIND
+# statements of orchestrator.neo4j_sync. Rows are deleted only after Neo4j
+# accepted the batch, so a failed drain is retried (at-least-once; every
+# statement is an idempotent MERGE/DELETE).
+import threading
+
+from django.db import transaction
+from django.utils import timezone
+from neomodel import db
+
+from orchestrator.models import DigitalTwinInstanceProperty, DigitalTwinInstanceRelationship, Neo4jOutbox
+from orchestrator.neo4j_sync import (
+    DELETE_PROPERTIES,
+    DELETE_RELATIONSHIPS,
+    UPSERT_PROPERTIES,
+    UPSERT_RELATIONSHIPS,
+    property_row,
+    relationship_keys,
+    relationship_row,
+    run_batched,
+)
+
+_counters = {"batches": 0, "entries": 0, "applied": 0, "failures": 0, "last_lag_ms": 0.0}
+_counters_lock = threading.Lock()
+
+
+def enqueue_property(dtip_id, deleted=False):
+    Neo4jOutbox.objects.create(
+        kind=Neo4jOutbox.KIND_PROPERTY,
+        object_id=dtip_id,
+        op=Neo4jOutbox.OP_DELETE if deleted else Neo4jOutbox.OP_UPSERT,
+        payload={"property_id": dtip_id} if deleted else None,
+    )
+
+
+def enqueue_properties(dtip_ids, batch_size=None):
+    """enqueue_property() for rows created with bulk_create (no post_save)."""
+    Neo4jOutbox.objects.bulk_create([
+        Neo4jOutbox(kind=Neo4jOutbox.KIND_PROPERTY, object_id=dtip_id, op=Neo4jOutbox.OP_UPSERT)
+        for dtip_id in dtip_ids
+    ], batch_size=batch_size)
+
+
+def enqueue_relationships(rel_ids, batch_size=None):
+    """enqueue_relationship() upserts for rows created with bulk_create."""
+    Neo4jOutbox.objects.bulk_create([
+        Neo4jOutbox(kind=Neo4jOutbox.KIND_RELATIONSHIP, object_id=rel_id, op=Neo4jOutbox.OP_UPSERT)
+        for rel_id in rel_ids
+    ], batch_size=batch_size)
+
+
+def enqueue_relationship(rel, deleted=False):
+    Neo4jOutbox.objects.create(
+        kind=Neo4jOutbox.KIND_RELATIONSHIP,
+        object_id=rel.id,
+        op=Neo4jOutbox.OP_DELETE if deleted else Neo4jOutbox.OP_UPSERT,
+        payload=relationship_keys(rel) if deleted else None,
+    )
+
+
+def coalesce(entries):
+    """Last entry per (kind, object_id), in outbox order."""
+    latest = {}
+    for entry in entries:
+        latest.pop((entry.kind, entry.object_id), None)
+        latest[(entry.kind, entry.object_id)] = entry
+    return list(latest.values())
+
+
+def _apply(entries):
+    by_op = {}
+    for entry in entries:
+        by_op.setdefault((entry.kind, entry.op), []).append(entry)
+
+    property_upserts = [e.object_id for e in by_op.get((Neo4jOutbox.KIND_PROPERTY, Neo4jOutbox.OP_UPSERT), [])]
+    relationship_upserts = [e.object_id for e in by_op.get((Neo4jOutbox.KIND_RELATIONSHIP, Neo4jOutbox.OP_UPSERT), [])]
+    # Rows deleted after the entry was written are skipped here; their delete entry follows
+    property_rows = [
+        property_row(dtip) for dtip in DigitalTwinInstanceProperty.objects
+        .filter(id__in=property_upserts)
+        .select_related("dtinstance__model__system", "property")
+    ]
+    relationship_rows = [
+        relationship_row(rel) for rel in DigitalTwinInstanceRelationship.objects
+        .filter(id__in=relationship_upserts)
+        .select_related("source_instance__model__system", "target_instance__model", "relationship")
+    ]
+    property_deletes = [e.payload["property_id"] for e in by_op.get((Neo4jOutbox.KIND_PROPERTY, Neo4jOutbox.OP_DELETE), [])]
+    relationship_deletes = [e.payload for e in by_op.get((Neo4jOutbox.KIND_RELATIONSHIP, Neo4jOutbox.OP_DELETE), [])]
+
+    # Deletes first: a relationship removed and re-created between the same twins ends up present
+    with db.transaction:
+        run_batched(DELETE_RELATIONSHIPS, "rows", relationship_deletes)
+        run_batched(DELETE_PROPERTIES, "ids", property_deletes)
+        run_batched(UPSERT_PROPERTIES, "rows", property_rows)
+        run_batched(UPSERT_RELATIONSHIPS, "rows", relationship_rows)
+    return len(property_rows) + len(relationship_rows) + len(property_deletes) + len(relationship_deletes)
+
+
+def drain_once(batch_size=1000):
+    """Apply up to `batch_size` outbox entries; returns {"entries", "applied", "lag_ms"}.
+
+    lag_ms is the age of the oldest entry of the batch when it reached Neo4j.
+    Entries are locked with SKIP LOCKED, so several drainers can run side by side.
+    """
+    with transaction.atomic():
+        entries = list(Neo4jOutbox.objects.select_for_update(skip_locked=True).order_by("id")[:batch_size])
+        if not entries:
+            return {"entries": 0, "applied": 0, "lag_ms": 0.0}
+        try:
+            applied = _apply(coalesce(entries))
+        except Exception:
+            with _counters_lock:
+                _counters["failures"] += 1
+            raise
+        lag_ms = (timezone.now() - entries[0].created_at).total_seconds() * 1000.0
+        Neo4jOutbox.objects.filter(id__in=[e.id for e in entries]).delete()
+
+    with _counters_lock:
+        _counters["batches"] += 1
+        _counters["entries"] += len(entries)
+        _counters["applied"] += applied
+        _counters["last_lag_ms"] = lag_ms
+    return {"entries": len(entries), "applied": applied, "lag_ms": lag_ms}
+
+
+def outbox_stats():
+    """Backlog (pending entries, age of the oldest one) plus this process's drain counters."""
+    oldest = Neo4jOutbox.objects.order_by("id").values_list("created_at", flat=True).first()
+    with _counters_lock:
+        data = dict(_counters)
+    data["pending"] = Neo4jOutbox.objects.count()
+    data["lag_seconds"] = (timezone.now() - oldest).total_seconds() if oldest else 0.0
+    return data
@@ -0,0 +1,63 @@
+# --- Neo4j constraints and indexes for the twin graph ---
+#
+# Every write of orchestrator.neo4j_sync MERGEs on the PostgreSQL ids
+# (SystemContext.system_id, DigitalTwin.dt_id, TwinProperty.property_id).
+# Without a constraint on those keys each MERGE is a label scan, so the
+# uniqueness constraints below (each backed by an index) turn them into index
+# seeks. The remaining indexes serve the name/model filters of user Cypher
+# queries (/systems/{id}/cypher/). All statements are IF NOT EXISTS, so
+# ensure_schema() is safe to run on every start (entrypoint.sh runs
+# ensure_neo4j_schema before the outbox drainer).
+import logging
+
+from neomodel import db
+
+logger = logging.getLogger(__name__)
+
+CONSTRAINTS = [
+    ("system_context_system_id", "CREATE CONSTRAINT system_context_system_id IF NOT EXISTS FOR (s:SystemContext) REQUIRE s.system_id IS UNIQUE"),
+    ("digital_twin_dt_id", "CREATE CONSTRAINT digital_twin_dt_id IF NOT EXISTS FOR (t:DigitalTwin) REQUIRE t.dt_id IS UNIQUE"),
+    ("twin_property_property_id", "CREATE CONSTRAINT twin_property_property_id IF NOT EXISTS FOR (p:TwinProperty) REQUIRE p.property_id IS UNIQUE"),
+]
+
+INDEXES = [
+    ("digital_twin_model_name", "CREATE INDEX digital_twin_model_name IF NOT EXISTS FOR (t:DigitalTwin) ON (t.model_name)"),
+    ("twin_property_name", "CREATE INDEX twin_property_name IF NOT EXISTS FOR (p:TwinProperty) ON (p.name, p.type)"),
+    ("has_relationship_name", "CREATE INDEX has_relationship_name IF NOT EXISTS FOR ()-[r:HAS_RELATIONSHIP]-() ON (r.relationship)"),
+]
+
+
+def ensure_schema():
+    """Create the missing constraints/indexes; returns {name: "ok" | error message}.
+
+    A failing statement (e.g. duplicated property_id left by an old sync) is
+    logged and reported, the others are still created.
+    """
+    result = {}
+    for name, statement in CONSTRAINTS + INDEXES:
+        try:
+            db.cypher_query(statement)
+            result[name] = "ok"
+        except Exception as e:
+            logger.warning(f"Neo4j schema statement {name} failed: {e}")
+            result[name] = str(e)
+    return result
+
+
+def drop_schema():
+    """Drop the constraints/indexes created by ensure_schema() (benchmarks only)."""
+    for name, _ in INDEXES:
+        db.cypher_query(f"DROP INDEX {name} IF EXISTS")
+    for name, _ in CONSTRAINTS:
+        db.cypher_query(f"DROP CONSTRAINT {name} IF EXISTS")
+
+
+def await_indexes(timeout_seconds=300):
+    db.cypher_query(f"CALL db.awaitIndexes({int(timeout_seconds)})")
+
+
+def schema_state():
+    """{name: state} of the constraints/indexes of this module present in the database."""
+    names = [name for name, _ in CONSTRAINTS + INDEXES]
+    rows, _ = db.cypher_query("SHOW INDEXES YIELD name, state, owningConstraint WHERE name IN $names OR owningConstraint IN $names RETURN coalesce(owningConstraint, name), state", {"names": names})
+    return {name: state for name, state in rows}
@@ -0,0 +1,249 @@
+# --- Batched PostgreSQL -> Neo4j writes for the twin graph ---
+#
+# Nodes are keyed by the PostgreSQL ids: SystemContext.system_id,
+# DigitalTwin.dt_id and TwinProperty.property_id (the DigitalTwinInstanceProperty
+# id). Every statement takes a list of rows and runs as one UNWIND, so a batch
+# of changes costs a handful of round trips instead of several per object.
+from neomodel import db
+
+UPSERT_PROPERTIES = """
+UNWIND $rows AS row
+MERGE (s:SystemContext {system_id: row.system_id})
+  ON CREATE SET s.name = row.system_name, s.description = row.system_description
+MERGE (t:DigitalTwin {dt_id: row.dt_id})
+  ON CREATE SET t.description = row.twin_description
+SET t.name = row.twin_name, t.model_name = row.model_name
+MERGE (s)-[:CONTAINS]->(t)
+MERGE (p:TwinProperty {property_id: row.property_id})
+SET p.name = row.name, p.value = row.value, p.type = row.type
+MERGE (t)-[:HAS_PROPERTY]->(p)
+"""
+
+DELETE_PROPERTIES = """
+UNWIND $ids AS id
+MATCH (p:TwinProperty {property_id: id})
+DETACH DELETE p
+"""
+
+UPSERT_RELATIONSHIPS = """
+UNWIND $rows AS row
+MERGE (s:SystemContext {system_id: row.system_id})
+  ON CREATE SET s.name = row.system_name, s.description = row.system_description
+MERGE (a:DigitalTwin {dt_id: row.source_id})
+  ON CREATE SET a.name = row.source_name, a.model_name = row.source_model, a.description = row.source_description
+MERGE (b:DigitalTwin {dt_id: row.target_id})
+  ON CREATE SET b.name = row.target_name, b.model_name = row.target_model, b.description = row.target_description
+MERGE (s)-[:CONTAINS]->(a)
+MERGE (s)-[:CONTAINS]->(b)
+MERGE (a)-[:HAS_RELATIONSHIP {relationship: row.relationship}]->(b)
+"""
+
+DELETE_RELATIONSHIPS = """
+UNWIND $rows AS row
+MATCH (:DigitalTwin {dt_id: row.source_id})-[r:HAS_RELATIONSHIP {relationship: row.relationship}]->(:DigitalTwin {dt_id: row.target_id})
+DELETE r
+"""
+
+
+def twin_name(instance):
+    return f'{instance.model.name} - {instance.id}'
+
+
+def _system_fields(system):
+    return {"system_id": system.id, "system_name": system.name, "system_description": system.description}
+
+
+def property_row(dtip):
+    """UPSERT_PROPERTIES row of a DigitalTwinInstanceProperty (dtinstance__model__system and property loaded)."""
+    instance = dtip.dtinstance
+    return {
+        **_system_fields(instance.model.system),
+        "dt_id": instance.id,
+        "twin_name": twin_name(instance),
+        "twin_description": f"Digital Twin Instance {instance.id}",
+        "model_name": instance.model.name,
+        "property_id": dtip.id,
+        "name": dtip.property.name,
+        "value": str(dtip.value),
+        "type": dtip.property.element_type,
+    }
+
+
+def relationship_keys(rel):
+    """Node keys identifying a DigitalTwinInstanceRelationship in the graph (enough to delete it)."""
+    return {"source_id": rel.source_instance_id, "target_id": rel.target_instance_id, "relationship": rel.relationship.name}
+
+
+def relationship_row(rel):
+    """UPSERT_RELATIONSHIPS row (source/target instance models, their system and the relationship loaded)."""
+    source, target = rel.source_instance, rel.target_instance
+    return {
+        **_system_fields(source.model.system),
+        **relationship_keys(rel),
+        "source_name": twin_name(source),
+        "source_model": source.model.name,
+        "source_description": f"Digital Twin Instance {source.id}",
+        "target_name": twin_name(target),
+        "target_model": target.model.name,
+        "target_description": f"Digital Twin Instance {target.id}",
+    }
+
+
+def run_batched(statement, key, items, batch_size=1000):
+    """Run `statement` with `items` passed as `$<key>` in chunks of `batch_size`; returns the number sent."""
+    for i in range(0, len(items), batch_size):
+        db.cypher_query(statement, {key: items[i:i + batch_size]})
+    return len(items)
+
+
+# --- Full PostgreSQL vs Neo4j reconciliation (sync_to_neo4j) ---
+
+UPSERT_TWINS = """
+UNWIND $rows AS row
+MERGE (s:SystemContext {system_id: row.system_id})
+SET s.name = row.system_name, s.description = row.system_description
+MERGE (t:DigitalTwin {dt_id: row.dt_id})
+SET t.name = row.twin_name, t.model_name = row.model_name, t.description = row.twin_description
+MERGE (s)-[:CONTAINS]->(t)
+"""
+
+DELETE_TWINS = """
+UNWIND $ids AS id
+MATCH (t:DigitalTwin {dt_id: id})
+OPTIONAL MATCH (t)-[:HAS_PROPERTY]->(p:TwinProperty)
+DETACH DELETE p, t
+"""
+
+GRAPH_TWINS = """
+MATCH (:SystemContext {system_id: $system_id})-[:CONTAINS]->(t:DigitalTwin)
+RETURN t.dt_id, t.name, t.model_name
+"""
+
+GRAPH_PROPERTIES = """
+MATCH (:SystemContext {system_id: $system_id})-[:CONTAINS]->(t:DigitalTwin)-[:HAS_PROPERTY]->(p:TwinProperty)
+RETURN p.property_id, t.dt_id, p.name, p.value, p.type
+"""
+
+GRAPH_RELATIONSHIPS = """
+MATCH (:SystemContext {system_id: $system_id})-[:CONTAINS]->(a:DigitalTwin)-[r:HAS_RELATIONSHIP]->(b:DigitalTwin)
+RETURN a.dt_id, b.dt_id, r.relationship
+"""
+
+
+def database_snapshot(system, since=None):
+    """Twin, property and relationship rows of `system` read with three flat queries.
+
+    With `since`, only twins saved after it (DigitalTwinInstance.last_status_check)
+    plus their properties and outgoing relationships.
+    """
+    from orchestrator.models import DigitalTwinInstance, DigitalTwinInstanceProperty, DigitalTwinInstanceRelationship
+
+    system_fields = _system_fields(system)
+    instances = DigitalTwinInstance.objects.filter(model__system=system)
+    if since is not None:
+        instances = instances.filter(last_status_check__gte=since)
+    twins = {
+        pk: {
+            **system_fields,
+            "dt_id": pk,
+            "twin_name": f"{model_name} - {pk}",
+            "twin_description": f"Digital Twin Instance {pk}",
+            "model_name": model_name,
+        }
+        for pk, model_name in instances.values_list("id", "model__name").iterator(chunk_size=5000)
+    }
+
+    properties = DigitalTwinInstanceProperty.objects.filter(dtinstance__model__system=system)
+    relationships = DigitalTwinInstanceRelationship.objects.filter(source_instance__model__system=system)
+    if since is not None:
+        properties = properties.filter(dtinstance__in=instances)
+        relationships = relationships.filter(source_instance__in=instances)
+    property_rows = {
+        pk: {**twins[dt_id], "property_id": pk, "name": name, "value": str(value), "type": element_type}
+        for pk, dt_id, name, value, element_type in properties.values_list(
+            "id", "dtinstance_id", "property__name", "value", "property__element_type"
+        ).iterator(chunk_size=5000)
+        if dt_id in twins
+    }
+    relationship_rows = {}
+    for source_id, target_id, name, source_model, target_model in relationships.values_list(
+        "source_instance_id", "target_instance_id", "relationship__name",
+        "source_instance__model__name", "target_instance__model__name",
+    ).iterator(chunk_size=5000):
+        relationship_rows[(source_id, target_id, name)] = {
+            **system_fields,
+            "source_id": source_id,
+            "target_id": target_id,
+            "relationship": name,
+            "source_name": f"{source_model} - {source_id}",
+            "source_model": source_model,
+            "source_description": f"Digital Twin Instance {source_id}",
+            "target_name": f"{target_model} - {target_id}",
+            "target_model": target_model,
+            "target_description": f"Digital Twin Instance {target_id}",
+        }
+    return twins, property_rows, relationship_rows
+
+
+def graph_snapshot(system_id):
+    """What Neo4j currently holds for `system_id`, keyed like database_snapshot()."""
+    rows, _ = db.cypher_query(GRAPH_TWINS, {"system_id": system_id})
+    twins = {dt_id: {"twin_name": name, "model_name": model_name} for dt_id, name, model_name in rows}
+    rows, _ = db.cypher_query(GRAPH_PROPERTIES, {"system_id": system_id})
+    properties = {
+        property_id: {"dt_id": dt_id, "name": name, "value": value, "type": element_type}
+        for property_id, dt_id, name, value, element_type in rows
+    }
+    rows, _ = db.cypher_query(GRAPH_RELATIONSHIPS, {"system_id": system_id})
+    relationships = {(source_id, target_id, name) for source_id, target_id, name in rows}
+    return twins, properties, relationships
+
+
+def diff_snapshots(database, graph, delete_stale=True):
+    """Rows to write and keys to delete so that the graph matches the database.
+
+    Returns a dict with twin/property/relationship upserts (rows that are
+    missing or differ) and, when `delete_stale`, the twin ids, property ids
+    and relationship keys the database no longer has.
+    """
+    db_twins, db_properties, db_relationships = database
+    graph_twins, graph_properties, graph_relationships = graph
+
+    twin_upserts = [
+        row for dt_id, row in db_twins.items()
+        if graph_twins.get(dt_id) != {"twin_name": row["twin_name"], "model_name": row["model_name"]}
+    ]
+    property_upserts = [
+        row for pk, row in db_properties.items()
+        if graph_properties.get(pk) != {"dt_id": row["dt_id"], "name": row["name"], "value": row["value"], "type": row["type"]}
+    ]
+    relationship_upserts = [row for key, row in db_relationships.items() if key not in graph_relationships]
+
+    changes = {
+        "twin_upserts": twin_upserts,
+        "property_upserts": property_upserts,
+        "relationship_upserts": relationship_upserts,
+        "twin_deletes": [],
+        "property_deletes": [],
+        "relationship_deletes": [],
+    }
+    if delete_stale:
+        changes["twin_deletes"] = [dt_id for dt_id in graph_twins if dt_id not in db_twins]
+        changes["property_deletes"] = [pk for pk in graph_properties if pk not in db_properties]
+        changes["relationship_deletes"] = [
+            {"source_id": s, "target_id": t, "relationship": name}
+            for s, t, name in graph_relationships if (s, t, name) not in db_relationships
+        ]
+    return changes
+
+
+def apply_changes(changes, batch_size=1000):
+    """Write a diff_snapshots() result; deletes first. Returns the number of rows sent."""
+    sent = 0
+    sent += run_batched(DELETE_RELATIONSHIPS, "rows", changes["relationship_deletes"], batch_size)
+    sent += run_batched(DELETE_PROPERTIES, "ids", changes["property_deletes"], batch_size)
+    sent += run_batched(DELETE_TWINS, "ids", changes["twin_deletes"], batch_size)
+    sent += run_batched(UPSERT_TWINS, "rows", changes["twin_upserts"], batch_size)
+    sent += run_batched(UPSERT_PROPERTIES, "rows", changes["property_upserts"], batch_size)
+    sent += run_batched(UPSERT_RELATIONSHIPS, "rows", changes["relationship_upserts"], batch_size)
+    return sent
@@ -12,7 +12,7 @@ class TwinProperty(StructuredNode):
     name = StringProperty()
     value = StringProperty()
     type = StringProperty()
-    property_id = IntegerProperty()
+    property_id = IntegerProperty(unique_index=True)
 
     # Relacionamento reverso: Um TwinProperty pertence a um DigitalTwin
     twin = RelationshipFrom("DigitalTwin", "HAS_PROPERTY")
@@ -230,6 +230,13 @@ class InfluxTemporalQuerySchema(Schema):
     stop: Optional[str] = None
     last_minutes: int = 60
     limit: int = 500
+    # Pagination: pass the `next_cursor` of the previous page
+    cursor: Optional[str] = None
+    # Server-side aggregation (Flux aggregateWindow), e.g. window="1m", fn="mean"
+    window: Optional[str] = None
+    fn: str = "mean"
+    # Stream the page as a chunked JSON response (larger pages allowed)
+    stream: bool = False
 
 
 class TemporalPointSchema(Schema):
@@ -245,6 +252,7 @@ class InfluxTemporalQueryResponseSchema(Schema):
     system_id: int
     device_identifier: Optional[str] = None
     points: List[TemporalPointSchema]
+    next_cursor: Optional[str] = None
 
 class AssociatedPropertySchema(ModelSchema):
     property_name: str
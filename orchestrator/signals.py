@@ -1,143 +1,78 @@
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from orchestrator.models import DigitalTwinInstanceProperty, DigitalTwinInstanceRelationship
-from orchestrator.neo4jmodels import DigitalTwin, TwinProperty, SystemContext as Neo4jSystemContext
-from neomodel import db
 from django.conf import settings
+from django.db import transaction
+from orchestrator.hierarchy import refresh_instance_hierarchy
+from orchestrator.neo4j_outbox import enqueue_property, enqueue_relationship
+from orchestrator.ann import has_device_property_indexes, notify_property_changed, notify_property_deleted
+from facade.models import Device, Property
 
 USE_NEO4J = getattr(settings, 'USE_NEO4J', False)
 
+### MATERIALIZED HIERARCHY ###
+@receiver(post_save, sender=DigitalTwinInstanceRelationship)
+def update_hierarchy_on_relationship_save(sender, instance, created, raw=False, **kwargs):
+    # A new relationship only changes the path when it becomes the target's parent
+    if raw or (created and instance.target_instance.hierarchy_depth > 0):
+        return
+    refresh_instance_hierarchy(instance.target_instance_id)
+
+
+@receiver(post_delete, sender=DigitalTwinInstanceRelationship)
+def update_hierarchy_on_relationship_delete(sender, instance, **kwargs):
+    target_id = instance.target_instance_id
+    # Deferred so cascades (instance deletion) finish before the subtree is re-rooted
+    transaction.on_commit(lambda: refresh_instance_hierarchy(target_id))
+
+
+### AUTOBINDING ANN INDEX ###
+@receiver(post_save, sender=Property)
+def mark_property_for_ann_index(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    # Value writes (the command/telemetry hot path) do not change the embedded text
+    if raw or (update_fields is not None and set(update_fields) <= {"value"}):
+        return
+    notify_property_changed(instance.pk)
+
+
+@receiver(post_delete, sender=Property)
+def unmark_property_from_ann_index(sender, instance, **kwargs):
+    notify_property_deleted(instance.pk)
+
+
+@receiver(post_save, sender=Device)
+def mark_device_properties_for_ann_index(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    # Device name/type/metadata are part of every property text; status updates are not
+    if raw or created or not has_device_property_indexes():
+        return
+    if update_fields is not None and set(update_fields) <= {"status"}:
+        return
+    for property_id in Property.objects.filter(device=instance).values_list("id", flat=True):
+        notify_property_changed(property_id)
+
+
 ### CREATE/UPDATE SIGNAL ###
+# Neo4j is written by drain_neo4j_outbox; the handlers only record the change
+# in the same transaction (orchestrator.neo4j_outbox).
 @receiver(post_save, sender=DigitalTwinInstanceProperty)
-def sync_property_to_neo4j(sender, instance, created, **kwargs):
-    if USE_NEO4J:
-        with db.transaction:
-            system = Neo4jSystemContext.nodes.get_or_none(name=instance.dtinstance.model.system.name, system_id=instance.dtinstance.model.system.id)
-            if not system:
-                system = Neo4jSystemContext(system_id=instance.dtinstance.model.system.id, name=instance.dtinstance.model.system.name, description=instance.dtinstance.model.system.description)
-                system.save()
-            # Busca ou cria o Digital Twin
-            digital_twin_name = f'{instance.dtinstance.model.name} - {instance.dtinstance.id}'
-            twin = DigitalTwin.nodes.get_or_none(name=digital_twin_name)
-            if not twin:
-                twin = DigitalTwin(name=digital_twin_name, dt_id=instance.dtinstance.id, model_name=instance.dtinstance.model.name)
-                twin.description = f"Digital Twin Instance {instance.dtinstance.id}"
-                twin.save()
-            if not twin.relationships.is_connected(system):
-                system.digital_twins.connect(twin)
-
-            # Busca a propriedade via Cypher Query
-            query = """
-            MATCH (p:TwinProperty)<-[:HAS_PROPERTY]-(t:DigitalTwin)
-            WHERE t.name = $twin_name AND p.name = $property_name
-            RETURN p
-            """
-            results, _ = db.cypher_query(query, {
-                "twin_name": twin.name,
-                "property_name": instance.property.name
-            })
-
-            # Se existe, recupera; senão, cria uma nova propriedade
-            if results:
-                twin_property = TwinProperty.inflate(results[0][0])
-            else:
-                twin_property = TwinProperty(name=instance.property.name)
-
-            # Atualiza os valores da propriedade
-            twin_property.value = str(instance.value)
-            twin_property.property_id = instance.id
-            twin_property.type = instance.property.element_type
-            twin_property.save()
-
-            # Conecta a propriedade ao Twin
-            if not twin.properties.is_connected(twin_property):
-                twin.properties.connect(twin_property)
-
-            print(f"Synced Property: {twin_property.name} with value {twin_property.value}")
+def sync_property_to_neo4j(sender, instance, created, raw=False, **kwargs):
+    if USE_NEO4J and not raw:
+        enqueue_property(instance.id)
 
 
 @receiver(post_save, sender=DigitalTwinInstanceRelationship)
-def sync_relationship_to_neo4j(sender, instance, created, **kwargs):
-    if USE_NEO4J:
-        with db.transaction:
-            # Busca ou cria o SystemContext
-            system = Neo4jSystemContext.nodes.get_or_none(system_id=instance.source_instance.model.system.id, name=instance.source_instance.model.system.name)
-            if not system:
-                system = Neo4jSystemContext(system_id=instance.source_instance.model.system.id, name=instance.source_instance.model.system.name, description=instance.source_instance.model.system.description)
-                system.save()
-            # Busca ou cria o Digital Twin de origem
-            source_twin_name = f'{instance.source_instance.model.name} - {instance.source_instance.id}'
-            source_twin = DigitalTwin.nodes.get_or_none(name=source_twin_name)
-            if not source_twin:
-                source_twin = DigitalTwin(name=source_twin_name, dt_id=instance.source_instance.id, model_name=instance.source_instance.model.name)
-                source_twin.description = f"Digital Twin Instance {instance.source_instance.id}"
-                source_twin.save()
-            if not source_twin.system.is_connected(system):
-                system.digital_twins.connect(source_twin)
-
-            # Busca ou cria o Digital Twin de destino
-            target_twin_name = f'{instance.target_instance.model.name} - {instance.target_instance.id}'
-            target_twin = DigitalTwin.nodes.get_or_none(name=target_twin_name)
-            if not target_twin:
-                target_twin = DigitalTwin(name=target_twin_name, dt_id=instance.target_instance.id, model_name=instance.target_instance.model.name)
-                target_twin.description = f"Digital Twin Instance {instance.target_instance.id}"
-                target_twin.save()
-            if not target_twin.system.is_connected(system):
-                system.digital_twins.connect(target_twin)
-            
-            # Conecta os Digital Twins com o relacionamento
-            if not source_twin.relationships.is_connected(target_twin):
-                source_twin.relationships.connect(target_twin, {'relationship': instance.relationship.name})
-
-            print(f"Synced Relationship: {source_twin.name} -> {target_twin.name}")
+def sync_relationship_to_neo4j(sender, instance, created, raw=False, **kwargs):
+    if USE_NEO4J and not raw:
+        enqueue_relationship(instance)
 
 ### DELETE SIGNAL ###
 @receiver(post_delete, sender=DigitalTwinInstanceProperty)
 def delete_property_from_neo4j(sender, instance, **kwargs):
     if USE_NEO4J:
-        with db.transaction:
-            # Busca o Digital Twin associado
-            twin = DigitalTwin.nodes.get_or_none(name=instance.dtinstance.model.name)
-            if not twin:
-                print(f"No DigitalTwin found for {instance.dtinstance.model.name}. Skipping delete.")
-                return
-
-            # Busca a propriedade via Cypher Query
-            query = """
-            MATCH (p:TwinProperty)<-[:HAS_PROPERTY]-(t:DigitalTwin)
-            WHERE t.name = $twin_name AND p.name = $property_name
-            RETURN p
-            """
-            results, _ = db.cypher_query(query, {
-                "twin_name": twin.name,
-                "property_name": instance.property.name
-            })
-
-            # Se a propriedade existe, desconecta e deleta
-            if results:
-                twin_property = TwinProperty.inflate(results[0][0])
-                twin.properties.disconnect(twin_property)
-                twin_property.delete()
-                print(f"Deleted Property: {twin_property.name}")
+        enqueue_property(instance.id, deleted=True)
 
 
 @receiver(post_delete, sender=DigitalTwinInstanceRelationship)
 def delete_relationship_from_neo4j(sender, instance, **kwargs):
     if USE_NEO4J:
-        with db.transaction:
-            # Busca o Digital Twin de origem
-            source_twin = DigitalTwin.nodes.get_or_none(name=instance.source_instance.model.name)
-            if not source_twin:
-                print(f"No source DigitalTwin found for {instance.source_instance.model.name}. Skipping delete.")
-                return
-
-            # Busca o Digital Twin de destino
-            target_twin = DigitalTwin.nodes.get_or_none(name=instance.target_instance.model.name)
-            if not target_twin:
-                print(f"No target DigitalTwin found for {instance.target_instance.model.name}. Skipping delete.")
-                return
-
-            # Desconecta os Digital Twins
-            if source_twin.relationships.is_connected(target_twin):
-                source_twin.relationships.disconnect(target_twin)
-                print(f"Deleted Relationship: {source_twin.name} -> {target_twin.name}")
+        enqueue_relationship(instance, deleted=True)
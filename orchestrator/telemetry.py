@@ -0,0 +1,224 @@
+# --- Bulk telemetry apply path used by listen_gateway ---
+import asyncio
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.db import connection, transaction
+
+from facade.models import Property
+from orchestrator.models import DigitalTwinInstance, DigitalTwinInstanceProperty
+
+logger = logging.getLogger(__name__)
+
+BULK_UPDATE_CHUNK = 1000
+MISS_RELOAD_INTERVAL = 30.0
+
+
+class TelemetryIndexEntry:
+    __slots__ = ("property_id", "type", "dt_property_ids")
+
+    def __init__(self, property_id=None, type=None):
+        self.property_id = property_id
+        self.type = type
+        self.dt_property_ids = []
+
+    def typed_value(self, raw):
+        """Value as Property.get_value() would return it after storing `raw`."""
+        if self.type is None:
+            return raw
+        return Property(type=self.type, value=raw).get_value()
+
+
+class TelemetryIndex:
+    """In-memory map (device_id, telemetry key) -> device Property and bound DT properties.
+
+    Mirrors the filters of the former per-key UPDATEs: the device Property is
+    matched by name, DT properties by `device_property__device` and the name of
+    their model element. Devices are (re)loaded incrementally: new devices,
+    devices whose DT property bindings changed, devices whose entry is older
+    than `refresh_interval` and devices that received an unknown key.
+    """
+
+    def __init__(self, refresh_interval=300.0):
+        self.refresh_interval = float(refresh_interval)
+        self._entries = {}    # (device_id, key) -> TelemetryIndexEntry
+        self._keys = {}       # device_id -> set of its keys in _entries
+        self._loaded_at = {}  # device_id -> monotonic time of last load
+        self._misses = set()  # device ids that received keys missing from the index
+        self._bindings = {}   # device_id -> frozenset of bound DT property ids at last load
+        # load() runs in a sync_to_async worker while the event loop looks keys up:
+        # every mutation holds the lock, lookups read the dict without it
+        self._lock = threading.Lock()
+
+    def lookup(self, device_id, key):
+        entry = self._entries.get((device_id, key))
+        if entry is None and device_id in self._loaded_at:
+            with self._lock:
+                self._misses.add(device_id)
+        return entry
+
+    def is_loaded(self, device_id):
+        return device_id in self._loaded_at
+
+    def loaded_devices(self):
+        with self._lock:
+            return set(self._loaded_at)
+
+    def devices_to_load(self, device_ids, bindings=None):
+        """Devices to (re)load; `bindings` ({device_id: DT property ids}) flags devices bound or unbound since their load."""
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            for device_id in device_ids:
+                age = now - self._loaded_at.get(device_id, float("-inf"))
+                # Unknown keys (e.g. telemetry without a Property) trigger a reload at most every MISS_RELOAD_INTERVAL
+                if age >= self.refresh_interval or (device_id in self._misses and age >= MISS_RELOAD_INTERVAL):
+                    due.append(device_id)
+                elif bindings is not None and self._bindings.get(device_id) != frozenset(bindings.get(device_id, ())):
+                    due.append(device_id)
+        return due
+
+    def forget(self, device_ids):
+        with self._lock:
+            for device_id in set(device_ids):
+                for key in self._keys.pop(device_id, ()):
+                    self._entries.pop(key, None)
+                self._loaded_at.pop(device_id, None)
+                self._misses.discard(device_id)
+                self._bindings.pop(device_id, None)
+
+    def load(self, device_ids):
+        """Load index entries for `device_ids` (two queries, any number of devices).
+
+        The new entries replace the old ones without a gap: they are written
+        first and only the keys that disappeared are deleted afterwards.
+        """
+        if not device_ids:
+            return
+        entries = {}
+        keys = {device_id: set() for device_id in device_ids}
+        bindings = {device_id: set() for device_id in device_ids}
+        for property_id, device_id, name, ptype in Property.objects.filter(
+            device_id__in=device_ids
+        ).values_list("id", "device_id", "name", "type"):
+            entries[(device_id, name)] = TelemetryIndexEntry(property_id, ptype)
+            keys[device_id].add((device_id, name))
+        for dt_property_id, device_id, name in DigitalTwinInstanceProperty.objects.filter(
+            device_property__device_id__in=device_ids
+        ).values_list("id", "device_property__device_id", "property__name"):
+            entries.setdefault((device_id, name), TelemetryIndexEntry()).dt_property_ids.append(dt_property_id)
+            keys[device_id].add((device_id, name))
+            bindings[device_id].add(dt_property_id)
+
+        now = time.monotonic()
+        with self._lock:
+            self._entries.update(entries)
+            for device_id in device_ids:
+                for key in self._keys.get(device_id, set()) - keys[device_id]:
+                    self._entries.pop(key, None)
+                self._keys[device_id] = keys[device_id]
+                self._loaded_at[device_id] = now
+                self._misses.discard(device_id)
+                self._bindings[device_id] = frozenset(bindings[device_id])
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _bulk_update_values(table, rows, only_active_dtinstance=False):
+    """UPDATE `table`.value from (id, value) pairs in one statement per chunk."""
+    if not rows:
+        return 0
+    updated = 0
+    with connection.cursor() as cursor:
+        for i in range(0, len(rows), BULK_UPDATE_CHUNK):
+            chunk = rows[i:i + BULK_UPDATE_CHUNK]
+            if connection.vendor == "postgresql":
+                values_sql = ", ".join(["(%s, %s)"] * len(chunk))
+                params = [p for row in chunk for p in row]
+                sql = f"UPDATE {table} AS t SET value = v.value FROM (VALUES {values_sql}) AS v(id, value)"
+                if only_active_dtinstance:
+                    sql += f", {DigitalTwinInstance._meta.db_table} AS i WHERE t.id = v.id AND i.id = t.dtinstance_id AND i.active"
+                else:
+                    sql += " WHERE t.id = v.id"
+                cursor.execute(sql, params)
+                updated += cursor.rowcount
+            else:
+                # Portable fallback (e.g. SQLite in development)
+                sql = f"UPDATE {table} SET value = %s WHERE id = %s"
+                if only_active_dtinstance:
+                    sql += f" AND dtinstance_id IN (SELECT id FROM {DigitalTwinInstance._meta.db_table} WHERE active)"
+                cursor.executemany(sql, [(value, pk) for pk, value in chunk])
+                updated += max(cursor.rowcount, 0)
+    return updated
+
+
+class TelemetryBatcher:
+    """Merges telemetry updates over `flush_interval` seconds and writes them in bulk.
+
+    Only the last value per row survives a window, and each flush costs a fixed
+    number of statements (one per table and chunk) regardless of how many keys
+    arrived.
+    """
+
+    def __init__(self, flush_interval=0.1):
+        self.flush_interval = float(flush_interval)
+        self._properties = {}     # Property.id -> value
+        self._dt_properties = {}  # DigitalTwinInstanceProperty.id -> value
+        self._lock = threading.Lock()
+        self._counters = {"updates": 0, "merged": 0, "flushes": 0, "rows_written": 0, "flush_errors": 0}
+
+    def add(self, entry, value):
+        value = str(value)
+        with self._lock:
+            self._counters["updates"] += 1
+            if entry.property_id is not None:
+                if entry.property_id in self._properties:
+                    self._counters["merged"] += 1
+                self._properties[entry.property_id] = value
+            for dt_property_id in entry.dt_property_ids:
+                self._dt_properties[dt_property_id] = value
+
+    def _take(self):
+        with self._lock:
+            properties, self._properties = self._properties, {}
+            dt_properties, self._dt_properties = self._dt_properties, {}
+        return properties, dt_properties
+
+    def flush_sync(self):
+        properties, dt_properties = self._take()
+        if not properties and not dt_properties:
+            return 0
+        try:
+            with transaction.atomic():
+                written = _bulk_update_values(Property._meta.db_table, list(properties.items()))
+                written += _bulk_update_values(
+                    DigitalTwinInstanceProperty._meta.db_table,
+                    list(dt_properties.items()),
+                    only_active_dtinstance=True,
+                )
+        except Exception as e:
+            with self._lock:
+                self._counters["flush_errors"] += 1
+            logger.exception(f"Telemetry bulk flush failed ({len(properties)} properties, {len(dt_properties)} DT properties): {e}")
+            return 0
+        with self._lock:
+            self._counters["flushes"] += 1
+            self._counters["rows_written"] += written
+        return written
+
+    async def flush(self):
+        return await sync_to_async(self.flush_sync)()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._counters)
+            data["pending"] = len(self._properties) + len(self._dt_properties)
+        return data
@@ -0,0 +1,201 @@
+# --- Temporal (InfluxDB) queries of /systems/{id}/timeseries/query/ ---
+#
+# The Flux query merges all series into one table (group()) sorted by
+# (_time, _field, series tags). Measurement and device are fixed by the
+# filters and a series has one row per _time, so the order is total and a
+# page is a plain limit/offset over it: rows tied on _time come back in the
+# same order on every query. The cursor of the next page is the last _time
+# returned plus how many rows with that _time were already returned. The CSV
+# answer is read line by line (iter_influx_csv_rows) instead of being split
+# and re-joined in memory, and pages are kept for a few seconds in a
+# process-local LRU keyed by the Flux text, so dashboards polling the same
+# window hit InfluxDB once per TTL.
+import base64
+import csv
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+AGGREGATE_FUNCTIONS = ("mean", "median", "min", "max", "sum", "count", "first", "last")
+
+_DURATION_RE = re.compile(r"^(\d+(ns|us|ms|s|m|h|d|w|mo|y))+$")
+
+# Tags that tell apart series of the same device and field (see point_from_row)
+SERIES_TAGS = ("direction", "source", "correlation_id")
+
+
+def _flux_string(value):
+    # JSON string escaping (\" and \\) is valid Flux string syntax
+    return json.dumps(str(value))
+
+
+def encode_cursor(time_value, skip):
+    return base64.urlsafe_b64encode(json.dumps([time_value, skip]).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(time, skip) of a cursor returned by a previous page; ValueError when it is not one."""
+    try:
+        time_value, skip = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(time_value, str) or not isinstance(skip, int) or skip < 0:
+        raise ValueError("Invalid cursor")
+    return time_value, skip
+
+
+def build_flux_query(bucket, measurement, device_identifier, property_name=None, start=None, stop=None,
+                     last_minutes=60, limit=500, cursor=None, window=None, fn="mean"):
+    """Flux text of one page: up to limit + 1 rows, so the caller knows whether a next page exists.
+
+    ValueError for a malformed window/fn/cursor.
+    """
+    if start and stop:
+        range_clause = f"|> range(start: time(v: {_flux_string(start)}), stop: time(v: {_flux_string(stop)}))"
+    else:
+        range_clause = f"|> range(start: -{max(1, int(last_minutes))}m)"
+
+    lines = [
+        f"from(bucket: {_flux_string(bucket)})",
+        range_clause,
+        f'|> filter(fn: (r) => r["_measurement"] == {_flux_string(measurement)})',
+        f'|> filter(fn: (r) => r["sensor"] == {_flux_string(device_identifier)})',
+    ]
+    if property_name:
+        lines.append(f'|> filter(fn: (r) => r["_field"] == {_flux_string(property_name)})')
+    if window:
+        if not _DURATION_RE.match(window):
+            raise ValueError(f"Invalid window duration: {window}")
+        if fn not in AGGREGATE_FUNCTIONS:
+            raise ValueError(f"Invalid aggregate function: {fn} (expected one of {', '.join(AGGREGATE_FUNCTIONS)})")
+        lines.append(f"|> aggregateWindow(every: {window}, fn: {fn}, createEmpty: false)")
+    lines.append("|> group()")
+
+    skip = 0
+    if cursor:
+        cursor_time, skip = decode_cursor(cursor)
+        lines.append(f'|> filter(fn: (r) => r["_time"] >= time(v: {_flux_string(cursor_time)}))')
+    sort_columns = ", ".join(_flux_string(column) for column in ("_time", "_field") + SERIES_TAGS)
+    lines.append(f"|> sort(columns: [{sort_columns}])")
+    lines.append(f"|> limit(n: {int(limit) + 1}, offset: {skip})")
+    return "\n".join(lines)
+
+
+def next_cursor(rows, limit, cursor=None):
+    """Cursor of the page after `rows` (limit + 1 rows were requested), None on the last page."""
+    if len(rows) <= limit:
+        return None
+    last_time = rows[limit - 1].get("_time", "")
+    skip = sum(1 for row in rows[:limit] if row.get("_time") == last_time)
+    if cursor:
+        cursor_time, cursor_skip = decode_cursor(cursor)
+        if cursor_time == last_time:
+            skip += cursor_skip
+    return encode_cursor(last_time, skip)
+
+
+def iter_influx_csv_rows(lines):
+    """Rows (dicts) of an annotated Flux CSV answer, read line by line.
+
+    Annotation lines (#datatype, #group, #default) are skipped; a blank line
+    ends a table and the next line is the header of the following one.
+    """
+    header = None
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.rstrip("\r")
+        if not line:
+            header = None
+            continue
+        if line.startswith("#"):
+            continue
+        values = next(csv.reader([line]))
+        if header is None:
+            header = values
+            continue
+        yield dict(zip(header, values))
+
+
+def point_from_row(row):
+    """TemporalPointSchema fields of a Flux CSV row."""
+    return {
+        "time": row.get("_time", ""),
+        "measurement": row.get("_measurement", ""),
+        "field": row.get("_field", ""),
+        "value": row.get("_value"),
+        "device_identifier": row.get("sensor"),
+        "tags": {
+            "direction": row.get("direction"),
+            "source": row.get("source"),
+            "correlation_id": row.get("correlation_id"),
+        },
+    }
+
+
+class TemporalQueryCache:
+    """Short-TTL LRU of temporal query pages, keyed by organization + Flux text."""
+
+    def __init__(self, ttl=5.0, max_entries=256):
+        self.ttl = float(ttl)
+        self.max_entries = int(max_entries)
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stores": 0}
+
+    @staticmethod
+    def key(org, flux_query):
+        return hashlib.sha1(f"{org}\n{flux_query}".encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                return entry[1]
+            if entry:
+                del self._entries[key]
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, key, value):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._counters["stores"] += 1
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._counters)
+            data["entries"] = len(self._entries)
+        lookups = data["hits"] + data["misses"]
+        data["hit_rate"] = round(data["hits"] / lookups, 4) if lookups else None
+        return data
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_temporal_query_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TemporalQueryCache(
+                    ttl=getattr(settings, "TEMPORAL_QUERY_CACHE_TTL", 5),
+                    max_entries=getattr(settings, "TEMPORAL_QUERY_CACHE_SIZE", 256),
+                )
+    return _cache
@@ -1,3 +1,369 @@
-from django.test import TestCase
+import json
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from core.models import GatewayIOT, Organization
+from facade.influx import InfluxBatchWriter
+from facade.models import Device, Property
+from facade.rpc import RPCResponse
+from orchestrator.instantiation import instantiate, replicate
+from orchestrator.models import (
+    DTDLModel,
+    DigitalTwinInstance,
+    DigitalTwinInstanceNameSequence,
+    DigitalTwinInstanceProperty,
+    DigitalTwinInstanceRelationship,
+    ModelElement,
+    ModelRelationship,
+    SystemContext,
+    dtmi_matches,
+)
+
+CAUSAL = "dtmi:dtdl:extension:causal:v1:Causal"
+
+
+class PropertySaveQueryCountTests(TestCase):
+    """Statements issued per save() on the command path (regression guard).
+
+    The Influx writes of Property.save are disabled here (the module constants
+    are read at import time, whatever the environment); InfluxEnabledQueryCountTests
+    checks they add no statement.
+    """
+
+    def setUp(self):
+        for name, value in (("USE_INFLUX_TO_EVALUATE", False), ("INFLUXDB_TOKEN", "")):
+            patcher = mock.patch(f"facade.models.{name}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @classmethod
+    def setUpTestData(cls):
+        # bulk_create keeps the model save() hooks (ThingsBoard sync, instance materialization) out of the fixture
+        user = User.objects.create(username="tester")
+        org = Organization.objects.create(name="org")
+        gateway = GatewayIOT.objects.create(name="gw", url="http://127.0.0.1:1", username="u", password="p", organization=org)
+        device = Device.objects.bulk_create([
+            Device(name="House 1 Lamp", identifier="tb-1", status="", gateway=gateway, user=user, organization=org)
+        ])[0]
+        cls.device_property = Property.objects.bulk_create([
+            Property(device=device, name="status", type="Boolean", value="False", rpc_write_method="setStatus")
+        ])[0]
+        system = SystemContext.objects.bulk_create([SystemContext(name="sys", description="")])[0]
+        model = DTDLModel.objects.bulk_create([
+            DTDLModel(system=system, dtdl_id="dtmi:test:Lamp;1", name="Lamp", specification={})
+        ])[0]
+        element = ModelElement.objects.bulk_create([
+            ModelElement(dtdl_model=model, element_id="status", element_type="Property", name="status",
+                         schema="boolean", supplement_types=[CAUSAL])
+        ])[0]
+        instance = DigitalTwinInstance.objects.bulk_create([DigitalTwinInstance(model=model, name="Lamp 1")])[0]
+        cls.dt_property = DigitalTwinInstanceProperty.objects.bulk_create([
+            DigitalTwinInstanceProperty(dtinstance=instance, property=element, value="False",
+                                        device_property=cls.device_property)
+        ])[0]
+
+    def _load_dt_property(self):
+        # Same joins as update_causal_property.causal_properties_queryset
+        return DigitalTwinInstanceProperty.objects.select_related(
+            "property", "device_property__device__gateway"
+        ).get(pk=self.dt_property.pk)
+
+    def _load_device_property(self):
+        return Property.objects.select_related("device__gateway").get(pk=self.device_property.pk)
+
+    def _rpc_response(self, value):
+        return RPCResponse(200, json.dumps({"status": value}))
+
+    def test_dt_property_save_is_a_single_update(self):
+        dt_property = self._load_dt_property()
+        dt_property.value = "True"
+        with self.assertNumQueries(1):
+            dt_property.save(propagate_to_device=False)
+        self.assertEqual(DigitalTwinInstanceProperty.objects.get(pk=dt_property.pk).value, "True")
+
+    def test_dt_property_save_without_changes_issues_no_query(self):
+        dt_property = self._load_dt_property()
+        with self.assertNumQueries(0):
+            dt_property.save(propagate_to_device=False)
+
+    def test_save_after_refresh_writes_value_changed_back(self):
+        dt_property = self._load_dt_property()
+        DigitalTwinInstanceProperty.objects.filter(pk=dt_property.pk).update(value="True")
+        dt_property.refresh_from_db()
+        self.assertEqual(dt_property.loaded_value("value"), "True")
+        # Back to the value it was first loaded with: still a change against the row
+        dt_property.value = "False"
+        self.assertEqual(dt_property.get_dirty_fields(), ["value"])
+        dt_property.save(propagate_to_device=False)
+        self.assertEqual(DigitalTwinInstanceProperty.objects.get(pk=dt_property.pk).value, "False")
+
+    def test_dt_property_save_with_propagation(self):
+        dt_property = self._load_dt_property()
+        dt_property.value = "True"
+        # One UPDATE for the DT property and one for the bound device property
+        with self.assertNumQueries(2):
+            dt_property.save(device_rpc_response=self._rpc_response(True))
+        self.assertEqual(Property.objects.get(pk=self.device_property.pk).value, "True")
+
+    def test_device_property_save_is_a_single_update(self):
+        device_property = self._load_device_property()
+        device_property.value = "True"
+        with self.assertNumQueries(1):
+            device_property.save(rpc_response=self._rpc_response(True))
+        self.assertEqual(Property.objects.get(pk=device_property.pk).value, "True")
+
+    def test_failed_rpc_keeps_old_value_without_writing(self):
+        device_property = self._load_device_property()
+        device_property.value = "True"
+        with self.assertNumQueries(0):
+            device_property.save(rpc_response=RPCResponse(504, ""))
+        self.assertEqual(device_property.value, "False")
+
+
+class InfluxEnabledQueryCountTests(PropertySaveQueryCountTests):
+    """Same counts with the Influx writes on: the sensor tag comes from the loaded device."""
+
+    def setUp(self):
+        for name, value in (("USE_INFLUX_TO_EVALUATE", True), ("INFLUXDB_TOKEN", "token")):
+            patcher = mock.patch(f"facade.models.{name}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.influx_lines = []
+        patcher = mock.patch("facade.models.write_influx_line", side_effect=lambda line: self.influx_lines.append(line) or True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_device_property_save_writes_influx_lines(self):
+        device_property = self._load_device_property()
+        device_property.value = "True"
+        with self.assertNumQueries(1):
+            device_property.save(rpc_response=self._rpc_response(True))
+        self.assertEqual(len(self.influx_lines), 2)
+        self.assertTrue(all("sensor=tb-1" in line for line in self.influx_lines))
+
+
+class InfluxBatchWriterRetryTests(SimpleTestCase):
+    """A failed batch is retried, requeued once and only then dropped (and counted)."""
+
+    def _writer(self, statuses, **kwargs):
+        writer = InfluxBatchWriter("http://influx/api/v2/write", "token", retry_backoff=0, **kwargs)
+        responses = iter(statuses)
+        session = mock.Mock()
+        session.post.side_effect = lambda *args, **kw: mock.Mock(status_code=next(responses), text="")
+        writer._session = session
+        return writer
+
+    def test_transient_failure_is_retried(self):
+        writer = self._writer([503, 503, 204], max_retries=3)
+        self.assertTrue(writer._write_batch(["m v=1", "m v=2"]))
+        stats = writer.stats()
+        self.assertEqual((stats["written"], stats["retries"], stats["dropped"]), (2, 2, 0))
+
+    def test_exhausted_batch_is_requeued_then_dropped(self):
+        writer = self._writer([503] * 4, max_retries=1, max_requeue=1)
+        writer._write_batch(["m v=1"])
+        self.assertEqual(writer.stats()["requeued_pending"], 1)
+        self.assertEqual(writer.stats()["dropped"], 0)
+        writer.flush()
+        stats = writer.stats()
+        self.assertEqual((stats["requeued_pending"], stats["dropped"], stats["dropped_write_failed"]), (0, 1, 1))
+
+    def test_requeue_is_bounded(self):
+        writer = self._writer([503] * 4, max_retries=0, max_requeue=2)
+        for value in range(3):
+            writer._write_batch([f"m v={value}"])
+        stats = writer.stats()
+        self.assertEqual((stats["requeued_pending"], stats["dropped_write_failed"]), (2, 1))
+
+    def test_bad_request_is_not_retried(self):
+        writer = self._writer([400], max_retries=3)
+        self.assertFalse(writer._write_batch(["bad line"]))
+        stats = writer.stats()
+        self.assertEqual((stats["retries"], stats["requeued_pending"], stats["dropped_write_failed"]), (0, 0, 1))
+
+
+class HierarchyPathSaveTests(TestCase):
+    """A full save() must not write back a hierarchy path that changed since the instance was loaded."""
+
+    @classmethod
+    def setUpTestData(cls):
+        system = SystemContext.objects.bulk_create([SystemContext(name="sys", description="")])[0]
+        house, room = DTDLModel.objects.bulk_create([
+            DTDLModel(system=system, dtdl_id="dtmi:test:House;1", name="House", specification={}),
+            DTDLModel(system=system, dtdl_id="dtmi:test:Room;1", name="Room", specification={}),
+        ])
+        cls.contains = ModelRelationship.objects.create(
+            dtdl_model=house, relationship_id="contains", name="contains",
+            source="dtmi:test:House;1", target="dtmi:test:Room",
+        )
+        cls.house_1, cls.house_2, cls.room = DigitalTwinInstance.objects.bulk_create([
+            DigitalTwinInstance(model=house, name="House 1"),
+            DigitalTwinInstance(model=house, name="House 2"),
+            DigitalTwinInstance(model=room, name="Room 1"),
+        ])
+
+    def _link(self, house):
+        return DigitalTwinInstanceRelationship.objects.create(
+            source_instance=house, target_instance=self.room, relationship=self.contains
+        )
+
+    def test_stale_copy_save_keeps_new_path(self):
+        link = self._link(self.house_1)
+        stale = DigitalTwinInstance.objects.get(pk=self.room.pk)
+        self.assertEqual(stale.hierarchy_path, f"{self.house_1.pk}/")
+
+        # Re-parent the room under House 2
+        self._link(self.house_2)
+        with self.captureOnCommitCallbacks(execute=True):
+            link.delete()
+        self.assertEqual(DigitalTwinInstance.objects.get(pk=self.room.pk).hierarchy_path, f"{self.house_2.pk}/")
+
+        stale.active = False
+        stale.name = "Living room"
+        stale.save()
+        room = DigitalTwinInstance.objects.get(pk=self.room.pk)
+        self.assertEqual((room.name, room.active), ("Living room", False))
+        self.assertEqual((room.hierarchy_path, room.hierarchy_depth), (f"{self.house_2.pk}/", 1))
+        self.assertEqual(list(room.get_ancestors()), [self.house_2])
+        self.assertEqual(list(self.house_1.get_descendants()), [])
+
+
+class InstanceNamingTests(TestCase):
+    """Automatic "<ModelName> <N>" names and what a plain save() of a twin costs."""
+
+    @classmethod
+    def setUpTestData(cls):
+        system = SystemContext.objects.bulk_create([SystemContext(name="sys", description="")])[0]
+        cls.room = DTDLModel.objects.bulk_create([
+            DTDLModel(system=system, dtdl_id="dtmi:test:Room;1", name="Room", specification={})
+        ])[0]
+        ModelElement.objects.bulk_create([
+            ModelElement(dtdl_model=cls.room, element_id="temperature", element_type="Property",
+                         name="temperature", schema="double"),
+        ])
+        cls.house = DTDLModel.objects.bulk_create([
+            DTDLModel(system=system, dtdl_id="dtmi:test:House;1", name="House", specification={})
+        ])[0]
+        cls.contains = ModelRelationship.objects.create(
+            dtdl_model=cls.house, relationship_id="contains", name="contains",
+            source="dtmi:test:House;1", target="dtmi:test:Room",
+        )
+
+    def test_automatic_names_skip_explicit_ones(self):
+        self.assertEqual(DigitalTwinInstance.objects.create(model=self.room).name, "Room 1")
+        DigitalTwinInstance.objects.create(model=self.room, name="Room 5")
+        DigitalTwinInstance.objects.create(model=self.room, name="Room 3")
+        DigitalTwinInstance.objects.create(model=self.room, name="Kitchen")
+        self.assertEqual(DigitalTwinInstance.objects.create(model=self.room).name, "Room 6")
+
+        renamed = DigitalTwinInstance.objects.get(name="Kitchen")
+        renamed.name = "Room 9"
+        renamed.save()
+        self.assertEqual(DigitalTwinInstance.objects.create(model=self.room).name, "Room 10")
+        self.assertEqual(DigitalTwinInstanceNameSequence.objects.get(model=self.room).last_number, 10)
+
+    def test_sequence_starts_after_existing_names(self):
+        DigitalTwinInstance.objects.bulk_create([
+            DigitalTwinInstance(model=self.room, name="Room 2"),
+            DigitalTwinInstance(model=self.room, name="Room 7"),
+        ])
+        self.assertEqual(DigitalTwinInstance.objects.create(model=self.room).name, "Room 8")
+
+    def test_create_materializes_model_elements(self):
+        instance = DigitalTwinInstance.objects.create(model=self.room)
+        self.assertEqual(
+            list(instance.digitaltwininstanceproperty_set.values_list("property__name", flat=True)), ["temperature"]
+        )
+
+    def test_status_save_runs_no_materialization_query(self):
+        DigitalTwinInstance.objects.create(model=self.room)
+        instance = DigitalTwinInstance.objects.get(model=self.room)
+        instance.active = False
+        # Only the UPDATE: no element/property/relationship lookups, no name sequence
+        with self.assertNumQueries(1):
+            instance.save()
+        self.assertFalse(DigitalTwinInstance.objects.get(pk=instance.pk).active)
+        self.assertEqual(instance.digitaltwininstanceproperty_set.count(), 1)
+
+    def test_create_links_model_relationships(self):
+        room = DigitalTwinInstance.objects.create(model=self.room)
+        house = DigitalTwinInstance.objects.create(model=self.house)
+        self.assertTrue(DigitalTwinInstanceRelationship.objects.filter(
+            source_instance=house, target_instance=room, relationship=self.contains
+        ).exists())
+
+    def test_dtmi_matches(self):
+        self.assertTrue(dtmi_matches("dtmi:test:Room", "dtmi:test:Room;1"))
+        self.assertTrue(dtmi_matches("dtmi:test:Room;1", "dtmi:test:Room;1"))
+        self.assertFalse(dtmi_matches("dtmi:test:Room;2", "dtmi:test:Room;1"))
+        self.assertFalse(dtmi_matches("dtmi:test:Room", "dtmi:test:RoomSensor;1"))
+
+
+class BulkInstantiationTests(TestCase):
+    """orchestrator.instantiation.instantiate: rows written for a replicated tree."""
+
+    @classmethod
+    def setUpTestData(cls):
+        system = SystemContext.objects.bulk_create([SystemContext(name="sys", description="")])[0]
+        cls.house, cls.room = DTDLModel.objects.bulk_create([
+            DTDLModel(system=system, dtdl_id="dtmi:test:House;1", name="House", specification={}),
+            DTDLModel(system=system, dtdl_id="dtmi:test:Room;1", name="Room", specification={}),
+        ])
+        ModelElement.objects.bulk_create([
+            ModelElement(dtdl_model=cls.house, element_id="address", element_type="Property", name="address", schema="string"),
+            ModelElement(dtdl_model=cls.room, element_id="temperature", element_type="Property", name="temperature", schema="double"),
+            ModelElement(dtdl_model=cls.room, element_id="humidity", element_type="Property", name="humidity", schema="double"),
+        ])
+        cls.contains = ModelRelationship.objects.create(
+            dtdl_model=cls.house, relationship_id="contains", name="contains",
+            source="dtmi:test:House;1", target="dtmi:test:Room",
+        )
+
+    def _template(self):
+        return {"model": self.house, "name": "House 1", "relationship": None, "children": [
+            {"model": self.room, "name": "Room 1", "relationship": self.contains, "children": []},
+            {"model": self.room, "name": None, "relationship": self.contains, "children": []},
+        ]}
+
+    def test_replicated_tree(self):
+        instances = instantiate(replicate(self._template(), 2), bind_devices=False)
+
+        self.assertEqual(
+            [i.name for i in instances], ["House 1", "Room 1", "Room 2", "House 2", "Room 1", "Room 3"]
+        )
+        for house_index in (0, 3):
+            house = instances[house_index]
+            self.assertEqual((house.hierarchy_path, house.hierarchy_depth), ("", 0))
+            rooms = instances[house_index + 1:house_index + 3]
+            for room in rooms:
+                self.assertEqual((room.hierarchy_path, room.hierarchy_depth), (f"{house.pk}/", 1))
+            self.assertEqual(
+                set(DigitalTwinInstanceRelationship.objects.filter(source_instance=house, relationship=self.contains)
+                    .values_list("target_instance_id", flat=True)),
+                {room.pk for room in rooms},
+            )
+            self.assertEqual([d.pk for d in house.get_descendants().order_by("pk")], [room.pk for room in rooms])
+
+        properties = DigitalTwinInstanceProperty.objects.filter(dtinstance__in=instances)
+        self.assertEqual(properties.count(), 2 * (1 + 2 * 2))
+        self.assertEqual(
+            sorted(properties.filter(dtinstance=instances[2]).values_list("property__name", flat=True)),
+            ["humidity", "temperature"],
+        )
+        self.assertEqual(DigitalTwinInstanceRelationship.objects.filter(target_instance__in=instances).count(), 4)
+
+    def test_automatic_names_continue_after_instantiate(self):
+        instantiate(replicate(self._template(), 1), bind_devices=False)
+        self.assertEqual(DigitalTwinInstance.objects.create(model=self.room).name, "Room 3")
+
+    def test_statement_count_does_not_grow_with_replicas(self):
+        instantiate(replicate(self._template(), 1), bind_devices=False)  # name sequences created
+        with CaptureQueriesContext(connection) as small:
+            instantiate(replicate(self._template(), 2), bind_devices=False)
+        with CaptureQueriesContext(connection) as large:
+            instantiate(replicate(self._template(), 50), bind_devices=False)
+        self.assertEqual(len(large), len(small))
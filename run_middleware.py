@@ -8,24 +8,26 @@ def main():
     # Inicia o listener do gateway
     listener_process = subprocess.Popen([sys.executable, "manage.py", "listen_gateway"])
     
-    # Inicia o verificador de status dos devices
-    status_checker_process = subprocess.Popen([sys.executable, "manage.py", "check_device_status", "--interval", "2"])
+    # Status dos devices: com LIVENESS_ENABLED (padrão) o listen_gateway é o único escritor;
+    # sem ele, o verificador de status consulta o atributo 'active' do ThingsBoard
+    liveness = os.getenv("LIVENESS_ENABLED", "True").strip().lower() in ("1", "true", "yes", "on")
+    status_checker_process = None
+    if not liveness:
+        status_checker_process = subprocess.Popen([sys.executable, "manage.py", "check_device_status", "--interval", "2"])
     
     runserver_process = subprocess.Popen([sys.executable, "manage.py", "runserver", "0.0.0.0:8000",])
     
+    processes = [p for p in (listener_process, status_checker_process, runserver_process) if p is not None]
     try:
         # Aguarda os processos terminarem (que só acontece se houver erro)
-        listener_process.wait()
-        status_checker_process.wait()
-        runserver_process.wait()
+        for process in processes:
+            process.wait()
     except KeyboardInterrupt:
         print("Stopping all processes...")
-        listener_process.terminate()
-        status_checker_process.terminate()
-        runserver_process.terminate()
-        listener_process.wait()
-        status_checker_process.wait()
-        runserver_process.wait()
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file